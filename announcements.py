@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""announcements.py
+
+Udacity conference server-side Python App Engine "nearly sold out"
+    announcement; keeps a small index of the conferences with only a few
+    seats left, updated as registrations cross the threshold, and renders
+    the announcement from it into memcache
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference, NearlySoldOut
+import seats
+import versions
+
+MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+NEARLY_SOLD_OUT_SEATS = 5
+RECONCILE_PAGE_SIZE = 200
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _indexKey():
+    return ndb.Key('NearlySoldOutIndex', 'announcement')
+
+
+def _memberKey(conf_key):
+    return ndb.Key(NearlySoldOut, conf_key.urlsafe(), parent=_indexKey())
+
+
+def isNearlySoldOut(seats_left):
+    return seats_left is not None and 0 < seats_left <= NEARLY_SOLD_OUT_SEATS
+
+
+def _memberConferenceKeys():
+    return [ndb.Key(urlsafe=k.id()) for k in
+            NearlySoldOut.query(ancestor=_indexKey()).fetch(keys_only=True)]
+
+
+def render():
+    """Write the announcement for the current members to memcache (or
+    clear it if there are none) and return it."""
+    confs = [conf for conf in ndb.get_multi(_memberConferenceKeys()) if conf]
+    if confs:
+        # If there are almost sold out conferences,
+        # format announcement and set it in memcache
+        announcement = '%s %s' % (
+            'Last chance to attend! The following conferences '
+            'are nearly sold out:',
+            ', '.join(sorted(conf.name for conf in confs)))
+    else:
+        announcement = ""
+    if (memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "") != announcement:
+        versions.bump(versions.ANNOUNCEMENT, versions.ANNOUNCEMENT_KEY)
+    if announcement:
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    else:
+        # If there are no sold out conferences,
+        # delete the memcache announcements entry
+        memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+    return announcement
+
+
+@ndb.transactional()
+def _setMember(conf_key, member):
+    """Add conf_key to (or remove it from) the index; return True if that
+    changed anything."""
+    key = _memberKey(conf_key)
+    if (key.get() is not None) == member:
+        return False
+    if member:
+        NearlySoldOut(key=key).put()
+    else:
+        key.delete()
+    return True
+
+
+def updateMembership(conf_key, seats_left):
+    """Make conf_key's membership match seats_left, re-rendering the
+    announcement if it changed."""
+    if _setMember(conf_key, isNearlySoldOut(seats_left)):
+        render()
+
+
+def seatsChanged(conf, seats_left, delta):
+    """Registration hook (see seats.reserveSeat): conf's seats moved by
+    delta to seats_left (None if not known).
+
+    The index is only touched when the change crosses the threshold, so
+    most registrations cost nothing here.
+    """
+    if seats_left is None:
+        seats_left = seats.getSeatsAvailable(conf)
+    if isNearlySoldOut(seats_left - delta) != isNearlySoldOut(seats_left):
+        updateMembership(conf.key, seats_left)
+
+# - - - reconciliation - - - - - - - - - - - - - - - - - - - -
+
+def reconcilePage(cursor=None):
+    """Add the nearly sold out conferences of one page of candidates to
+    the index; return the cursor of the next page, or None when done.
+
+    Candidates come from the Conference.seatsAvailable snapshot, so only
+    conferences near the threshold are read; each is confirmed against
+    its seat shards.
+    """
+    candidates, next_cursor, more = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+        Conference.seatsAvailable > 0)
+    ).fetch_page(RECONCILE_PAGE_SIZE, projection=[Conference.seatsAvailable],
+                 start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+    seat_counts = seats.getSeatsAvailableMulti(candidates)
+    keys = [_memberKey(conf.key) for conf in candidates
+            if isNearlySoldOut(seat_counts[conf.key])]
+    members = ndb.get_multi(keys)
+    ndb.put_multi([NearlySoldOut(key=key)
+                   for key, member in zip(keys, members) if member is None])
+    return next_cursor.urlsafe() if more and next_cursor else None
+
+
+def pruneMembers():
+    """Drop members that are gone or no longer nearly sold out, then
+    re-render the announcement."""
+    conf_keys = _memberConferenceKeys()
+    confs = ndb.get_multi(conf_keys)
+    seat_counts = seats.getSeatsAvailableMulti([c for c in confs if c])
+    ndb.delete_multi([_memberKey(key) for key, conf in zip(conf_keys, confs)
+                      if not conf or not isNearlySoldOut(seat_counts[key])])
+    return render()
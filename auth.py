@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+"""auth.py
+
+Udacity conference server-side Python App Engine user id lookups;
+    id_tokens are verified locally against Google's signing certs,
+    tokeninfo responses are cached in-process and in memcache
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import base64
+import binascii
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import endpoints
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from google.appengine.api import memcache
+from google.appengine.api import urlfetch
+
+from settings import WEB_CLIENT_ID
+from settings import ANDROID_CLIENT_ID
+from settings import IOS_CLIENT_ID
+from settings import LOCAL_TOKEN_VERIFICATION
+
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+MEMCACHE_TOKEN_PREFIX = 'TOKENINFO_'
+MEMCACHE_CERTS_KEY = 'GOOGLE_SIGNING_CERTS'
+LOCAL_CACHE_SIZE = 1024
+
+ID_TOKEN_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+ID_TOKEN_AUDIENCES = (WEB_CLIENT_ID, ANDROID_CLIENT_ID, IOS_CLIENT_ID,
+                      endpoints.API_EXPLORER_CLIENT_ID)
+CLOCK_SKEW_SECS = 300
+DEFAULT_CERTS_MAX_AGE = 3600
+MIN_CERTS_REFRESH_SECS = 60
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class LRUCache(object):
+    """LRUCache -- thread-safe, size-bounded cache of expiring values"""
+
+    def __init__(self, size):
+        self._size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                return None
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl):
+        """Cache value under key for ttl seconds, evicting the oldest entry."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + ttl)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheStats(object):
+    """CacheStats -- thread-safe hit/miss counters"""
+
+    def __init__(self, *names):
+        self._counts = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def snapshot(self):
+        """Return a copy of the current counters."""
+        with self._lock:
+            return dict(self._counts)
+
+
+class InvalidTokenError(Exception):
+    """InvalidTokenError -- id_token could not be verified locally"""
+
+
+_token_cache = LRUCache(LOCAL_CACHE_SIZE)
+token_stats = CacheStats('local_hits', 'memcache_hits', 'misses', 'fetches',
+                         'local_verifications', 'cert_fetches')
+
+_certs = {'keys': {}, 'expires_at': 0, 'fetched_at': 0}
+_certs_lock = threading.Lock()
+
+# - - - Signing certificates - - - - - - - - - - - - - - - - -
+
+def _b64decode(segment):
+    """Decode a base64url segment with its padding stripped."""
+    return base64.urlsafe_b64decode(str(segment) + '=' * (-len(segment) % 4))
+
+
+def _parseMaxAge(cache_control):
+    """Return max-age (in seconds) from a Cache-Control header value."""
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    if match:
+        return int(match.group(1))
+    return DEFAULT_CERTS_MAX_AGE
+
+
+def _fetchCerts():
+    """Fetch Google's signing keys; return ({kid: (n, e)}, max_age)."""
+    token_stats.incr('cert_fetches')
+    try:
+        resp = urlfetch.fetch(GOOGLE_CERTS_URL)
+    except urlfetch.Error as e:
+        raise InvalidTokenError('Could not fetch signing certs: %r' % e)
+    if resp.status_code != 200:
+        raise InvalidTokenError('Could not fetch signing certs: %s'
+                                % resp.status_code)
+    keys = {}
+    try:
+        for jwk in json.loads(resp.content)['keys']:
+            keys[jwk['kid']] = (jwk['n'], jwk['e'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidTokenError('Malformed signing certs: %r' % e)
+    return keys, _parseMaxAge(resp.headers.get('Cache-Control'))
+
+
+def _getCerts(refresh=False):
+    """Return signing keys from process memory, memcache or Google.
+
+    Keys are kept for the max-age Google sends with them; refresh=True
+    forces a refetch (rate limited) for a key id we have not seen yet.
+    """
+    now = time.time()
+    with _certs_lock:
+        if refresh:
+            if now - _certs['fetched_at'] < MIN_CERTS_REFRESH_SECS:
+                return _certs['keys']
+        elif _certs['expires_at'] > now:
+            return _certs['keys']
+
+    cached = None if refresh else memcache.get(MEMCACHE_CERTS_KEY)
+    if cached and cached['expires_at'] > now:
+        keys, expires_at, fetched_at = (
+            cached['keys'], cached['expires_at'], cached['fetched_at'])
+    else:
+        keys, max_age = _fetchCerts()
+        expires_at, fetched_at = now + max_age, now
+        memcache.set(MEMCACHE_CERTS_KEY,
+            {'keys': keys, 'expires_at': expires_at, 'fetched_at': now},
+            time=max_age)
+
+    with _certs_lock:
+        _certs.update(keys=keys, expires_at=expires_at, fetched_at=fetched_at)
+    return keys
+
+
+def _publicKey(jwk):
+    """Build an RSA public key from a JWK's (n, e) pair."""
+    n, e = [long(binascii.hexlify(_b64decode(part)), 16) for part in jwk]
+    return RSA.construct((n, e))
+
+
+def verifyIdToken(token, audiences=ID_TOKEN_AUDIENCES):
+    """Verify a Google id_token locally and return its claims.
+
+    Raises InvalidTokenError if the token is not a well-formed RS256 JWT,
+    its signature does not match a Google signing key, or its issuer,
+    audience or expiry are wrong; also if the signing keys cannot be
+    fetched, so callers can fall back to tokeninfo.
+    """
+    try:
+        header_seg, payload_seg, signature_seg = str(token).split('.')
+        header = json.loads(_b64decode(header_seg))
+        payload = json.loads(_b64decode(payload_seg))
+        signature = _b64decode(signature_seg)
+    except (ValueError, TypeError):
+        raise InvalidTokenError('Token is not a JWT')
+    if not isinstance(header, dict) or not isinstance(payload, dict):
+        raise InvalidTokenError('Token is not a JWT')
+
+    if header.get('alg') != 'RS256':
+        raise InvalidTokenError('Unsupported algorithm: %s' % header.get('alg'))
+
+    kid = header.get('kid')
+    jwk = _getCerts().get(kid) or _getCerts(refresh=True).get(kid)
+    if jwk is None:
+        raise InvalidTokenError('Unknown signing key: %s' % kid)
+
+    digest = SHA256.new('%s.%s' % (header_seg, payload_seg))
+    try:
+        verified = PKCS1_v1_5.new(_publicKey(jwk)).verify(digest, signature)
+    except (ValueError, TypeError):
+        raise InvalidTokenError('Malformed signing key: %s' % kid)
+    if not verified:
+        raise InvalidTokenError('Invalid token signature')
+
+    now = time.time()
+    if payload.get('iss') not in ID_TOKEN_ISSUERS:
+        raise InvalidTokenError('Invalid issuer: %s' % payload.get('iss'))
+    if payload.get('aud') not in audiences:
+        raise InvalidTokenError('Invalid audience: %s' % payload.get('aud'))
+    try:
+        exp, iat = int(payload.get('exp', 0)), int(payload.get('iat', 0))
+    except (ValueError, TypeError):
+        raise InvalidTokenError('Invalid exp or iat')
+    if exp < now - CLOCK_SKEW_SECS:
+        raise InvalidTokenError('Token expired')
+    if iat > now + CLOCK_SKEW_SECS:
+        raise InvalidTokenError('Token used before issue time')
+    if not payload.get('sub'):
+        raise InvalidTokenError('Token has no subject')
+    return payload
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _fetchTokenInfo(token, token_type):
+    """Look up token at the tokeninfo endpoint, retrying on failure."""
+    url = TOKENINFO_URL % (token_type, token)
+    user = {}
+    wait = 1
+    for i in range(3):
+        token_stats.incr('fetches')
+        resp = urlfetch.fetch(url)
+        if resp.status_code == 200:
+            user = json.loads(resp.content)
+            break
+        elif resp.status_code == 400 and 'invalid_token' in resp.content:
+            url = TOKENINFO_URL % ('access_token', token)
+        else:
+            time.sleep(wait)
+            wait = wait + i
+    return user
+
+
+def getUserId():
+    """Return the user id for the current bearer token.
+
+    Lookups go to the in-process LRU first. id_tokens are then verified
+    locally when LOCAL_TOKEN_VERIFICATION is on; anything else (access
+    tokens, or id_tokens that fail local checks) goes to memcache, keyed by
+    a hash of the token, and only then to the tokeninfo endpoint. Results
+    are cached for the remaining lifetime of the token.
+    """
+    auth = os.getenv('HTTP_AUTHORIZATION')
+    if not auth:
+        return ''
+    bearer, token = auth.split()
+    token_type = 'id_token'
+    if 'OAUTH_USER_ID' in os.environ:
+        token_type = 'access_token'
+
+    cache_key = MEMCACHE_TOKEN_PREFIX + hashlib.sha256(token).hexdigest()
+    user_id = _token_cache.get(cache_key)
+    if user_id:
+        token_stats.incr('local_hits')
+        return user_id
+
+    if token_type == 'id_token' and LOCAL_TOKEN_VERIFICATION:
+        try:
+            claims = verifyIdToken(token)
+        except InvalidTokenError as e:
+            logging.debug('local id_token verification failed: %s', e)
+        else:
+            token_stats.incr('local_verifications')
+            ttl = int(int(claims.get('exp', 0)) - time.time())
+            if ttl > 0:
+                _token_cache.set(cache_key, claims['sub'], ttl)
+            return claims['sub']
+
+    cached = memcache.get(cache_key)
+    if cached:
+        ttl = int(cached['expires_at'] - time.time())
+        if ttl > 0:
+            token_stats.incr('memcache_hits')
+            _token_cache.set(cache_key, cached['user_id'], ttl)
+            return cached['user_id']
+
+    token_stats.incr('misses')
+    logging.debug('tokeninfo cache miss; stats: %s', token_stats.snapshot())
+    user = _fetchTokenInfo(token, token_type)
+    user_id = user.get('user_id', '')
+    ttl = int(user.get('expires_in', 0))
+    if user_id and ttl > 0:
+        _token_cache.set(cache_key, user_id, ttl)
+        memcache.set(cache_key,
+            {'user_id': user_id, 'expires_at': time.time() + ttl},
+            time=ttl)
+    return user_id
@@ -0,0 +1,6 @@
+"""benchmarks -- local benchmarks run against the App Engine testbed stubs
+
+Run from the repository root with the App Engine SDK installed, e.g.
+
+    GAE_SDK=/path/to/google_appengine python -m benchmarks.registration_contention
+"""
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""bulk_import.py
+
+Importing a conference program: the chunked import pipeline in
+importer.py on a generated fixture (10k sessions by default), against a
+sample of the same sessions sent one at a time through createSession;
+rows per second, RPCs and tasks per row
+
+The chunk and finishing tasks are run inline, one after another, as the
+task queue would chain them.
+
+usage: python -m benchmarks.bulk_import [--sessions N] [--legacy-rows N]
+           [--bad-share F] [--seed N]
+
+$Id$
+
+"""
+
+import argparse
+import datetime
+import json
+import random
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+from benchmarks import generator
+from conference import SESSION_POST_REQUEST, ConferenceApi
+from models import Profile
+import importer
+import tasks
+
+ORGANIZER_ID = 'import-organizer'
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def fixture(sessions, bad_share, seed):
+    """Return a JSON program of one conference and `sessions` sessions,
+    bad_share of them with a malformed date (so they fail validation)."""
+    rng = random.Random(seed)
+    first_day = datetime.date(2016, 9, 1)
+    rows = []
+    for i in range(sessions):
+        day = first_day + datetime.timedelta(days=rng.randint(0, 2))
+        bad = rng.random() < bad_share
+        rows.append({
+            'name': 'Imported session %05d' % i,
+            'highlights': 'Imported',
+            'speakers': ['Speaker %03d' % rng.randint(0, 199)
+                         for _ in range(rng.choice([1, 1, 1, 2]))],
+            'duration': rng.choice([30, 45, 60]),
+            'typeOfSession': rng.choice(generator.SESSION_TYPES),
+            'date': day.strftime('%Y-%m-%d' if bad else '%m/%d/%Y'),
+            'start_time': '%02d:%02d' % (rng.randint(8, 20), rng.choice([0, 30])),
+        })
+    return json.dumps({
+        'conference': {'name': 'Imported conference', 'city': 'London',
+                       'startDate': str(first_day), 'maxAttendees': 1000},
+        'sessions': rows,
+    })
+
+
+def _runPipeline(data):
+    """Import data the way the chained tasks would; return the job."""
+    job = tasks.batching(importer.startJob)(
+        data, 'json', filename='fixture.json', organizer_user_id=ORGANIZER_ID)
+    chunk_id = 1 if job.chunkCount else None
+    while chunk_id is not None:
+        chunk_id = tasks.batching(importer.processChunk)(job.key, chunk_id)
+    return tasks.batching(importer.finishJob)(job.key)
+
+
+def run(sessions, legacy_rows, bad_share, seed):
+    tb = harness.setUpTestbed()
+    try:
+        harness.useFakeTokenInfo()
+        Profile(key=ndb.Key(Profile, ORGANIZER_ID), displayName='Organizer').put()
+        data = fixture(sessions, bad_share, seed)
+        recorder = harness.RpcRecorder().attach()
+
+        recorder.reset()
+        job, elapsed = harness.timeMs(_runPipeline, data)
+        pipeline = {
+            'rows': job.rowsTotal,
+            'imported': job.rowsImported,
+            'row_errors': job.errorCount,
+            'chunks': job.chunkCount,
+            'wall_ms': round(elapsed, 1),
+            'rows_per_s': round(job.rowsTotal / (elapsed / 1000.0), 1),
+            'datastore_rpcs_per_row': recorder.total('datastore_v3') / float(job.rowsTotal),
+            'tasks_rpcs_per_row': recorder.total('taskqueue') / float(job.rowsTotal),
+        }
+
+        # createSession, one request per session, into the same conference
+        api = ConferenceApi()
+        wsck = job.conference.urlsafe()
+        rows = [r for r in json.loads(data)['sessions']
+                if '/' in r['date']][:legacy_rows]
+        recorder.reset()
+        timings = []
+        for i, row in enumerate(rows):
+            harness.signIn(ORGANIZER_ID, 'bench-import-%d' % i)
+            request = SESSION_POST_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck, **row)
+            _, ms = harness.timeMs(api.createSession, request)
+            timings.append(ms)
+        total_ms = sum(timings)
+        legacy = {
+            'rows': len(rows),
+            'wall_ms': round(total_ms, 1),
+            'rows_per_s': round(len(rows) / (total_ms / 1000.0), 1) if total_ms else None,
+            'latency_ms': harness.percentiles(timings),
+            'datastore_rpcs_per_row': recorder.total('datastore_v3') / float(len(rows) or 1),
+            'tasks_rpcs_per_row': recorder.total('taskqueue') / float(len(rows) or 1),
+        }
+        return {
+            'params': {'sessions': sessions, 'legacy_rows': legacy_rows,
+                       'bad_share': bad_share, 'seed': seed},
+            'pipeline': pipeline,
+            'createSession': legacy,
+            'speedup': round(pipeline['rows_per_s'] / legacy['rows_per_s'], 1)
+                       if legacy['rows_per_s'] else None,
+        }
+    finally:
+        tb.deactivate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--legacy-rows', type=int, default=500,
+                        help='sessions sent through createSession for comparison')
+    parser.add_argument('--bad-share', type=float, default=0.01,
+                        help='share of rows that fail validation')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print json.dumps(run(args.sessions, args.legacy_rows, args.bad_share,
+                         args.seed), indent=2)
+
+
+if __name__ == '__main__':
+    main()
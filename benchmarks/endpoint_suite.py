@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""endpoint_suite.py
+
+ConferenceApi methods against a generated data set (see generator.py):
+latency percentiles, datastore RPCs and entities read per call, saved as
+JSON; pass an earlier run as --baseline to see the change per case
+
+Tokens are resolved through a fake tokeninfo urlfetch stub, so every
+signed-in call goes through the real auth path.
+
+usage: python -m benchmarks.endpoint_suite [--profiles N] [--conferences N]
+           [--sessions N] [--iterations N] [--seed N] [--output FILE]
+           [--baseline FILE]
+
+$Id$
+
+"""
+
+import argparse
+import json
+import random
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+from benchmarks import generator
+from conference import CONF_ETAG_GET_REQUEST, FEATURED_SPEAKER_GET_REQUEST
+from conference import CONF_PAGE_GET_REQUEST, PAGE_GET_REQUEST
+from conference import SESSION_ETAG_GET_REQUEST, WISHLIST_INTEREST_GET_REQUEST
+from conference import ConferenceApi
+from models import ConferenceQueryForm, ConferenceQueryForms
+from models import SessionQueryForm, SessionQueryForms
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _cases(api, data, rng):
+    """Return [(name, fn(iteration))]; each fn runs one call."""
+    conferences = data['conferences']
+    profiles = data['profiles']
+    sessions = data['sessions']
+
+    def conf(i):
+        return conferences[i % len(conferences)].urlsafe()
+
+    def signedIn(fn):
+        def call(i):
+            harness.signIn(rng.choice(profiles).id(), 'bench-%d' % i)
+            return fn(i)
+        return call
+
+    def asOrganizer(fn):
+        def call(i):
+            organizer = conferences[i % len(conferences)].parent()
+            harness.signIn(organizer.id(), 'bench-%d' % i)
+            return fn(i)
+        return call
+
+    return [
+        ('queryConferences', lambda i: api.queryConferences(
+            ConferenceQueryForms())),
+        ('queryConferences:city', lambda i: api.queryConferences(
+            ConferenceQueryForms(filters=[ConferenceQueryForm(
+                field='CITY', operator='EQ', value=generator.CITIES[i % len(generator.CITIES)])]))),
+        ('queryConferences:month+maxAttendees', lambda i: api.queryConferences(
+            ConferenceQueryForms(filters=[
+                ConferenceQueryForm(field='MONTH', operator='GT', value='6'),
+                ConferenceQueryForm(field='MAX_ATTENDEES', operator='LT', value='300')]))),
+        ('getConference', lambda i: api.getConference(
+            CONF_ETAG_GET_REQUEST.combined_message_class(websafeConferenceKey=conf(i)))),
+        ('getConferenceSessions', lambda i: api.getConferenceSessions(
+            SESSION_ETAG_GET_REQUEST.combined_message_class(websafeConferenceKey=conf(i)))),
+        ('querySessions:type', lambda i: api.querySessions(
+            SessionQueryForms(filters=[SessionQueryForm(
+                field='TYPEOFSESSION', operator='EQ',
+                value=generator.SESSION_TYPES[i % len(generator.SESSION_TYPES)])]))),
+        ('querySessions:duration+start_time', lambda i: api.querySessions(
+            SessionQueryForms(filters=[
+                SessionQueryForm(field='DURATION', operator='LTEQ', value='45'),
+                SessionQueryForm(field='START_TIME', operator='GTEQ', value='12:00')]))),
+        ('getSessionsInWishList', signedIn(
+            lambda i: api.getSessionsInWishList(
+                PAGE_GET_REQUEST.combined_message_class()))),
+        ('getSessionInterestCount', lambda i: api.getSessionInterestCount(
+            WISHLIST_INTEREST_GET_REQUEST.combined_message_class(
+                websafeSessionKey=sessions[i % len(sessions)].urlsafe()))),
+        ('getConferencesToAttend', signedIn(
+            lambda i: api.getConferencesToAttend(
+                PAGE_GET_REQUEST.combined_message_class()))),
+        ('getConferenceAttendees', asOrganizer(
+            lambda i: api.getConferenceAttendees(
+                CONF_PAGE_GET_REQUEST.combined_message_class(
+                    websafeConferenceKey=conf(i))))),
+        ('getFeaturedSpeaker', lambda i: api.getFeaturedSpeaker(
+            FEATURED_SPEAKER_GET_REQUEST.combined_message_class(websafeConferenceKey=conf(i)))),
+        ('_cacheConferenceFeaturedSpeaker', lambda i:
+            api._cacheConferenceFeaturedSpeaker(conf(i))),
+    ]
+
+
+def _measure(fn, recorder, iterations):
+    timings = []
+    recorder.reset()
+    for i in range(iterations):
+        ndb.get_context().clear_cache()
+        _, elapsed = harness.timeMs(fn, i)
+        timings.append(elapsed)
+    return {
+        'latency_ms': harness.percentiles(timings),
+        'datastore_rpcs_per_call': recorder.total('datastore_v3') / float(iterations),
+        'entities_read_per_call': recorder.entities_read / float(iterations),
+        'rpcs_per_call': recorder.total() / float(iterations),
+    }
+
+
+def run(profiles, conferences, sessions, iterations, seed):
+    tb = harness.setUpTestbed()
+    try:
+        harness.useFakeTokenInfo()
+        data = generator.generate(profiles, conferences, sessions, seed=seed)
+        recorder = harness.RpcRecorder().attach()
+        api = ConferenceApi()
+        rng = random.Random(seed)
+        results = []
+        for name, fn in _cases(api, data, rng):
+            result = _measure(fn, recorder, iterations)
+            result['case'] = name
+            results.append(result)
+        return {
+            'params': {'profiles': profiles, 'conferences': conferences,
+                       'sessions_per_conference': sessions,
+                       'iterations': iterations, 'seed': seed},
+            'results': results,
+        }
+    finally:
+        tb.deactivate()
+
+
+def compare(run_, baseline):
+    """Add p50 latency and RPC ratios against a baseline run's cases."""
+    before = dict((r['case'], r) for r in baseline['results'])
+    for result in run_['results']:
+        old = before.get(result['case'])
+        if not old:
+            continue
+        result['vs_baseline'] = {
+            'p50_ratio': round(result['latency_ms']['p50'] /
+                               old['latency_ms']['p50'], 2)
+                         if old['latency_ms']['p50'] else None,
+            'datastore_rpcs_delta': result['datastore_rpcs_per_call'] -
+                                    old['datastore_rpcs_per_call'],
+            'entities_read_delta': result['entities_read_per_call'] -
+                                   old['entities_read_per_call'],
+        }
+    return run_
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--profiles', type=int, default=200)
+    parser.add_argument('--conferences', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=20,
+                        help='sessions per conference')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results here too')
+    parser.add_argument('--baseline', help='JSON results of an earlier run')
+    args = parser.parse_args()
+
+    results = run(args.profiles, args.conferences, args.sessions,
+                  args.iterations, args.seed)
+    if args.baseline:
+        with open(args.baseline) as f:
+            results = compare(results, json.load(f))
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""generator.py
+
+Deterministic synthetic data for the benchmarks: profiles, conferences
+organized by a few of them, sessions whose speakers follow a long-tail
+distribution, registrations and wish lists skewed towards popular
+sessions; the same seed always gives the same data
+
+$Id$
+
+"""
+
+import datetime
+import random
+
+from google.appengine.ext import ndb
+
+from models import Conference, Profile, Registration, Session, WishlistEntry
+import seats
+import speaker_tally
+
+CITIES = ['London', 'Paris', 'Berlin', 'Tokyo', 'Chicago', 'San Francisco']
+TOPICS = ['Web', 'Cloud', 'Mobile', 'Data', 'Security', 'Programming Languages']
+SESSION_TYPES = ['Talk', 'Workshop', 'Keynote', 'Panel', 'Lightning Talk']
+# share of profiles that organize conferences
+ORGANIZER_SHARE = 0.1
+SPEAKER_POOL_SIZE = 200
+# zipf-like exponent; a few speakers give many of the sessions
+SPEAKER_SKEW = 1.1
+PUT_BATCH_SIZE = 200
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _weighted(rng, items, weights):
+    """Pick one of items with the given relative weights."""
+    point = rng.random() * sum(weights)
+    for item, weight in zip(items, weights):
+        point -= weight
+        if point < 0:
+            return item
+    return items[-1]
+
+
+def _putMulti(entities):
+    for i in range(0, len(entities), PUT_BATCH_SIZE):
+        ndb.put_multi(entities[i:i + PUT_BATCH_SIZE])
+
+
+def generate(profiles, conferences, sessions_per_conference, seed=0,
+             registrations_per_profile=3, wishlist_per_profile=5):
+    """Write the data set; return a dict of the keys written.
+
+    Keys: 'profiles', 'organizers', 'conferences', 'sessions' (lists of
+    ndb.Key) and 'speakers' (speaker names, most prolific first).
+    """
+    rng = random.Random(seed)
+    speakers = ['Speaker %03d' % i for i in range(SPEAKER_POOL_SIZE)]
+    speaker_weights = [1.0 / (i + 1) ** SPEAKER_SKEW for i in range(len(speakers))]
+
+    profile_ents = [Profile(key=ndb.Key(Profile, 'user-%05d' % i),
+                            displayName='User %d' % i,
+                            mainEmail='user%d@example.com' % i,
+                            teeShirtSize='NOT_SPECIFIED')
+                    for i in range(profiles)]
+    organizers = profile_ents[:max(1, int(profiles * ORGANIZER_SHARE))]
+
+    conf_ents = []
+    first_day = datetime.date(2016, 1, 1)
+    for i in range(conferences):
+        org = organizers[i % len(organizers)]
+        start = first_day + datetime.timedelta(days=rng.randint(0, 364))
+        max_attendees = rng.choice([50, 100, 200, 500, 1000])
+        conf_ents.append(Conference(
+            key=ndb.Key(Conference, i + 1, parent=org.key),
+            name='Conference %04d' % i,
+            description='Synthetic conference %d' % i,
+            organizerUserId=org.key.id(),
+            organizerDisplayName=org.displayName,
+            topics=rng.sample(TOPICS, rng.randint(1, 3)),
+            city=rng.choice(CITIES),
+            startDate=start, month=start.month,
+            endDate=start + datetime.timedelta(days=rng.randint(0, 3)),
+            maxAttendees=max_attendees, seatsAvailable=max_attendees))
+    _putMulti(conf_ents)
+    for conf in conf_ents:
+        seats.setSeatsAvailable(conf.key, conf.maxAttendees)
+
+    session_keys = []
+    for conf in conf_ents:
+        first, last = Session.allocate_ids(size=sessions_per_conference or 1,
+                                           parent=conf.key)
+        sessions = []
+        for j, session_id in enumerate(range(first, last + 1)[:sessions_per_conference]):
+            n_speakers = _weighted(rng, [1, 2, 3], [8, 3, 1])
+            names = set()
+            while len(names) < n_speakers:
+                names.add(_weighted(rng, speakers, speaker_weights))
+            sessions.append(Session(
+                key=ndb.Key(Session, session_id, parent=conf.key),
+                name='Session %04d-%03d' % (conf.key.id(), j),
+                highlights='Synthetic session',
+                speakers=sorted(names),
+                duration=rng.choice([30, 45, 60, 90]),
+                typeOfSession=rng.choice(SESSION_TYPES),
+                date=conf.startDate,
+                start_time=datetime.time(rng.randint(8, 20), rng.choice([0, 30])),
+                websafeConferenceKey=conf.key.urlsafe(),
+                organizer_user_id=conf.organizerUserId,
+                organizer_display_name=conf.organizerDisplayName))
+        if sessions:
+            speaker_tally.putSessions(conf.key, sessions)
+        session_keys.extend(s.key for s in sessions)
+
+    # registrations are uniform; wish lists favour the first sessions of
+    # each conference, as attendees tend to pick the same headline talks
+    session_weights = [1.0 / (1 + i % max(sessions_per_conference, 1))
+                       for i in range(len(session_keys))]
+    entries = []
+    for prof in profile_ents:
+        for conf in rng.sample(conf_ents, min(registrations_per_profile, len(conf_ents))):
+            entries.append(Registration(
+                key=ndb.Key(Registration, conf.key.urlsafe(), parent=prof.key),
+                conference=conf.key))
+        wished = set()
+        while session_keys and len(wished) < min(wishlist_per_profile, len(session_keys)):
+            wished.add(_weighted(rng, session_keys, session_weights))
+        entries.extend(WishlistEntry(key=ndb.Key(WishlistEntry, k.urlsafe(), parent=prof.key),
+                                     session=k)
+                       for k in sorted(wished))
+    _putMulti(profile_ents)
+    _putMulti(entries)
+
+    return {
+        'profiles': [p.key for p in profile_ents],
+        'organizers': [p.key for p in organizers],
+        'conferences': [c.key for c in conf_ents],
+        'sessions': session_keys,
+        'speakers': speakers,
+    }
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""harness.py
+
+Shared set-up for the local benchmarks and tests: puts the App Engine SDK
+on sys.path, activates the testbed stubs and summarizes timings
+
+$Id$
+
+"""
+
+import os
+import sys
+import time
+
+DEFAULT_SDK_PATH = '/usr/local/google_appengine'
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fixSysPath():
+    """Make the SDK and the app importable; call before any app import."""
+    sdk_path = os.environ.get('GAE_SDK', DEFAULT_SDK_PATH)
+    if sdk_path not in sys.path:
+        sys.path.insert(0, sdk_path)
+    if ROOT_PATH not in sys.path:
+        sys.path.insert(0, ROOT_PATH)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+
+def setUpTestbed():
+    """Activate datastore, memcache, taskqueue, urlfetch & search stubs.
+
+    The datastore is strongly consistent so runs are repeatable.
+    """
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    tb.init_memcache_stub()
+    tb.init_taskqueue_stub(root_path=ROOT_PATH)
+    tb.init_urlfetch_stub()
+    tb.init_search_stub()
+    ndb.get_context().set_cache_policy(False)
+    return tb
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Return {'p50': ..., ...} for a list of samples (nearest rank)."""
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        if ordered:
+            index = min(len(ordered) - 1,
+                        int(round(point / 100.0 * len(ordered) + 0.5)) - 1)
+            result['p%d' % point] = ordered[max(index, 0)]
+        else:
+            result['p%d' % point] = None
+    return result
+
+
+def timeMs(fn, *args, **kwargs):
+    """Call fn; return (result, elapsed milliseconds)."""
+    start = time.time()
+    result = fn(*args, **kwargs)
+    return result, (time.time() - start) * 1000.0
+
+
+class RpcRecorder(object):
+    """RpcRecorder -- counts API calls (by service.method) made through the
+    active stubs, and the datastore entities they return; attach after
+    setUpTestbed()."""
+
+    def __init__(self):
+        self.reset()
+
+    def attach(self):
+        from google.appengine.api import apiproxy_stub_map
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+            'rpc_recorder', self._record)
+        return self
+
+    def _record(self, service, call, request, response):
+        name = '%s.%s' % (service, call)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if service == 'datastore_v3':
+            if call == 'Get':
+                self.entities_read += sum(
+                    1 for e in response.entity_list() if e.has_entity())
+            elif call in ('RunQuery', 'Next'):
+                self.entities_read += response.result_size()
+
+    def reset(self):
+        self.calls = {}
+        self.entities_read = 0
+
+    def total(self, service=None):
+        """Return the number of calls made, to service if given."""
+        return sum(count for name, count in self.calls.items()
+                   if service is None or name.startswith(service + '.'))
+
+
+def useUrlFetch(respond):
+    """Replace the active urlfetch stub with one answering every fetch
+    with respond(url): (status code, content[, {header: value}]).
+
+    Returns the list the fetched urls are appended to.
+    """
+    from google.appengine.api import apiproxy_stub
+    from google.appengine.api import apiproxy_stub_map
+
+    fetched = []
+
+    class UrlFetchStub(apiproxy_stub.APIProxyStub):
+        def __init__(self):
+            super(UrlFetchStub, self).__init__('urlfetch')
+
+        def _Dynamic_Fetch(self, request, response):
+            fetched.append(request.url())
+            answer = respond(request.url())
+            response.set_statuscode(answer[0])
+            response.set_content(answer[1])
+            for key, value in (answer[2] if len(answer) > 2 else {}).items():
+                header = response.add_header()
+                header.set_key(key)
+                header.set_value(value)
+
+    apiproxy_stub_map.apiproxy.ReplaceStub('urlfetch', UrlFetchStub())
+    return fetched
+
+
+def useFakeTokenInfo():
+    """Replace the active urlfetch stub with one answering tokeninfo
+    lookups for tokens of the form 'token-<user id>' (see signIn), so auth
+    needs no network; return the list of fetched urls."""
+    import json
+    import urllib
+
+    def respond(url):
+        token = urllib.unquote(url.rsplit('=', 1)[-1])
+        return 200, json.dumps({'user_id': token[len('token-'):],
+                                'expires_in': 3600})
+
+    return useUrlFetch(respond)
+
+
+def signIn(user_id, request_id):
+    """Make endpoints see user_id as the caller of a new request."""
+    os.environ.update(
+        ENDPOINTS_AUTH_EMAIL='%s@example.com' % user_id,
+        ENDPOINTS_AUTH_DOMAIN='example.com',
+        HTTP_AUTHORIZATION='Bearer token-%s' % user_id,
+        REQUEST_LOG_ID=str(request_id))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""read_pipelines.py
+
+Read endpoints before and after the ndb tasklet pipelines: the old serial
+get / get_multi chains are replayed next to the current ConferenceApi
+methods, reporting RPCs made and wall time for each
+
+The testbed stubs answer every RPC synchronously, so the wall time gained
+by overlapping RPCs shows up mostly against the real services; the RPC
+counts are comparable either way.
+
+usage: python -m benchmarks.read_pipelines [--conferences N] [--iterations N]
+
+$Id$
+
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+import auth
+from conference import CONF_ETAG_GET_REQUEST, PAGE_GET_REQUEST, ConferenceApi
+from models import Conference, ConferenceForm, Profile, Session, SessionForm
+from models import Registration, WishlistEntry
+from models import ConferenceQueryForms
+import seats
+import serializers
+
+USER_ID = 'bench-user'
+# keeps the old repeated-property registrations & wishlist, which USER_ID's
+# are migrated from
+LEGACY_USER_ID = 'bench-user-legacy'
+TOKEN = 'bench-token'
+
+
+def _setUpUser():
+    """Make endpoints see a signed in user whose id needs no tokeninfo."""
+    os.environ.update(
+        ENDPOINTS_AUTH_EMAIL='bench@example.com',
+        ENDPOINTS_AUTH_DOMAIN='example.com',
+        HTTP_AUTHORIZATION='Bearer %s' % TOKEN,
+        REQUEST_LOG_ID='bench')
+    auth._token_cache.set(
+        auth.MEMCACHE_TOKEN_PREFIX + hashlib.sha256(TOKEN).hexdigest(),
+        USER_ID, 3600)
+
+
+def _populate(conferences):
+    """Write organizers, conferences and sessions; register and wishlist the
+    bench user for all of them. Return the first conference's key."""
+    organizers = [Profile(key=ndb.Key(Profile, 'organizer-%d' % i),
+                          displayName='Organizer %d' % i)
+                  for i in range(conferences)]
+    confs = [Conference(parent=org.key, name='Conference %d' % i,
+                        organizerUserId=org.key.id(),
+                        organizerDisplayName=org.displayName, maxAttendees=100,
+                        seatsAvailable=100)
+             for i, org in enumerate(organizers)]
+    ndb.put_multi(organizers + confs)
+    for conf in confs:
+        seats.setSeatsAvailable(conf.key, 100)
+    sessions = [Session(parent=conf.key, name='Session %d' % i,
+                        date=datetime.date(2016, 5, 1),
+                        organizer_user_id=conf.organizerUserId,
+                        organizer_display_name=conf.organizerDisplayName)
+                for i, conf in enumerate(confs)]
+    ndb.put_multi(sessions)
+    user_key = ndb.Key(Profile, USER_ID)
+    ndb.put_multi([
+        Profile(key=user_key, displayName='Bench'),
+        Profile(key=ndb.Key(Profile, LEGACY_USER_ID), displayName='Bench',
+                conferenceKeysToAttend=[c.key.urlsafe() for c in confs],
+                wishlist_session_keys=[s.key.urlsafe() for s in sessions])] +
+        [Registration(key=ndb.Key(Registration, c.key.urlsafe(), parent=user_key),
+                      conference=c.key)
+         for c in confs] +
+        [WishlistEntry(key=ndb.Key(WishlistEntry, s.key.urlsafe(), parent=user_key),
+                       session=s.key)
+         for s in sessions])
+    return confs[0].key
+
+# - - - serial implementations, as they were - - - - - - - - -
+
+def _legacyGetConference(api, conf_key):
+    conf = conf_key.get()
+    prof = conf.key.parent().get()
+    return serializers.toForm(conf, ConferenceForm,
+                              seatsAvailable=seats.getSeatsAvailable(conf),
+                              organizerDisplayName=getattr(prof, 'displayName'))
+
+
+def _legacyQueryConferences(api):
+    conferences = Conference.query().order(Conference.name).fetch(20)
+    profiles = ndb.get_multi(
+        [ndb.Key(Profile, conf.organizerUserId) for conf in conferences])
+    names = dict((p.key.id(), p.displayName) for p in profiles)
+    seat_counts = seats.getSeatsAvailableMulti(conferences)
+    return [serializers.toForm(conf, ConferenceForm,
+                               seatsAvailable=seat_counts[conf.key],
+                               organizerDisplayName=names[conf.organizerUserId])
+            for conf in conferences]
+
+
+def _legacyGetConferencesToAttend(api):
+    api._getContext()
+    prof = ndb.Key(Profile, LEGACY_USER_ID).get()
+    conferences = ndb.get_multi(
+        [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend])
+    profiles = ndb.get_multi(
+        [ndb.Key(Profile, conf.organizerUserId) for conf in conferences])
+    names = dict((p.key.id(), p.displayName) for p in profiles)
+    seat_counts = seats.getSeatsAvailableMulti(conferences)
+    return [serializers.toForm(conf, ConferenceForm,
+                               seatsAvailable=seat_counts[conf.key],
+                               organizerDisplayName=names[conf.organizerUserId])
+            for conf in conferences]
+
+
+def _legacyGetSessionsInWishList(api):
+    api._getContext()
+    prof = ndb.Key(Profile, LEGACY_USER_ID).get()
+    sessions = ndb.get_multi(
+        [ndb.Key(urlsafe=wssk) for wssk in prof.wishlist_session_keys])
+    profiles = ndb.get_multi(
+        [ndb.Key(Profile, s.organizer_user_id) for s in sessions])
+    return [serializers.toForm(s, SessionForm,
+                               organizer_display_name=p.displayName)
+            for s, p in zip(sessions, profiles)]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _cases(api, conf_key):
+    get_request = CONF_ETAG_GET_REQUEST.combined_message_class(
+        websafeConferenceKey=conf_key.urlsafe())
+    return [
+        ('getConference',
+         lambda: _legacyGetConference(api, conf_key),
+         lambda: api.getConference(get_request)),
+        ('queryConferences',
+         lambda: _legacyQueryConferences(api),
+         lambda: api.queryConferences(ConferenceQueryForms())),
+        ('getConferencesToAttend',
+         lambda: _legacyGetConferencesToAttend(api),
+         lambda: api.getConferencesToAttend(
+             PAGE_GET_REQUEST.combined_message_class())),
+        ('getSessionsInWishList',
+         lambda: _legacyGetSessionsInWishList(api),
+         lambda: api.getSessionsInWishList(
+             PAGE_GET_REQUEST.combined_message_class())),
+    ]
+
+
+def _measure(fn, recorder, iterations):
+    timings = []
+    recorder.reset()
+    for _ in range(iterations):
+        ndb.get_context().clear_cache()
+        _, elapsed = harness.timeMs(fn)
+        timings.append(elapsed)
+    return {
+        'rpcs_per_call': recorder.total() / float(iterations),
+        'latency_ms': harness.percentiles(timings),
+    }
+
+
+def run(conferences, iterations):
+    tb = harness.setUpTestbed()
+    try:
+        _setUpUser()
+        conf_key = _populate(conferences)
+        recorder = harness.RpcRecorder().attach()
+        api = ConferenceApi()
+        results = []
+        for name, legacy, pipelined in _cases(api, conf_key):
+            results.append({
+                'endpoint': name,
+                'serial': _measure(legacy, recorder, iterations),
+                'pipelined': _measure(pipelined, recorder, iterations),
+            })
+        return results
+    finally:
+        tb.deactivate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--conferences', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+    print json.dumps(run(args.conferences, args.iterations), indent=2)
+
+
+if __name__ == '__main__':
+    main()
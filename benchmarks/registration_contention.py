@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""registration_contention.py
+
+Concurrent registrations for one conference against the testbed, comparing
+the old single-Conference seatsAvailable transaction with the sharded seat
+counter in seats.py
+
+usage: python -m benchmarks.registration_contention [--registrants N]
+           [--threads N]
+
+$Id$
+
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.api import datastore_errors
+from google.appengine.ext import ndb
+
+from models import Conference, Profile
+import registrations
+import seats
+
+
+def _getProfile(user_id):
+    p_key = ndb.Key(Profile, user_id)
+    return p_key.get() or Profile(key=p_key, displayName=user_id)
+
+
+def _legacyRegister(conf, user_id, attempts):
+    """Register the way _conferenceRegistration did before seat shards."""
+    @ndb.transactional(xg=True)
+    def txn():
+        attempts.append(1)
+        prof = _getProfile(user_id)
+        conf_now = conf.key.get()
+        if conf_now.seatsAvailable <= 0:
+            raise seats.NoSeatsAvailable()
+        prof.conferenceKeysToAttend.append(conf.key.urlsafe())
+        conf_now.seatsAvailable -= 1
+        ndb.put_multi([prof, conf_now])
+        return prof
+    return txn()
+
+
+def _shardedRegister(conf, user_id, attempts):
+    """Register through the sharded seat counter and Registration entities."""
+    def register():
+        attempts.append(1)
+        return registrations.add(ndb.Key(Profile, user_id), conf.key)
+    return seats.reserveSeat(conf, register)
+
+
+MODES = {
+    'legacy': _legacyRegister,
+    'sharded': _shardedRegister,
+}
+
+
+def run(mode, registrants, threads):
+    """Register `registrants` users from `threads` threads; return stats."""
+    tb = harness.setUpTestbed()
+    try:
+        conf = Conference(parent=ndb.Key(Profile, 'organizer'),
+                          name='Contention', maxAttendees=registrants,
+                          seatsAvailable=registrants)
+        conf.put()
+        if mode == 'sharded':
+            seats.setSeatsAvailable(conf.key, registrants)
+
+        register = MODES[mode]
+        users = iter(range(registrants))
+        users_lock = threading.Lock()
+        latencies, attempts, failures = [], [], []
+
+        def worker():
+            while True:
+                with users_lock:
+                    user = next(users, None)
+                if user is None:
+                    return
+                try:
+                    _, elapsed = harness.timeMs(
+                        register, conf, 'user-%d' % user, attempts)
+                    latencies.append(elapsed)
+                except (datastore_errors.TransactionFailedError,
+                        seats.NoSeatsAvailable) as e:
+                    failures.append(type(e).__name__)
+
+        start = time.time()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        wall = time.time() - start
+
+        return {
+            'mode': mode,
+            'registrants': registrants,
+            'threads': threads,
+            'succeeded': len(latencies),
+            'failed': len(failures),
+            'retries': len(attempts) - len(latencies),
+            'wall_s': round(wall, 3),
+            'latency_ms': harness.percentiles(latencies),
+        }
+    finally:
+        tb.deactivate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--registrants', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+    results = [run(mode, args.registrants, args.threads) for mode in sorted(MODES)]
+    print json.dumps(results, indent=2)
+
+
+if __name__ == '__main__':
+    main()
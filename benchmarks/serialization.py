@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""serialization.py
+
+Entity to form copying: the per-field reflection the _copy*ToForm methods
+did, against the precompiled copy plans in serializers.py, over in-memory
+Conferences, Sessions and Profiles (no datastore calls are timed)
+
+usage: python -m benchmarks.serialization [--entities N] [--repeat N]
+
+$Id$
+
+"""
+
+import argparse
+import datetime
+import json
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+from models import Conference, ConferenceForm, Profile, ProfileForm
+from models import Session, SessionForm, TeeShirtSize
+import serializers
+
+# - - - per-field reflection, as the _copy*ToForm methods did it - - - -
+
+def _reflectConference(conf):
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    cf.seatsAvailable = conf.seatsAvailable
+    cf.check_initialized()
+    return cf
+
+
+def _reflectSession(session):
+    sf = SessionForm()
+    for field in sf.all_fields():
+        if hasattr(session, field.name):
+            if field.name in ('date', 'start_time'):
+                setattr(sf, field.name, str(getattr(session, field.name)))
+            else:
+                setattr(sf, field.name, getattr(session, field.name))
+        elif field.name == "websafeKey":
+            setattr(sf, field.name, session.key.urlsafe())
+    sf.check_initialized()
+    return sf
+
+
+def _reflectProfile(prof):
+    pf = ProfileForm()
+    for field in pf.all_fields():
+        if hasattr(prof, field.name):
+            if field.name == 'teeShirtSize':
+                setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
+            else:
+                setattr(pf, field.name, getattr(prof, field.name))
+    pf.check_initialized()
+    return pf
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _entities(count):
+    """Build count entities of each kind, with keys but not stored."""
+    org = ndb.Key(Profile, 'organizer')
+    day = datetime.date(2016, 5, 1)
+    confs = [Conference(key=ndb.Key(Conference, i + 1, parent=org),
+                        name='Conference %d' % i, description='x' * 200,
+                        organizerUserId='organizer', topics=['Web', 'Cloud'],
+                        city='London', startDate=day, endDate=day, month=5,
+                        maxAttendees=100, seatsAvailable=42,
+                        organizerDisplayName='Organizer')
+             for i in range(count)]
+    sessions = [Session(key=ndb.Key(Session, i + 1, parent=confs[0].key),
+                        name='Session %d' % i, highlights='y' * 100,
+                        speakers=['Ada', 'Grace'], duration=60,
+                        typeOfSession='Talk', date=day,
+                        start_time=datetime.time(10, 0),
+                        websafeConferenceKey=confs[0].key.urlsafe(),
+                        organizer_user_id='organizer',
+                        organizer_display_name='Organizer')
+                for i in range(count)]
+    profiles = [Profile(key=ndb.Key(Profile, 'user-%d' % i),
+                        displayName='User %d' % i, mainEmail='u%d@example.com' % i,
+                        teeShirtSize='M_M',
+                        conferenceKeysToAttend=[confs[0].key.urlsafe()])
+                for i in range(count)]
+    return [
+        ('Conference', confs, _reflectConference,
+         lambda c: serializers.toForm(c, ConferenceForm, seatsAvailable=c.seatsAvailable)),
+        ('Session', sessions, _reflectSession,
+         lambda s: serializers.toForm(s, SessionForm)),
+        ('Profile', profiles, _reflectProfile,
+         lambda p: serializers.toForm(p, ProfileForm)),
+    ]
+
+
+def _timeAll(fn, entities, repeat):
+    """Return the best of repeat runs, in microseconds per entity."""
+    best = None
+    for _ in range(repeat):
+        _, elapsed = harness.timeMs(lambda: [fn(e) for e in entities])
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000.0 / len(entities), 2)
+
+
+def run(count, repeat):
+    tb = harness.setUpTestbed()
+    try:
+        results = []
+        for kind, entities, reflect, planned in _entities(count):
+            reflect_us = _timeAll(reflect, entities, repeat)
+            planned_us = _timeAll(planned, entities, repeat)
+            results.append({
+                'kind': kind,
+                'entities': count,
+                'reflection_us_per_entity': reflect_us,
+                'copy_plan_us_per_entity': planned_us,
+                'speedup': round(reflect_us / planned_us, 2) if planned_us else None,
+            })
+        return results
+    finally:
+        tb.deactivate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--entities', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print json.dumps(run(args.entities, args.repeat), indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,11 +14,10 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
 import ast
-from collections import Counter
 import datetime
-import json
+import hashlib
+import logging
 import os
-import time
 
 import endpoints
 from protorpc import messages
@@ -26,17 +25,34 @@ from protorpc import message_types
 from protorpc import remote
 
 from google.appengine.api import memcache
-from google.appengine.api import taskqueue
-from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 
+import announcements
+import auth
+import instrumentation
+import query_cache
+import query_planner
+import registrations
+import search_index
+import seats
+import serializers
+import speaker_tally
+import summaries
+import tasks
+import versions
+import wishlist
 from models import ConflictException
-from models import Profile, ProfileMiniForm, ProfileForm, ProfileWishListForm
-from models import StringMessage, BooleanMessage
+from models import Profile, ProfileMiniForm, ProfileForm, ProfileForms
+from models import ProfileWishListForm
+from models import StringMessage, BooleanMessage, IntegerMessage
 from models import Conference, ConferenceForm, ConferenceForms, ConferenceFeaturedSpeakerForm
+from models import ConferenceSummaryForm, ConferenceSummaryForms
 from models import ConferenceQueryForm, ConferenceQueryForms
 from models import SessionQueryForm, SessionQueryForms
+from models import SearchForm
 from models import Session, SessionForm, SessionForms
+from models import SessionSummaryForm, SessionSummaryForms
+from models import normalize
 from models import TeeShirtSize
 
 from settings import WEB_CLIENT_ID
@@ -46,7 +62,10 @@ from settings import ANDROID_AUDIENCE
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER_v2_%s"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_SESSIONS_PER_REQUEST = 100
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -98,6 +117,31 @@ CONF_GET_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+# ifNoneMatch: the etag of a copy the client holds (see _notModified)
+CONF_ETAG_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+ETAG_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+)
+
+CONF_PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+    )
+
+PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1),
+    pageToken=messages.StringField(2),
+    )
+
 CONF_POST_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1),
@@ -105,7 +149,17 @@ CONF_POST_REQUEST = endpoints.ResourceContainer(
 
 SESSION_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    websafeConferenceKey=messages.StringField(1)
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+    pageToken=messages.StringField(3)
+    )
+
+SESSION_ETAG_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+    ifNoneMatch=messages.StringField(4),
     )
 
 SESSION_TYPE_GET_REQUEST = endpoints.ResourceContainer(
@@ -125,41 +179,91 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
     )
 
+SESSIONS_POST_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(1),
+    )
+
 WISHLIST_POST_REQUEST = endpoints.ResourceContainer(
     ProfileWishListForm,
     websafeSessionKey=messages.StringField(1)
     )
 
+WISHLIST_INTEREST_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeSessionKey=messages.StringField(1)
+    )
+
 FEATURED_SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    websafeConferenceKey=messages.StringField(1)
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
     )
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+def _pageSize(request):
+    """Return request.pageSize, defaulted and clamped to MAX_PAGE_SIZE."""
+    return min(max(request.pageSize or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+
+
+def _fetchPage(source, request, keys_only=False):
+    """Fetch the page of source (an ndb query or a QueryPlan) described by
+    request.pageSize/pageToken.
+
+    Returns (results, nextPageToken); nextPageToken is None on the last page.
+    """
+    page_size = _pageSize(request)
+    try:
+        if isinstance(source, query_planner.QueryPlan):
+            return source.fetchPage(page_size, request.pageToken, keys_only=keys_only)
+        return query_planner.fetchPage(source, page_size, request.pageToken,
+                                       keys_only=keys_only)
+    except query_planner.InvalidPageToken:
+        raise endpoints.BadRequestException("Invalid 'pageToken'.")
+
+
+def _search(kind, form_class, request):
+    """Run the full-text search described by a SearchForm.
+
+    Forms are built from the search documents alone (no datastore reads),
+    with only request.returnedFields filled in if given. Returns
+    (forms, nextPageToken).
+    """
+    try:
+        hits, next_page_token = search_index.searchDocuments(
+            kind, request.query, _pageSize(request), request.pageToken,
+            request.returnedFields)
+    except search_index.InvalidSearch as e:
+        raise endpoints.BadRequestException('Invalid search: %s' % e)
+    return ([form_class(websafeKey=websafe_key, **values)
+             for websafe_key, values in hits], next_page_token)
+
+
+def _etag(*parts):
+    """Return a (quoted) ETag for a response selected by parts, the first
+    of which is a version from versions.py."""
+    return '"%s"' % hashlib.md5(
+        ':'.join(str(part) for part in parts)).hexdigest()[:20]
+
+
 def _getUserId():
-    """A workaround implementation for getting userid."""
-    auth = os.getenv('HTTP_AUTHORIZATION')
-    bearer, token = auth.split()
-    token_type = 'id_token'
-    if 'OAUTH_USER_ID' in os.environ:
-        token_type = 'access_token'
-    url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-           % (token_type, token))
-    user = {}
-    wait = 1
-    for i in range(3):
-        resp = urlfetch.fetch(url)
-        if resp.status_code == 200:
-            user = json.loads(resp.content)
-            break
-        elif resp.status_code == 400 and 'invalid_token' in resp.content:
-            url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                   % ('access_token', token))
-        else:
-            time.sleep(wait)
-            wait = wait + i
-    return user.get('user_id', '')
+    """Return the user id for the current request's bearer token."""
+    return auth.getUserId()
+
+
+class RequestContext(object):
+    """RequestContext -- user, user id and Profile resolved once per API call"""
+
+    def __init__(self, request_id, user):
+        self.request_id = request_id
+        self.user = user
+        self.user_id = _getUserId() if user else None
+        self.profile = None
+
+    @property
+    def profile_key(self):
+        return ndb.Key(Profile, self.user_id)
 
 
 @endpoints.api(name='conference', version='v1', audiences=[ANDROID_AUDIENCE],
@@ -170,31 +274,53 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+    @ndb.tasklet
+    def _copyConferencesToFormsAsync(self, confs):
+        """Copy confs to ConferenceForms, looking up their seat counts (and
+        any missing organizer names) concurrently."""
+        seats_future = seats.getSeatsAvailableMultiAsync(confs)
+        yield self._fillOrganizerNamesAsync(
+            confs, 'organizerUserId', 'organizerDisplayName')
+        seat_counts = yield seats_future
+        raise ndb.Return([
+            serializers.toForm(conf, ConferenceForm, seatsAvailable=seat_counts[conf.key])
+            for conf in confs])
+
+
+    @staticmethod
+    @ndb.tasklet
+    def _fillOrganizerNamesAsync(entities, userIdField, nameField):
+        """Fill in nameField, in memory only, on entities written before the
+        organizer's displayName was stored on them."""
+        missing = [e for e in entities
+                   if getattr(e, nameField) is None and getattr(e, userIdField)]
+        if missing:
+            profiles = yield ndb.get_multi_async(
+                [ndb.Key(Profile, getattr(e, userIdField)) for e in missing])
+            for entity, prof in zip(missing, profiles):
+                setattr(entity, nameField, getattr(prof, 'displayName', None))
+
+
+    @ndb.tasklet
+    def _conferenceSummariesAsync(self, conf_keys):
+        """Return ConferenceSummaryForms for conf_keys from the cached
+        summaries, with the live seat counts laid over them."""
+        records = yield summaries.getSummariesAsync(conf_keys)
+        seat_counts = yield seats.getSeatsAvailableByKeyAsync(
+            dict((key, record['seatsAvailable']) for key, record in records))
+        forms = []
+        for key, record in records:
+            form = ConferenceSummaryForm(websafeKey=key.urlsafe(), **record)
+            form.seatsAvailable = seat_counts[key]
+            forms.append(form)
+        raise ndb.Return(forms)
 
 
     def _createConferenceObject(self, request):
         """Create or update Conference object, returning ConferenceForm/request."""
         # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = _getUserId()
+        ctx = self._getContext()
+        user_id = ctx.user_id
 
         if not request.name:
             raise endpoints.BadRequestException("Conference 'name' field required")
@@ -202,7 +328,8 @@ class ConferenceApi(remote.Service):
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name) for field in request.all_fields()}
         del data['websafeKey']
-        del data['organizerDisplayName']
+        del data['etag']
+        del data['notModified']
 
         # add default values for those missing (both data model & outbound Message)
         for df in DEFAULTS:
@@ -229,27 +356,43 @@ class ConferenceApi(remote.Service):
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
+        data['organizerDisplayName'] = request.organizerDisplayName = \
+            self._getProfileFromUser().displayName
 
-        # create Conference, send email to organizer confirming
-        # creation of Conference & return (modified) ConferenceForm
+        # create Conference & its seat shards, send email to organizer
+        # confirming creation of Conference & return (modified) ConferenceForm
         Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
+        seats.setSeatsAvailable(c_key, data['seatsAvailable'])
+        if announcements.isNearlySoldOut(data['seatsAvailable']):
+            announcements.updateMembership(c_key, data['seatsAvailable'])
+        query_cache.invalidate()
+        search_index.enqueueIndex([c_key])
+        tasks.add(params={'email': ctx.user.email(),
             'conferenceInfo': repr(request)},
             url='/tasks/send_conference_confirmation_email'
         )
         return request
 
 
-    @ndb.transactional()
     def _updateConferenceObject(self, request):
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = _getUserId()
+        """Update Conference object, returning ConferenceForm."""
+        # resolve user & Profile before the transaction starts
+        prof = self._getProfileFromUser()
+        conf = self._updateConferenceObjectTxn(request, prof)
+        if request.seatsAvailable is not None:
+            seats_left = seats.changeSeatsAvailable(conf, request.seatsAvailable)
+            announcements.updateMembership(conf.key, seats_left)
+        versions.bump(versions.CONFERENCE, request.websafeConferenceKey)
+        query_cache.invalidate()
+        search_index.enqueueIndex([conf.key])
+        summaries.invalidate([conf.key])
+        return serializers.toForm(conf, ConferenceForm,
+                                  seatsAvailable=seats.getSeatsAvailable(conf))
 
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
 
+    @ndb.transactional()
+    def _updateConferenceObjectTxn(self, request, prof):
+        """Copy provided fields onto the Conference inside a transaction."""
         # update existing conference
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
         # check that conference exists
@@ -258,7 +401,7 @@ class ConferenceApi(remote.Service):
                 'No conference found with key: %s' % request.websafeConferenceKey)
 
         # check that user is owner
-        if user_id != conf.organizerUserId:
+        if prof.key.id() != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
@@ -266,7 +409,10 @@ class ConferenceApi(remote.Service):
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
             data = getattr(request, field.name)
-            # only copy fields where we get data
+            # only copy fields where we get data; the organizer's name
+            # always comes from their Profile
+            if field.name in ('organizerDisplayName', 'etag', 'notModified'):
+                continue
             if data not in (None, []):
                 # special handling for dates (convert string to Date)
                 if field.name in ('startDate', 'endDate'):
@@ -275,13 +421,14 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        conf.organizerDisplayName = prof.displayName
         conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        return conf
 
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
+    @tasks.batching
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
@@ -290,24 +437,30 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_POST_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='PUT', name='updateConference')
+    @tasks.batching
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
         return self._updateConferenceObject(request)
 
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @endpoints.method(CONF_ETAG_GET_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
+        etag = _etag(versions.get(
+            versions.CONFERENCE, request.websafeConferenceKey), 'conference')
+        if self._notModified(request, etag):
+            return ConferenceForm(etag=etag, notModified=True)
         # get Conference object from request; bail if not found
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        cf = self._copyConferencesToFormsAsync([conf]).get_result()[0]
+        cf.etag = etag
+        return cf
 
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -316,44 +469,40 @@ class ConferenceApi(remote.Service):
     def getConferencesCreated(self, request):
         """Return conferences created by user."""
         # make sure user is authed
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
+        prof = self._getProfileFromUser()
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, _getUserId()))
-        
-        prof = ndb.Key(Profile, _getUserId()).get()
+        confs = Conference.query(ancestor=prof.key).fetch()
+
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, getattr(prof, 'displayName')) for conf in confs]
+            items=self._copyConferencesToFormsAsync(confs).get_result()
         )
 
 
-    def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+    @endpoints.method(message_types.VoidMessage, ConferenceSummaryForms,
+            path='getConferencesCreatedSummary',
+            http_method='POST', name='getConferencesCreatedSummary')
+    def getConferencesCreatedSummary(self, request):
+        """Return summaries of the conferences created by user."""
+        prof = self._getProfileFromUser()
+        conf_keys = Conference.query(ancestor=prof.key).fetch(keys_only=True)
+        return ConferenceSummaryForms(
+            items=self._conferenceSummariesAsync(conf_keys).get_result())
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
 
-        for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+    def _getQueryPlan(self, request):
+        """Return a QueryPlan for the submitted filters."""
+        plan = query_planner.planQuery(
+            Conference, self._formatFilters(request.filters), Conference.name,
+            request.pageToken)
+        logging.debug('queryConferences plan: %s', plan.describe())
+        return plan
 
 
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
         formatted_filters = []
-        inequality_field = None
 
         for f in filters:
             filtr = {field.name: getattr(f, field.name) for field in f.all_fields()}
@@ -361,21 +510,18 @@ class ConferenceApi(remote.Service):
             try:
                 filtr["field"] = FIELDS[filtr["field"]]
                 filtr["operator"] = OPERATORS[filtr["operator"]]
+                if filtr["field"] in ["month", "maxAttendees"]:
+                    filtr["value"] = int(filtr["value"])
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+            except ValueError:
+                raise endpoints.BadRequestException(
+                    "Filter on '%s' needs a number." % filtr["field"])
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                # check if inequality operation has been used in previous filters
-                # disallow the filter if inequality was performed on a different field before
-                # track the field on which the inequality operation is performed
-                if inequality_field and inequality_field != filtr["field"]:
-                    raise endpoints.BadRequestException("Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
-
+            # inequalities on more than one field are split up by the
+            # query planner rather than rejected
             formatted_filters.append(filtr)
-        return (inequality_field, formatted_filters)
+        return formatted_filters
 
 
     @endpoints.method(ConferenceQueryForms, ConferenceForms,
@@ -383,115 +529,184 @@ class ConferenceApi(remote.Service):
             http_method='POST',
             name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences, one page at a time.
 
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
+        Pages are cached under the current conference generation (see
+        query_cache.py), so repeated filter sets skip the datastore.
+        """
+        cache_key = query_cache.cacheKey(
+            self._formatFilters(request.filters), _pageSize(request),
+            request.pageToken, query_cache.generation())
+        forms = query_cache.getPage(cache_key, ConferenceForms)
+        if forms is not None:
+            return forms
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        conferences, next_page_token = _fetchPage(self._getQueryPlan(request), request)
 
         # return individual ConferenceForm object per Conference
-        return ConferenceForms(
-                items=[self._copyConferenceToForm(conf, names[conf.organizerUserId]) for conf in \
-                conferences]
+        forms = ConferenceForms(
+                items=self._copyConferencesToFormsAsync(conferences).get_result(),
+                nextPageToken=next_page_token
         )
+        query_cache.putPage(cache_key, forms)
+        return forms
+
+
+    @endpoints.method(ConferenceQueryForms, ConferenceSummaryForms,
+            path='queryConferencesSummary',
+            http_method='POST',
+            name='queryConferencesSummary')
+    def queryConferencesSummary(self, request):
+        """Query for conference summaries, one page at a time."""
+        conf_keys, next_page_token = _fetchPage(
+            self._getQueryPlan(request), request, keys_only=True)
+        return ConferenceSummaryForms(
+                items=self._conferenceSummariesAsync(conf_keys).get_result(),
+                nextPageToken=next_page_token
+        )
+
+
+    @endpoints.method(SearchForm, ConferenceForms,
+            path='searchConferences',
+            http_method='POST',
+            name='searchConferences')
+    def searchConferences(self, request):
+        """Full-text search over conference names, descriptions, cities &
+        topics, one page at a time."""
+        items, next_page_token = _search('Conference', ConferenceForm, request)
+        return ConferenceForms(items=items, nextPageToken=next_page_token)
 
 
 # - - - Session objects - - - - - - - - - - - - - - - - - - -
 
-    def _copySessionToForm(self, session, displayName):
-        """Copy relevant fields from Session to SessionForm."""
-        sf = SessionForm()
-        for field in sf.all_fields():
-            if hasattr(session, field.name):
-                # convert DateTime to datetime string; just copy others
-                if field.name in ('date', 'start_time'):
-                    setattr(sf, field.name, str(getattr(session, field.name)))
-                else:
-                    setattr(sf, field.name, getattr(session, field.name))
-            elif field.name == "websafeKey":
-                setattr(sf, field.name, session.key.urlsafe())
-
-        if displayName:
-            setattr(sf, 'organizer_display_name', displayName)
-        sf.check_initialized()
-        return sf
+    def _copySessionsToForms(self, sessions):
+        """Copy sessions to SessionForms, filling in missing organizer names."""
+        self._fillOrganizerNamesAsync(
+            sessions, 'organizer_user_id', 'organizer_display_name').get_result()
+        return serializers.toForms(sessions, SessionForm)
 
 
-    def _createSessionObject(self, request):
-        """Create a Session object, returning a SessionForm request."""
-        user = endpoints.get_current_user()
-        conference = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        user_id = _getUserId()
+    def _getOrganizedConference(self, websafeConferenceKey):
+        """Return (Profile, Conference), checking the user organizes it."""
+        profile = self._getProfileFromUser()
+        conference = ndb.Key(urlsafe=websafeConferenceKey).get()
 
-        if user_id != conference.organizerUserId:
+        if not conference:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % websafeConferenceKey)
+        if profile.key.id() != conference.organizerUserId:
             raise endpoints.UnauthorizedException('Not authorized to add sessions to this conference.')
-        
-        profile = ndb.Key(Profile, _getUserId()).get()
-        
-        if not request.name:
+        return profile, conference
+
+
+    def _sessionDataFromForm(self, form, websafeConferenceKey):
+        """Validate a SessionForm and return its fields as Session kwargs."""
+        if not form.name:
             raise endpoints.BadRequestException("Session 'name' field required")
+        if not form.date:
+            raise endpoints.BadRequestException(
+                "Session '%s' needs a 'date' field" % form.name)
 
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
-        del data['websafeKey']
-        del data['organizer_display_name']
+        data = {field.name: getattr(form, field.name) for field in form.all_fields()
+                if field.name in Session._properties}
+        data['websafeConferenceKey'] = websafeConferenceKey
 
         # add default values for those missing (both data model & outbound Message)
         for df in SESSION_DEFAULTS:
             if data[df] in (None, []):
                 data[df] = SESSION_DEFAULTS[df]
 
-        if data['date']:
+        try:
             data['date'] = datetime.datetime.strptime(data['date'][0:11], "%m/%d/%Y").date()
-        if data['start_time']:    
             data['start_time'] = datetime.datetime.strptime(data['start_time'][0:5], "%H:%M").time()
-        
-        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey).get().key
-        session_id = Session.allocate_ids(size=1, parent=conf_key)[0]
-        session_key = ndb.Key(Session, session_id, parent=conf_key)
-        data['key'] = session_key
-        data['organizer_user_id'] = user_id
-
-        session = Session(**data)
-        session.put()
-        
-        # Update speaker info in memcache
-        taskqueue.add(params={'speakers': repr(data['speakers']),
-            'websafeConferenceKey': data['websafeConferenceKey']},
-            url='/tasks/set_featured_speaker')
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "Session '%s' has an invalid date or start_time" % form.name)
+        return data
+
+
+    def _createSessionObjects(self, websafeConferenceKey, forms):
+        """Create Sessions from SessionForms in one write, returning them.
+
+        Every form is validated before anything is written; ids are
+        allocated in one call and one featured speaker task and one
+        confirmation email cover the whole batch.
+        """
+        profile, conference = self._getOrganizedConference(websafeConferenceKey)
+        datas = [self._sessionDataFromForm(form, websafeConferenceKey) for form in forms]
+
+        conf_key = conference.key
+        first, last = Session.allocate_ids(size=len(datas), parent=conf_key)
+        sessions = []
+        for session_id, data in zip(range(first, last + 1), datas):
+            data['key'] = ndb.Key(Session, session_id, parent=conf_key)
+            data['organizer_user_id'] = profile.key.id()
+            data['organizer_display_name'] = profile.displayName
+            sessions.append(Session(**data))
+
+        # write the sessions together with the conference's speaker tally
+        speaker_tally.putSessions(conf_key, sessions)
+        versions.bump(versions.SESSIONS, websafeConferenceKey)
+        versions.bump(versions.CONFERENCE, websafeConferenceKey)
+
+        # Update speaker info in memcache & the search index
+        tasks.addFeaturedSpeakerTask(websafeConferenceKey)
+        search_index.enqueueIndex([session.key for session in sessions])
 
         # Send email confirmation of session creation
-        taskqueue.add(params={'email': user.email,
-            'sessionInfo': repr(request)},
+        tasks.add(params={'email': self._getContext().user.email(),
+            'sessionCount': len(forms),
+            'sessionInfo': '\r\n\r\n'.join(repr(form) for form in forms)},
             url='/tasks/send_session_confirmation_email'
             )
-        
-        return self._copySessionToForm(session, getattr(profile, 'displayName'))
+        return sessions
+
+
+    def _createSessionObject(self, request):
+        """Create a Session object, returning a SessionForm request."""
+        session, = self._createSessionObjects(request.websafeConferenceKey, [request])
+        return serializers.toForm(session, SessionForm)
 
 
-    @endpoints.method(SESSION_GET_REQUEST, SessionForms,
+    @endpoints.method(SESSION_ETAG_GET_REQUEST, SessionForms,
         path='conference/{websafeConferenceKey}/sessions',
         http_method='GET', name='getConferenceSessions')
     def getConferenceSessions(self, request):
-        """Return sessions for a given conference."""
+        """Return sessions for a given conference, one page at a time."""
+        etag = _etag(versions.get(
+            versions.CONFERENCE, request.websafeConferenceKey), 'sessions',
+            _pageSize(request), request.pageToken)
+        if self._notModified(request, etag):
+            return SessionForms(etag=etag, notModified=True)
         conference = ndb.Key(urlsafe=request.websafeConferenceKey).get()
 
         if not conference:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
         
-        sessions = Session.query(
-            Session.websafeConferenceKey == request.websafeConferenceKey)
+        sessions, next_page_token = _fetchPage(Session.query(
+            Session.websafeConferenceKey == request.websafeConferenceKey), request)
 
         return SessionForms(
-            items=[self._copySessionToForm(session, getattr(conference, 'organizerUserId'))
-                   for session in sessions])
+            items=self._copySessionsToForms(sessions),
+            nextPageToken=next_page_token,
+            etag=etag)
+
+
+    @endpoints.method(SESSION_GET_REQUEST, SessionSummaryForms,
+        path='conference/{websafeConferenceKey}/sessions/summary',
+        http_method='GET', name='getConferenceSessionsSummary')
+    def getConferenceSessionsSummary(self, request):
+        """Return session summaries for a given conference, one page at a time."""
+        session_keys, next_page_token = _fetchPage(Session.query(
+            Session.websafeConferenceKey == request.websafeConferenceKey),
+            request, keys_only=True)
+        records = summaries.getSummariesAsync(session_keys).get_result()
+
+        return SessionSummaryForms(
+            items=[SessionSummaryForm(websafeKey=key.urlsafe(), **record)
+                   for key, record in records],
+            nextPageToken=next_page_token)
 
 
     @endpoints.method(SESSION_TYPE_GET_REQUEST, SessionForms,
@@ -505,13 +720,13 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
 
+        # match regardless of case & spacing
         sessions = Session.query(
-            Session.typeOfSession == request.typeOfSession, 
-            ancestor=conference.key)
+            Session.normalized_type == normalize(request.typeOfSession),
+            ancestor=conference.key).order(Session.name)
 
         return SessionForms(
-            items=[self._copySessionToForm(session, getattr(conference, 'organizerUserId')) 
-                   for session in sessions])
+            items=self._copySessionsToForms(sessions.fetch()))
 
 
     @endpoints.method(SESSION_SPEAKER_GET_REQUEST, SessionForms,
@@ -525,43 +740,53 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
   
+        # match regardless of case & spacing
         sessions = Session.query(
-            Session.speakers.IN([request.speaker]),
-            ancestor=conference.key)
+            Session.normalized_speakers == normalize(request.speaker),
+            ancestor=conference.key).order(Session.name)
 
         return SessionForms(
-            items=[self._copySessionToForm(session, getattr(conference, 'organizerUserId')) 
-                   for session in sessions])
+            items=self._copySessionsToForms(sessions.fetch()))
 
 
     @endpoints.method(SESSION_POST_REQUEST, SessionForm,
         path='conference/{websafeConferenceKey}/sessions',
         http_method='POST', name='createSession')
+    @tasks.batching
     def createSession(self, request):
         """Create a session for a given conference."""
         return self._createSessionObject(request)
 
 
+    @endpoints.method(SESSIONS_POST_REQUEST, SessionForms,
+        path='conference/{websafeConferenceKey}/sessions/batch',
+        http_method='POST', name='createSessions')
+    @tasks.batching
+    def createSessions(self, request):
+        """Create up to MAX_SESSIONS_PER_REQUEST sessions for a conference."""
+        if not request.items:
+            raise endpoints.BadRequestException("No sessions given")
+        if len(request.items) > MAX_SESSIONS_PER_REQUEST:
+            raise endpoints.BadRequestException(
+                "At most %d sessions per request" % MAX_SESSIONS_PER_REQUEST)
+
+        sessions = self._createSessionObjects(
+            request.websafeConferenceKey, request.items)
+        return SessionForms(
+            items=serializers.toForms(sessions, SessionForm))
+
+
     @endpoints.method(SessionQueryForms, SessionForms,
         path='querySessions',
         http_method='POST',
         name='querySessions')
     def querySessions(self, request):
-        """Query for sessions."""
-        sessions = self._getSessionQuery(request)
-
-        # Fetch organizer displayName from profiles
-        organizers = [ndb.Key(Profile, session.organizer_user_id) 
-                      for session in sessions]
-        profiles = ndb.get_multi(organizers)
-
-        display_names = {}
-        for profile in profiles:
-            display_names[profile.key.id()] = profile.displayName
+        """Query for sessions, one page at a time."""
+        sessions, next_page_token = _fetchPage(self._getSessionQueryPlan(request), request)
 
         return SessionForms(
-            items=[self._copySessionToForm(session, display_names[session.organizer_user_id]) 
-                   for session in sessions])
+            items=self._copySessionsToForms(sessions),
+            nextPageToken=next_page_token)
 
 
     @endpoints.method(SessionQueryForms, SessionForms,
@@ -570,63 +795,41 @@ class ConferenceApi(remote.Service):
         name='querySessionsSpecial')
     def querySessionsSpecial(self, request):
         """Return sessions before 7 PM that are not workshops."""
-        session_query = Session.query()
-
-        sessions = []
-
-        seven_pm = datetime.time(19,0)
-        sessions_before_seven_pm = Session.query(Session.start_time <= seven_pm)
-
-        [sessions.append(session) for session in sessions_before_seven_pm 
-         if session.typeOfSession != 'Workshop']
-        
-        # Fetch organizer displayName from profiles
-        organizers = [ndb.Key(Profile, session.organizer_user_id) 
-                      for session in sessions]
-        profiles = ndb.get_multi(organizers)
-
-        display_names = {}
-        for profile in profiles:
-            display_names[profile.key.id()] = profile.displayName
+        plan = query_planner.planQuery(Session, [
+            {'field': 'start_time', 'operator': '<=', 'value': datetime.time(19, 0)},
+            {'field': 'typeOfSession', 'operator': '!=', 'value': 'Workshop'},
+        ], Session.name, request.pageToken)
+        logging.debug('querySessionsSpecial plan: %s', plan.describe())
+        sessions, next_page_token = _fetchPage(plan, request)
 
         return SessionForms(
-            items=[self._copySessionToForm(session, display_names[session.organizer_user_id]) 
-                   for session in sessions])
-
+            items=self._copySessionsToForms(sessions),
+            nextPageToken=next_page_token)
 
-    def _getSessionQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Session.query()
-        
-        inequality_filter, filters = self._formatSessionFilters(request.filters)
 
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Session.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Session.name)
-
-        for filtr in filters:
-            if filtr['field'] == 'duration':
-                filtr['value'] = int(filtr['value'])
-            if filtr['field'] == 'date':
-                filtr['value'] = datetime.datetime.strptime(
-                    filtr['value'][0:11], "%m/%d/%Y")
-            if filtr['field'] == 'start_time':
-                filtr['value'] = datetime.datetime.strptime(
-                    filtr['value'][0:6], "%H:%M")
+    @endpoints.method(SearchForm, SessionForms,
+        path='searchSessions',
+        http_method='POST',
+        name='searchSessions')
+    def searchSessions(self, request):
+        """Full-text search over session names, highlights & speakers, one
+        page at a time."""
+        items, next_page_token = _search('Session', SessionForm, request)
+        return SessionForms(items=items, nextPageToken=next_page_token)
 
-            formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
 
-        return q
+    def _getSessionQueryPlan(self, request):
+        """Return a QueryPlan for the submitted filters."""
+        plan = query_planner.planQuery(
+            Session, self._formatSessionFilters(request.filters), Session.name,
+            request.pageToken)
+        logging.debug('querySessions plan: %s', plan.describe())
+        return plan
 
 
     def _formatSessionFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
         formatted_filters = []
-        inequality_field = None
 
         for f in filters:
             filtr = {field.name: getattr(f, field.name) for field in f.all_fields()}
@@ -634,87 +837,54 @@ class ConferenceApi(remote.Service):
             try:
                 filtr["field"] = SESSION_FIELDS[filtr["field"]]
                 filtr["operator"] = OPERATORS[filtr["operator"]]
+                if filtr['field'] == 'duration':
+                    filtr['value'] = int(filtr['value'])
+                if filtr['field'] == 'date':
+                    filtr['value'] = datetime.datetime.strptime(
+                        filtr['value'][0:11], "%m/%d/%Y").date()
+                if filtr['field'] == 'start_time':
+                    filtr['value'] = datetime.datetime.strptime(
+                        filtr['value'][0:5], "%H:%M").time()
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+            except ValueError:
+                raise endpoints.BadRequestException(
+                    "Filter on '%s' has an invalid value." % filtr["field"])
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                # check if inequality operation has been used in previous filters
-                # disallow the filter if inequality was performed on a different field before
-                # track the field on which the inequality operation is performed
-                if inequality_field and inequality_field != filtr["field"]:
-                    raise endpoints.BadRequestException("Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
-
+            # inequalities on more than one field are split up by the
+            # query planner rather than rejected
             formatted_filters.append(filtr)
 
-        return (inequality_field, formatted_filters)
+        return formatted_filters
 
 
 # - - - Wishlist methods - - - - - - - - - - - - - - - - - - -
 
-    def _create_or_update_wishlist_object(self, request, session, delete=False):
-        """Add a session to a wishlist; create a wishlist if list doesn't exist."""
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = _getUserId()
-
-        # Get logged in user profile
-        profile_key = ndb.Key(Profile, user_id)
-        profile = self._getProfileFromUser()
-       
-        # Get current session key array and add new session to array;
-        # return profile unchanged if session is already present
-        session_keys = profile.wishlist_session_keys
-        s_key = session.key.urlsafe()
-
-        if delete is True:
-            if s_key not in session_keys:
-                raise endpoints.NotFoundException('Session not found')
-
-            session_keys.remove(s_key)
-            setattr(profile, 'wishlist_session_keys', session_keys)
-            profile.put()
-
-            return self._copyProfileToForm(profile)
-
-        if s_key not in session_keys:
-            session_keys.append(s_key)
-            setattr(profile, 'wishlist_session_keys', session_keys)
-            profile.put()
-            
-        return self._copyProfileToForm(profile)
+    def _getWishlistSession(self, websafeSessionKey):
+        """Return the Session for websafeSessionKey or raise NotFound."""
+        session = ndb.Key(urlsafe=websafeSessionKey).get()
+        if not session:
+            raise endpoints.NotFoundException(
+                'No session found with key: %s' % websafeSessionKey)
+        return session
 
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @endpoints.method(PAGE_GET_REQUEST, SessionForms,
         path='wishlist',
         http_method='GET', name='getSessionsInWishlist')
     def getSessionsInWishList(self, request):
-        """Return all sessions a user currently has on their wish list."""
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = _getUserId()
-
+        """Return the sessions on a user's wish list, one page at a time,
+        most recently added first."""
         # Get logged in user profile
-        profile_key = ndb.Key(Profile, user_id)
         profile = self._getProfileFromUser()
 
-        # Create a a list of tuples pairing each session with the profile of
-        # the user who created it.
-        session_keys = [ndb.Key(urlsafe=session) 
-                        for session in profile.wishlist_session_keys]
-        sessions = ndb.get_multi(session_keys)
-        profile_keys = [ndb.Key(Profile, getattr(session, 'organizer_user_id')) 
-                        for session in sessions]
-        profiles = ndb.get_multi(profile_keys)
-
-        paired_session_profile_tuples = zip(sessions, profiles)
+        entry_keys, next_page_token = _fetchPage(
+            wishlist.query(profile.key), request, keys_only=True)
+        sessions = ndb.get_multi([wishlist.sessionKey(k) for k in entry_keys])
 
         return SessionForms(
-            items=[self._copySessionToForm(item[0], item[1].displayName) for item in paired_session_profile_tuples])
+            items=self._copySessionsToForms([s for s in sessions if s]),
+            nextPageToken=next_page_token)
 
 
     @endpoints.method(WISHLIST_POST_REQUEST, ProfileForm,
@@ -722,8 +892,10 @@ class ConferenceApi(remote.Service):
         http_method='POST', name='addSessionToWishlist')
     def addSessionToWishList(self, request):
         """Add a conference session to a user's wishlist."""
-        session = ndb.Key(urlsafe=request.websafeSessionKey).get()
-        return self._create_or_update_wishlist_object(request, session)
+        profile = self._getProfileFromUser()
+        session = self._getWishlistSession(request.websafeSessionKey)
+        wishlist.add(profile.key, session.key)
+        return self._profileForm(profile)
 
 
     @endpoints.method(WISHLIST_POST_REQUEST, ProfileForm,
@@ -733,48 +905,88 @@ class ConferenceApi(remote.Service):
         """Remove a conference session from a user's wishlist
            without deleting session.
         """
-        session = ndb.Key(urlsafe=request.websafeSessionKey).get()
-        return self._create_or_update_wishlist_object(request, session, delete=True)
+        profile = self._getProfileFromUser()
+        session_key = ndb.Key(urlsafe=request.websafeSessionKey)
+        if not wishlist.remove(profile.key, session_key):
+            raise endpoints.NotFoundException('Session not found')
+        return self._profileForm(profile)
+
+
+    @endpoints.method(WISHLIST_INTEREST_GET_REQUEST, IntegerMessage,
+        path='session/{websafeSessionKey}/interest',
+        http_method='GET', name='getSessionInterestCount')
+    def getSessionInterestCount(self, request):
+        """Return how many users have a session on their wishlist."""
+        session = self._getWishlistSession(request.websafeSessionKey)
+        return IntegerMessage(data=wishlist.interestCount(session.key))
+
+
+# - - - Conditional GETs - - - - - - - - - - - - - - - - - - -
+
+    def _notModified(self, request, etag):
+        """Return True if the client already holds the response tagged etag.
+
+        Endpoints cannot answer 304, so revalidation is in-band: the client
+        sends the etag it holds as ifNoneMatch (or in an If-None-Match
+        header, if one reaches the backend) and gets back an empty form
+        with notModified set. Callers build etag from versions.py alone, so
+        that costs one memcache read and no datastore reads.
+        """
+        if_none_match = request.ifNoneMatch
+        if not if_none_match:
+            headers = getattr(getattr(self, 'request_state', None), 'headers', None)
+            if_none_match = headers.get('If-None-Match') if headers else None
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
 
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
-    def _copyProfileToForm(self, prof):
-        """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+    def _getContext(self):
+        """Return this call's RequestContext, resolving the user on first use.
+
+        The context is keyed on the request id and bearer token so a reused
+        service instance never hands one caller's user to another.
+        """
+        request_id = (os.getenv('REQUEST_LOG_ID'), os.getenv('HTTP_AUTHORIZATION'))
+        ctx = getattr(self, '_context', None)
+        if ctx is None or ctx.request_id != request_id:
+            ctx = self._context = RequestContext(
+                request_id, endpoints.get_current_user())
+        # make sure user is authed
+        if not ctx.user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        return ctx
 
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new one if non-existent."""
-        # make sure user is authed
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
+        ctx = self._getContext()
+        if ctx.profile is not None:
+            return ctx.profile
 
         # get Profile from datastore
-        user_id = _getUserId()
-        p_key = ndb.Key(Profile, user_id)
+        p_key = ctx.profile_key
         profile = p_key.get()
+        # move a legacy wishlist into WishlistEntry children on first use
+        if profile and profile.wishlist_session_keys:
+            profile = wishlist.migrate(p_key)
+        # likewise a legacy list of conferences into Registration children
+        if profile and profile.conferenceKeysToAttend:
+            profile = registrations.migrate(p_key)
         # create new Profile if not there
         if not profile:
             profile = Profile(
                 key = p_key,
-                displayName = user.nickname(),
-                mainEmail= user.email(),
+                displayName = ctx.user.nickname(),
+                mainEmail= ctx.user.email(),
                 teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
             )
             profile.put()
 
+        ctx.profile = profile
         return profile      # return Profile
 
 
@@ -785,6 +997,7 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            oldDisplayName = prof.displayName
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -796,8 +1009,24 @@ class ConferenceApi(remote.Service):
                         #    setattr(prof, field, val)
                         prof.put()
 
+            # copy a new name onto the organizer's conferences & sessions
+            if prof.displayName != oldDisplayName:
+                tasks.add(params={'userId': prof.key.id()},
+                    url='/tasks/update_organizer_display_name')
+
         # return ProfileForm
-        return self._copyProfileToForm(prof)
+        return self._profileForm(prof)
+
+
+    def _profileForm(self, prof):
+        """Copy prof to a ProfileForm, listing its registrations and its
+        latest wishlist entries (up to PROFILE_WISHLIST_LIMIT)."""
+        return serializers.toForm(prof, ProfileForm,
+            conferenceKeysToAttend=[
+                k.urlsafe() for k in registrations.conferenceKeys(prof.key)],
+            wishlist_session_keys=[
+                k.urlsafe() for k in wishlist.sessionKeys(
+                    prof.key, limit=wishlist.PROFILE_WISHLIST_LIMIT)])
 
 
     @endpoints.method(message_types.VoidMessage, ProfileForm,
@@ -809,6 +1038,7 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(ProfileMiniForm, ProfileForm,
             path='profile', http_method='POST', name='saveProfile')
+    @tasks.batching
     def saveProfile(self, request):
         """Update & return user profile."""
         return self._doProfile(request)
@@ -816,47 +1046,53 @@ class ConferenceApi(remote.Service):
 
 # - - - Featured Speakers - - - - - - - - - - - - - - - - - - - -
 
-    def _cacheConferenceFeaturedSpeaker(self, websafeConferenceKey):
-        """Determine a conference's featured speaker(s) and store them, and
-           their sessions, in memcache.
-        """
-        conference = ndb.Key(urlsafe=websafeConferenceKey).get()
-        session_speakers = Session.query(ancestor=conference.key).\
-            fetch(projection=[Session.speakers, Session.name])
-        speakers = [session.speakers[0] for session in session_speakers]
-        
-        # Find the speaker(s) with the most session(s)
-        speakers_session_count = Counter(speakers)
-        max_value = speakers_session_count.most_common()[0][1]
+    @staticmethod
+    def _featuredSpeakerString(tally):
+        """Format the featured speaker(s) and their sessions from a tally."""
+        featured_speakers, featured_speaker_sessions = \
+            speaker_tally.featuredSpeakers(tally)
+        if not featured_speakers:
+            return None
+        return "Featured speaker(s): %s. Session(s): %s." % (
+            ", ".join(featured_speakers), ", ".join(featured_speaker_sessions))
 
-        featured_speakers = []
 
-        for speaker in speakers_session_count.most_common():   
-            if speaker[1] < max_value:
-                break
-            featured_speakers.append(speaker[0])
+    def _cacheConferenceFeaturedSpeaker(self, websafeConferenceKey, repair=False):
+        """Determine a conference's featured speaker(s) and store them, and
+           their sessions, on the Conference and in memcache.
+
+           Reads the conference's speaker tally, which session writes keep
+           up to date; the tally is only rebuilt from a full session rescan
+           if it is missing or repair is set. The conference version (and
+           so the ETags) only moves if what was stored changed.
+        """
+        conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+        tally = None if repair else speaker_tally.tallyKey(conf_key).get()
+        if tally is None:
+            tally = speaker_tally.rebuildTally(conf_key)
+        featured_speakers, _ = speaker_tally.featuredSpeakers(tally)
 
-        featured_speaker_sessions = {session.name for session in session_speakers 
-                                     if session.speakers[0] in featured_speakers}
-        
         # Update conference
-        # TODO: refactor into separate taskqueue
-        conference.featured_speakers = featured_speakers
-        conference.put()
-
-        # Construct value to be stored in memcache
-        featured_speaker_str = "Featured speaker(s): "
-        featured_speaker_str += ", ".join(featured_speakers)
-        featured_speaker_str += ". Session(s): "
-        featured_speaker_str += ", ".join(featured_speaker_sessions) + "."
-            
-        add_memcache_key = memcache.add(
-            key=websafeConferenceKey, 
-            value=str(featured_speaker_str))
-        if add_memcache_key is not None:
-            memcache.set(
-                key=websafeConferenceKey, 
-                value=str(featured_speaker_str))
+        conference = conf_key.get()
+        changed = False
+        if conference and featured_speakers and \
+                conference.featured_speakers != featured_speakers:
+            conference.featured_speakers = featured_speakers
+            conference.put()
+            query_cache.invalidate()
+            changed = True
+
+        featured_speaker_str = self._featuredSpeakerString(tally)
+        memcache_key = MEMCACHE_FEATURED_SPEAKER_KEY % websafeConferenceKey
+        if memcache.get(key=memcache_key) != featured_speaker_str:
+            changed = True
+        if featured_speaker_str:
+            memcache.set(key=memcache_key, value=featured_speaker_str)
+        else:
+            memcache.delete(key=memcache_key)
+        if changed:
+            versions.bump(versions.CONFERENCE, websafeConferenceKey)
+        return featured_speaker_str
 
 
     @endpoints.method(FEATURED_SPEAKER_GET_REQUEST, ConferenceFeaturedSpeakerForm,
@@ -869,47 +1105,36 @@ class ConferenceApi(remote.Service):
            Returns a string with the speaker name(s) and the session(s) they 
            are speaking at.
         """
-        cfsf = ConferenceFeaturedSpeakerForm()
-        setattr(cfsf, 'featured_speaker_str', 
-            memcache.get(key=request.websafeConferenceKey)
-        )
-        return cfsf
+        etag = _etag(versions.get(
+            versions.CONFERENCE, request.websafeConferenceKey), 'featured')
+        if self._notModified(request, etag):
+            return ConferenceFeaturedSpeakerForm(etag=etag, notModified=True)
+        memcache_key = MEMCACHE_FEATURED_SPEAKER_KEY % request.websafeConferenceKey
+        featured_speaker_str = memcache.get(key=memcache_key)
+        if featured_speaker_str is None:
+            # not cached; the tally is a single get, no session scan
+            tally = speaker_tally.tallyKey(
+                ndb.Key(urlsafe=request.websafeConferenceKey)).get()
+            featured_speaker_str = self._featuredSpeakerString(tally)
+            if featured_speaker_str:
+                memcache.set(key=memcache_key, value=featured_speaker_str)
+        return ConferenceFeaturedSpeakerForm(
+            featured_speaker_str=featured_speaker_str, etag=etag)
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences '
-                'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
-
-
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @endpoints.method(ETAG_GET_REQUEST, StringMessage,
             path='conference/announcement/get',
             http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        etag = _etag(versions.get(
+            versions.ANNOUNCEMENT, versions.ANNOUNCEMENT_KEY), 'announcement')
+        if self._notModified(request, etag):
+            return StringMessage(data="", etag=etag, notModified=True)
+        return StringMessage(
+            data=memcache.get(announcements.MEMCACHE_ANNOUNCEMENTS_KEY) or "",
+            etag=etag)
 
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
@@ -917,16 +1142,23 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='putAnnouncement')
     def putAnnouncement(self, request):
         """Put Announcement into memcache"""
-        return StringMessage(data=self._cacheAnnouncement())
+        return StringMessage(data=announcements.render())
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
-        """Register or unregister user for selected conference."""
-        retval = None
-        prof = self._getProfileFromUser() # get user Profile
+        """Register or unregister user for selected conference.
+
+        Seats live in the conference's seat shards and registrations in
+        Registration children of the user's Profile; each registration
+        writes one shard and one Registration in a transaction, so
+        concurrent registrations do not contend on the Conference or
+        rewrite the Profile.
+        """
+        # resolve user & Profile before the transaction starts so that
+        # no urlfetch or Profile creation runs while holding it
+        prof = self._getProfileFromUser()
 
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
@@ -936,69 +1168,105 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
 
-        # register
-        if reg:
+        def register():
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if not registrations.add(prof.key, conf.key):
                 raise ConflictException(
                     "You have already registered for this conference")
+            return True
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
+        def unregister():
+            # check if user already registered
+            return registrations.remove(prof.key, conf.key)
 
+        # register
+        if reg:
+            if registrations.isRegistered(prof.key, conf.key):
+                raise ConflictException(
+                    "You have already registered for this conference")
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+            try:
+                retval = seats.reserveSeat(
+                    conf, register, on_change=announcements.seatsChanged)
+            except seats.NoSeatsAvailable:
+                raise ConflictException(
+                    "There are no seats available.")
 
         # unregister
         else:
-            # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            # unregister user, add back one seat
+            retval = seats.releaseSeat(
+                conf, unregister, on_change=announcements.seatsChanged)
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
-                retval = True
-            else:
-                retval = False
+        if retval:
+            versions.bump(versions.CONFERENCE, wsck)
+            query_cache.invalidate()
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
         return BooleanMessage(data=retval)
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(PAGE_GET_REQUEST, ConferenceForms,
             path='conferences/attending',
             http_method='GET', name='getConferencesToAttend')
     def getConferencesToAttend(self, request):
-        """Get list of conferences that user has registered for."""
+        """Get the conferences that user has registered for, one page at a
+        time, most recent registration first."""
         prof = self._getProfileFromUser() # get user Profile
-        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
-        conferences = ndb.get_multi(conf_keys)
-
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        reg_keys, next_page_token = _fetchPage(
+            registrations.query(prof.key), request, keys_only=True)
+        conf_keys = [registrations.conferenceKey(k) for k in reg_keys]
+        conferences = [conf for conf in ndb.get_multi(conf_keys) if conf]
 
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, names[conf.organizerUserId])\
-                   for conf in conferences]
+            items=self._copyConferencesToFormsAsync(conferences).get_result(),
+            nextPageToken=next_page_token
         )
 
 
+    @endpoints.method(message_types.VoidMessage, ConferenceSummaryForms,
+            path='conferences/attending/summary',
+            http_method='GET', name='getConferencesToAttendSummary')
+    def getConferencesToAttendSummary(self, request):
+        """Get summaries of the conferences that user has registered for."""
+        prof = self._getProfileFromUser() # get user Profile
+        conf_keys = registrations.conferenceKeys(prof.key)
+        return ConferenceSummaryForms(
+            items=self._conferenceSummariesAsync(conf_keys).get_result())
+
+
+    @endpoints.method(CONF_PAGE_GET_REQUEST, ProfileForms,
+            path='conference/{websafeConferenceKey}/attendees',
+            http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Return the profiles of a conference's attendees, one page at a
+        time; only the conference's organizer may list them."""
+        prof = self._getProfileFromUser()
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
+        if prof.key.id() != conf.organizerUserId:
+            raise endpoints.UnauthorizedException(
+                'Only the organizer can list attendees of this conference.')
+
+        reg_keys, next_page_token = _fetchPage(
+            registrations.attendeesQuery(conf.key), request, keys_only=True)
+        attendees = [p for p in ndb.get_multi([k.parent() for k in reg_keys]) if p]
+
+        # attendees' own registrations & wishlists are not the organizer's
+        return ProfileForms(
+            items=[serializers.toForm(p, ProfileForm, conferenceKeysToAttend=[],
+                                      wishlist_session_keys=[])
+                   for p in attendees],
+            nextPageToken=next_page_token)
+
+
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
+    @tasks.batching
     def registerForConference(self, request):
         """Register user for selected conference."""
         return self._conferenceRegistration(request)
@@ -1007,9 +1275,11 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='DELETE', name='unregisterFromConference')
+    @tasks.batching
     def unregisterFromConference(self, request):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
 
 
 api = endpoints.api_server([ConferenceApi]) # register API
+api = instrumentation.InstrumentationMiddleware(api)
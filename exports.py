@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""exports.py
+
+Udacity conference server-side Python App Engine schedule exports;
+    renders a conference's sessions as iCalendar or CSV, a batch of
+    Sessions at a time, as a stream of chunks
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import csv
+import datetime
+import StringIO
+
+from models import Session
+
+EXPORT_BATCH_SIZE = 200
+# the largest export kept in memcache (values are limited to 1MB)
+EXPORT_CACHE_MAX_BYTES = 900000
+MEMCACHE_EXPORT_PREFIX = 'EXPORT_'
+ICS_LINE_LENGTH = 75
+CSV_COLUMNS = ('date', 'start_time', 'duration', 'name', 'typeOfSession',
+               'speakers', 'highlights', 'websafeKey')
+
+# format -> (content type, file extension)
+FORMATS = {
+    'ics': ('text/calendar; charset=utf-8', 'ics'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def cacheKey(fmt, conf_key, sessions_version, conference_version):
+    return '%s%s_%s_%d_%d' % (MEMCACHE_EXPORT_PREFIX, fmt, conf_key.urlsafe(),
+                              sessions_version, conference_version)
+
+
+def sessionsInOrder(conf_key):
+    """Iterate over a conference's Sessions by date, start time and name
+    (then key, so the order is stable), EXPORT_BATCH_SIZE at a time."""
+    return Session.query(ancestor=conf_key).order(
+        Session.date, Session.start_time, Session.name, Session.key
+    ).iter(batch_size=EXPORT_BATCH_SIZE)
+
+
+def _utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return '' if value is None else str(value)
+
+# - - - iCalendar - - - - - - - - - - - - - - - - - - - - - - -
+
+def _icsText(value):
+    """Escape a TEXT value (RFC 5545 3.3.11)."""
+    return (_utf8(value).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _icsLine(line):
+    """Fold a content line to ICS_LINE_LENGTH octets and terminate it."""
+    folded = []
+    while len(line) > ICS_LINE_LENGTH:
+        cut = ICS_LINE_LENGTH
+        # never split a UTF-8 sequence
+        while cut > 1 and ord(line[cut]) & 0xC0 == 0x80:
+            cut -= 1
+        folded.append(line[:cut])
+        line = ' ' + line[cut:]
+    folded.append(line)
+    return '\r\n'.join(folded) + '\r\n'
+
+
+def _icsEvent(conf, session, stamp):
+    start = datetime.datetime.combine(
+        session.date, session.start_time or datetime.time())
+    description = session.highlights or ''
+    if session.speakers:
+        description = '%s\n\nSpeakers: %s' % (
+            _utf8(description), _utf8(', '.join(session.speakers)))
+    lines = [
+        'BEGIN:VEVENT',
+        'UID:%s@conference-central' % session.key.urlsafe(),
+        'DTSTAMP:%s' % stamp,
+        'DTSTART:%s' % start.strftime('%Y%m%dT%H%M%S'),
+        'DURATION:PT%dM' % (session.duration or 0),
+        'SUMMARY:%s' % _icsText(session.name),
+        'DESCRIPTION:%s' % _icsText(description),
+        'LOCATION:%s' % _icsText(conf.city),
+        'CATEGORIES:%s' % _icsText(session.typeOfSession),
+        'END:VEVENT',
+    ]
+    return ''.join(_icsLine(line) for line in lines)
+
+
+def renderIcs(conf, sessions, last_modified):
+    """Yield the iCalendar for conf's sessions, one chunk per Session.
+
+    Times are floating (no time zone), as sessions are stored in the
+    conference's local time.
+    """
+    stamp = last_modified.strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(_icsLine(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Conference Central//Schedule//EN',
+        'X-WR-CALNAME:%s' % _icsText(conf.name),
+    ])
+    for session in sessions:
+        yield _icsEvent(conf, session, stamp)
+    yield _icsLine('END:VCALENDAR')
+
+# - - - CSV - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def renderCsv(conf, sessions, last_modified):
+    """Yield the CSV schedule of conf's sessions: a header row, then one
+    chunk per EXPORT_BATCH_SIZE Sessions."""
+    buf = StringIO.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for i, session in enumerate(sessions):
+        writer.writerow([
+            _utf8(session.date), _utf8(session.start_time),
+            _utf8(session.duration), _utf8(session.name),
+            _utf8(session.typeOfSession), _utf8('; '.join(session.speakers)),
+            _utf8(session.highlights), session.key.urlsafe()])
+        if (i + 1) % EXPORT_BATCH_SIZE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+RENDERERS = {
+    'ics': renderIcs,
+    'csv': renderCsv,
+}
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+"""importer.py
+
+Udacity conference server-side Python App Engine bulk program import;
+    loads a conference and its sessions from an uploaded JSON or CSV file
+    in chunked, chained tasks, with per-row errors and one recompute of
+    the derived data (featured speaker, search index) at the end
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import csv
+import datetime
+import json
+import logging
+import StringIO
+
+import endpoints
+from protorpc import messages
+from google.appengine.api import datastore_errors
+from google.appengine.ext import ndb
+
+import announcements
+from conference import ConferenceApi, DEFAULTS
+from models import Conference, ImportChunk, ImportJob, Profile, Session
+from models import SessionForm
+import query_cache
+import search_index
+import seats
+import speaker_tally
+import tasks
+import versions
+
+IMPORT_CHUNK_SIZE = 200
+IMPORT_MAX_REPORTED_ERRORS = 100
+IMPORT_INDEX_BATCH_SIZE = 200
+SESSION_COLUMNS = ('name', 'highlights', 'speakers', 'duration',
+                   'typeOfSession', 'date', 'start_time')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class InvalidImport(Exception):
+    """InvalidImport -- the upload as a whole cannot be imported"""
+
+
+def parseFile(data, fmt):
+    """Return (conference fields or None, session rows) from an upload.
+
+    JSON is {"conference": {...}, "sessions": [{...}, ...]}, the
+    conference being optional; CSV has one session per row, headed by
+    SESSION_COLUMNS, with speakers separated by ';'. Session fields take
+    the same values as createSession (date as MM/DD/YYYY, start_time as
+    HH:MM).
+    """
+    if fmt == 'json':
+        try:
+            program = json.loads(data)
+        except ValueError as e:
+            raise InvalidImport('Invalid JSON: %s' % e)
+        if not isinstance(program, dict) or \
+                not isinstance(program.get('sessions', []), list):
+            raise InvalidImport('Expected an object with a "sessions" list')
+        return program.get('conference'), program.get('sessions', [])
+    if fmt == 'csv':
+        reader = csv.DictReader(StringIO.StringIO(data))
+        rows = []
+        for row in reader:
+            try:
+                row = dict((k, v.decode('utf-8')) for k, v in row.items()
+                           if k and v is not None)
+            except UnicodeDecodeError:
+                raise InvalidImport('CSV row %d is not UTF-8' % (len(rows) + 1))
+            row['speakers'] = [s.strip() for s in row.get('speakers', '').split(';')
+                               if s.strip()]
+            rows.append(row)
+        return None, rows
+    raise InvalidImport('Unknown format: %s' % fmt)
+
+
+def _createConference(fields, organizer_user_id):
+    """Write the Conference an import brings along; no emails are sent."""
+    prof = ndb.Key(Profile, organizer_user_id).get() if organizer_user_id else None
+    if not prof:
+        raise InvalidImport('No profile for organizerUserId %r' % organizer_user_id)
+    if not fields.get('name'):
+        raise InvalidImport("Conference 'name' field required")
+
+    data = dict(DEFAULTS)
+    data.update((k, v) for k, v in fields.items()
+                if k in Conference._properties and v not in (None, []))
+    try:
+        for name in ('startDate', 'endDate'):
+            if data.get(name):
+                data[name] = datetime.datetime.strptime(
+                    data[name][:10], "%Y-%m-%d").date()
+        data['maxAttendees'] = int(data['maxAttendees'])
+    except (TypeError, ValueError):
+        raise InvalidImport(
+            "Conference dates must be YYYY-MM-DD and 'maxAttendees' a number")
+    data['month'] = data['startDate'].month if data.get('startDate') else 0
+    data['seatsAvailable'] = data['maxAttendees']
+    data['organizerUserId'] = prof.key.id()
+    data['organizerDisplayName'] = prof.displayName
+
+    c_id = Conference.allocate_ids(size=1, parent=prof.key)[0]
+    conf = Conference(key=ndb.Key(Conference, c_id, parent=prof.key), **data)
+    conf.put()
+    seats.setSeatsAvailable(conf.key, data['seatsAvailable'])
+    if announcements.isNearlySoldOut(data['seatsAvailable']):
+        announcements.updateMembership(conf.key, data['seatsAvailable'])
+    query_cache.invalidate()
+    search_index.enqueueIndex([conf.key])
+    return conf
+
+
+def startJob(data, fmt, filename=None, websafeConferenceKey=None,
+             organizer_user_id=None):
+    """Store an upload as an ImportJob and its chunks and start the first
+    chunk task; return the job.
+
+    Sessions go to the conference in the file (created for
+    organizer_user_id) or else to websafeConferenceKey.
+    """
+    conf_fields, rows = parseFile(data, fmt)
+    if conf_fields is not None and not isinstance(conf_fields, dict):
+        raise InvalidImport('Expected "conference" to be an object')
+    if conf_fields:
+        conf_key = _createConference(conf_fields, organizer_user_id).key
+    elif websafeConferenceKey:
+        conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+        if conf_key.kind() != 'Conference' or not conf_key.get():
+            raise InvalidImport(
+                'No conference found with key: %s' % websafeConferenceKey)
+    else:
+        raise InvalidImport('Give a conference in the file or a websafeConferenceKey')
+
+    job_key = ndb.Key(ImportJob, ImportJob.allocate_ids(size=1)[0])
+    chunks = [ImportChunk(key=ndb.Key(ImportChunk, i // IMPORT_CHUNK_SIZE + 1,
+                                      parent=job_key),
+                          firstRow=i + 1, rows=rows[i:i + IMPORT_CHUNK_SIZE])
+              for i in range(0, len(rows), IMPORT_CHUNK_SIZE)]
+    job = ImportJob(key=job_key, filename=filename, conference=conf_key,
+                    chunkCount=len(chunks), rowsTotal=len(rows), errors=[])
+    ndb.put_multi([job] + chunks)
+    enqueueChunk(job_key, 1 if chunks else None)
+    return job
+
+
+def enqueueChunk(job_key, chunk_id):
+    """Chain the task for one chunk, or the finishing task if chunk_id is
+    None; named, so a retried task does not enqueue its successor twice."""
+    if chunk_id is None:
+        tasks.add('/tasks/import_finish', params={'jobKey': job_key.urlsafe()},
+                  name='import-%d-finish' % job_key.id())
+    else:
+        tasks.add('/tasks/import_chunk',
+                  params={'jobKey': job_key.urlsafe(), 'chunk': chunk_id},
+                  name='import-%d-%d' % (job_key.id(), chunk_id))
+
+# - - - chunks - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _rowForm(row):
+    """Return the SessionForm for one row of the file."""
+    if not isinstance(row, dict):
+        raise ValueError('Expected an object')
+    speakers = row.get('speakers') or []
+    if not isinstance(speakers, list):
+        speakers = [speakers]
+    duration = row.get('duration')
+    return SessionForm(
+        name=row.get('name') or None,
+        highlights=row.get('highlights') or None,
+        speakers=[unicode(s) for s in speakers],
+        duration=int(duration) if duration not in (None, '') else None,
+        typeOfSession=row.get('typeOfSession') or None,
+        date=row.get('date') or None,
+        start_time=row.get('start_time') or None)
+
+
+@ndb.transactional(xg=True)
+def _commitChunk(job_key, chunk_key, sessions, errors):
+    """Write a chunk's sessions and speaker tally and record the chunk as
+    done, all or nothing; a chunk already done is left alone."""
+    job, chunk = ndb.get_multi([job_key, chunk_key])
+    if chunk.done:
+        return job
+    ndb.put_multi(sessions)
+    if sessions:
+        speaker_tally.updateTally(job.conference, added=sessions)
+    chunk.done = True
+    chunk.rows = None
+    job.status = 'running'
+    job.chunksDone += 1
+    job.rowsImported += len(sessions)
+    job.errorCount += len(errors)
+    job.errors = (job.errors + errors)[:IMPORT_MAX_REPORTED_ERRORS]
+    ndb.put_multi([job, chunk])
+    return job
+
+
+def processChunk(job_key, chunk_id):
+    """Import one chunk; return the id of the next chunk, or None after the
+    last one. Safe to run again for a chunk that is already done."""
+    job, chunk = ndb.get_multi([job_key, ndb.Key(ImportChunk, chunk_id, parent=job_key)])
+    if not job or not chunk:
+        logging.warning('Import %s: no chunk %s', job_key.id(), chunk_id)
+        return None
+    if not chunk.done:
+        conf = job.conference.get()
+        wsck = conf.key.urlsafe()
+        api = ConferenceApi()
+        sessions, errors = [], []
+        for i, row in enumerate(chunk.rows):
+            try:
+                data = api._sessionDataFromForm(_rowForm(row), wsck)
+                data['organizer_user_id'] = conf.organizerUserId
+                data['organizer_display_name'] = conf.organizerDisplayName
+                session = Session(**data)
+                # what the put would otherwise raise inside _commitChunk,
+                # failing (and retrying) the whole chunk
+                session._check_initialized()
+                sessions.append(session)
+            except (endpoints.BadRequestException, messages.ValidationError,
+                    datastore_errors.BadValueError, TypeError, ValueError) as e:
+                # unicode: messages quote the row's (unicode) values
+                errors.append({'row': chunk.firstRow + i, 'error': unicode(e)})
+
+        if sessions:
+            first, last = Session.allocate_ids(size=len(sessions), parent=conf.key)
+            for session_id, session in zip(range(first, last + 1), sessions):
+                session.key = ndb.Key(Session, session_id, parent=conf.key)
+        job = _commitChunk(job_key, chunk.key, sessions, errors)
+        logging.info('Import %s: chunk %d/%d, %d sessions, %d row errors',
+                     job_key.id(), chunk_id, job.chunkCount, len(sessions), len(errors))
+    return chunk_id + 1 if chunk_id < job.chunkCount else None
+
+
+def finishJob(job_key):
+    """Recompute what the per-session writes would have: the featured
+    speaker, the search documents and the cached schedule exports."""
+    job = job_key.get()
+    if not job or job.status == 'done':
+        return job
+    conf_key = job.conference
+    wsck = conf_key.urlsafe()
+    tasks.addFeaturedSpeakerTask(wsck)
+    versions.bump(versions.SESSIONS, wsck)
+    versions.bump(versions.CONFERENCE, wsck)
+    cursor, more = None, True
+    while more:
+        keys, cursor, more = Session.query(ancestor=conf_key).fetch_page(
+            IMPORT_INDEX_BATCH_SIZE, keys_only=True, start_cursor=cursor)
+        search_index.enqueueIndex(keys)
+
+    job.status = 'done'
+    job.put()
+    logging.info('Import %s done: %d of %d rows imported, %d errors',
+                 job_key.id(), job.rowsImported, job.rowsTotal, job.errorCount)
+    return job
+
+
+def jobStatus(job):
+    """Return a job's progress as a dict, for the status handler."""
+    return {
+        'jobKey': job.key.urlsafe(),
+        'status': job.status,
+        'filename': job.filename,
+        'websafeConferenceKey': job.conference.urlsafe(),
+        'chunks': job.chunkCount,
+        'chunksDone': job.chunksDone,
+        'rowsTotal': job.rowsTotal,
+        'rowsImported': job.rowsImported,
+        'errorCount': job.errorCount,
+        'errors': job.errors or [],
+    }
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""instrumentation.py
+
+Udacity conference server-side Python App Engine RPC instrumentation;
+    counts and times every API call (datastore, memcache, urlfetch,
+    taskqueue, ...) made while handling a sampled request and logs one
+    structured line per request
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+
+import auth
+import query_cache
+from settings import INSTRUMENTATION_SAMPLE_RATE
+from settings import INSTRUMENTATION_HEADER
+
+STATS_HEADER = 'X-Conference-RPC-Stats'
+SPI_PREFIX = '/_ah/spi/'
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = []
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class RequestStats(object):
+    """RequestStats -- RPC counts and times of one request, by
+    service.method"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.rpcs = {}
+        self._pending = {}
+
+    def started(self, rpc):
+        self._pending[id(rpc)] = time.time()
+
+    def finished(self, service, call, rpc):
+        start = self._pending.pop(id(rpc), None)
+        elapsed = (time.time() - start) * 1000.0 if start else 0.0
+        entry = self.rpcs.setdefault('%s.%s' % (service, call), [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def summary(self):
+        """Return the stats as a dict for the log line."""
+        return {
+            'request': self.name,
+            'wall_ms': round((time.time() - self.start) * 1000.0, 1),
+            'rpc_count': sum(count for count, _ in self.rpcs.values()),
+            'rpcs': dict((name, {'count': count, 'ms': round(ms, 1)})
+                         for name, (count, ms) in self.rpcs.items()),
+            'auth_cache': auth.token_stats.snapshot(),
+            'query_cache': query_cache.statsSnapshot(),
+        }
+
+    def header(self):
+        """Return the stats compactly, for the response header."""
+        return ';'.join('%s=%d/%dms' % (name, count, ms)
+                        for name, (count, ms) in sorted(self.rpcs.items()))
+
+
+def _current():
+    return getattr(_local, 'stats', None)
+
+
+def _preCall(service, call, request, response, rpc):
+    stats = _current()
+    if stats is not None:
+        stats.started(rpc)
+
+
+def _postCall(service, call, request, response, rpc, error):
+    stats = _current()
+    if stats is not None:
+        stats.finished(service, call, rpc)
+
+
+def install():
+    """Hook the API proxy, once per process."""
+    with _install_lock:
+        proxy = apiproxy_stub_map.apiproxy
+        if proxy in _installed:
+            return
+        proxy.GetPreCallHooks().Append('instrumentation', _preCall)
+        proxy.GetPostCallHooks().Append('instrumentation', _postCall)
+        _installed.append(proxy)
+
+
+def _requestName(environ):
+    """Name a request after its endpoint method or handler path."""
+    path = environ.get('PATH_INFO', '')
+    if path.startswith(SPI_PREFIX):
+        return path[len(SPI_PREFIX):]
+    return path
+
+
+class InstrumentationMiddleware(object):
+    """InstrumentationMiddleware -- WSGI wrapper recording the RPCs of a
+    sample (INSTRUMENTATION_SAMPLE_RATE) of the requests it serves"""
+
+    def __init__(self, app, sample_rate=None):
+        self.app = app
+        self.sample_rate = (INSTRUMENTATION_SAMPLE_RATE if sample_rate is None
+                            else sample_rate)
+        install()
+
+    def __call__(self, environ, start_response):
+        if random.random() >= self.sample_rate:
+            return self.app(environ, start_response)
+
+        stats = _local.stats = RequestStats(_requestName(environ))
+
+        def instrumentedStartResponse(status, headers, exc_info=None):
+            if INSTRUMENTATION_HEADER:
+                headers.append((STATS_HEADER, stats.header()))
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.app(environ, instrumentedStartResponse)
+        finally:
+            _local.stats = None
+            summary = stats.summary()
+            task = environ.get('HTTP_X_APPENGINE_TASKNAME')
+            if task:
+                summary['task'] = task
+            logging.info('rpc_stats %s', json.dumps(summary, sort_keys=True))
@@ -12,19 +12,70 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import json
+import logging
+import time
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
 from google.appengine.api import memcache
+from google.appengine.ext import ndb
 
 from conference import ConferenceApi
-from models import Session
+import announcements
+import exports
+import importer
+import instrumentation
+from models import Conference, Profile, Session
+import query_cache
+import registrations
+import search_index
+import seats
+import summaries
+import tasks
+import versions
+import wishlist
+
+FEATURED_SPEAKER_REFRESH_PAGE_SIZE = 500
+FEATURED_SPEAKER_REFRESH_BATCH_SIZE = 50
+MEMCACHE_FEATURED_SPEAKER_REFRESH_KEY = 'FEATURED_SPEAKER_REFRESH_%s'
+ORGANIZER_NAME_BATCH_SIZE = 100
+NORMALIZE_SESSIONS_BATCH_SIZE = 200
+REINDEX_BATCH_SIZE = 200
+MIGRATE_PROFILES_BATCH_SIZE = 100
+
+# kind -> (model, denormalized organizer name field, kind updated next)
+ORGANIZER_NAME_KINDS = {
+    'Conference': (Conference, 'organizerDisplayName', 'Session'),
+    'Session': (Session, 'organizer_display_name', None),
+}
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
-        """Set Announcement in Memcache."""
-        ConferenceApi._cacheAnnouncement()
+        """Start reconciling the nearly sold out index (and so the
+        announcement in memcache) with the seat counts."""
+        tasks.add('/tasks/reconcile_announcement')
+        self.response.set_status(204)
+
+
+class ReconcileAnnouncementHandler(webapp2.RequestHandler):
+    @tasks.batching
+    def post(self):
+        """Reconcile one page of candidate conferences and chain the next;
+        the last page prunes stale members and re-renders the announcement.
+
+        Registrations keep the index up to date as they cross the
+        threshold; this pass repairs anything missed, e.g. a crossing seen
+        while the seat count was not in memcache.
+        """
+        next_cursor = announcements.reconcilePage(self.request.get('cursor'))
+        if next_cursor:
+            tasks.add('/tasks/reconcile_announcement',
+                params={'cursor': next_cursor})
+        else:
+            announcements.pruneMembers()
         self.response.set_status(204)
 
 
@@ -44,15 +95,20 @@ class SendConferenceConfirmationEmailHandler(webapp2.RequestHandler):
 
 class SendSessionConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Session creation."""
+        """Send email confirming Session creation (one or a batch)."""
+        count = int(self.request.get('sessionCount') or 1)
+        if count == 1:
+            subject, what = 'You created a new Session!', 'session'
+        else:
+            subject, what = 'You created %d new Sessions!' % count, 'sessions'
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
             self.request.get('email'),                  # to
-            'You created a new Session!',            # subj
+            subject,                                    # subj
             'Hi, you have created the following '         # body
-            'session\r\n\r\n%s' % self.request.get(
-                'sessionInfo')
+            '%s\r\n\r\n%s' % (what, self.request.get(
+                'sessionInfo'))
         )
 
 
@@ -66,25 +122,394 @@ class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
         self.response.set_status(204)        
 
 
+class SyncSeatsAvailableHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy a conference's seat shard total onto the Conference."""
+        seats.syncSeatsAvailable(self.request.get('websafeConferenceKey'))
+        self.response.set_status(204)
+
+
 class RefreshFeaturedSpeakerCacheHandler(webapp2.RequestHandler):
     def get(self):
-        """Periodically refresh featured speaker info in memcache."""
-        
-        # Start with a fresh cache
-        memcache.flush_all()
+        """Periodically refresh featured speaker info in memcache.
 
-        # Iterate through all sessions, updating featured speaker cache
-        conf_api = ConferenceApi()        
-        conf_api._cacheConferenceFeaturedSpeaker(
-            self.request.get('websafeConferenceKey')
-        )
-        self.response.set_status(204) 
+        Starts a run that pages through every Conference; see
+        RefreshFeaturedSpeakerPageHandler.
+        """
+        run_id = str(int(time.time()))
+        tasks.add('/tasks/refresh_featured_speakers_page',
+            params={'run': run_id, 'page': 0},
+            name='featured-refresh-%s-0' % run_id)
+        self.response.set_status(204)
+
+
+class RefreshFeaturedSpeakerPageHandler(webapp2.RequestHandler):
+    @tasks.batching
+    def post(self):
+        """Fan one page of Conference keys out into batch refresh tasks.
+
+        Each page enqueues the next one with its cursor; task names are
+        derived from the run and page, so a retried page resumes without
+        enqueueing duplicate batches.
+        """
+        run_id = self.request.get('run')
+        page = int(self.request.get('page'))
+        cursor = self.request.get('cursor')
+        keys, next_cursor, more = Conference.query().fetch_page(
+            FEATURED_SPEAKER_REFRESH_PAGE_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+
+        size = FEATURED_SPEAKER_REFRESH_BATCH_SIZE
+        for batch, start in enumerate(range(0, len(keys), size)):
+            tasks.add('/tasks/refresh_featured_speakers_batch',
+                params={'run': run_id, 'websafeConferenceKeys':
+                    ','.join(key.urlsafe() for key in keys[start:start + size])},
+                name='featured-refresh-%s-%d-%d' % (run_id, page, batch))
+
+        if more and next_cursor:
+            tasks.add('/tasks/refresh_featured_speakers_page',
+                params={'run': run_id, 'page': page + 1,
+                        'cursor': next_cursor.urlsafe()},
+                name='featured-refresh-%s-%d' % (run_id, page + 1))
+        else:
+            logging.info('Featured speaker refresh %s: %d conferences enqueued',
+                         run_id, page * FEATURED_SPEAKER_REFRESH_PAGE_SIZE + len(keys))
+        self.response.set_status(204)
+
+
+class RefreshFeaturedSpeakerBatchHandler(webapp2.RequestHandler):
+    def post(self):
+        """Recompute the featured speaker of a batch of conferences."""
+        run_id = self.request.get('run')
+        conf_api = ConferenceApi()
+        wscks = [k for k in self.request.get('websafeConferenceKeys').split(',') if k]
+        for wsck in wscks:
+            conf_api._cacheConferenceFeaturedSpeaker(wsck, repair=True)
+
+        refreshed = memcache.incr(
+            MEMCACHE_FEATURED_SPEAKER_REFRESH_KEY % run_id, len(wscks),
+            initial_value=0)
+        logging.info('Featured speaker refresh %s: %d conferences refreshed '
+                     '(%s so far)', run_id, len(wscks), refreshed)
+        self.response.set_status(204)
+
+
+@ndb.transactional()
+def _setOrganizerDisplayName(keys, field, displayName):
+    """Write displayName onto the entities at keys that do not have it yet.
+
+    All of an organizer's Conferences and Sessions are in their Profile's
+    entity group, so one transaction covers the batch.
+    """
+    stale = [e for e in ndb.get_multi(keys)
+             if e is not None and getattr(e, field) != displayName]
+    for entity in stale:
+        setattr(entity, field, displayName)
+    ndb.put_multi(stale)
+    return len(stale)
+
+
+class UpdateOrganizerDisplayNameHandler(webapp2.RequestHandler):
+    @tasks.batching
+    def post(self):
+        """Copy an organizer's displayName onto their Conferences & Sessions.
+
+        Each task updates one batch of an ancestor query on the Profile and
+        enqueues the next batch with its cursor; Sessions follow once the
+        Conferences are done. The name is re-read for every batch, so a
+        later rename overtaking this run still wins.
+        """
+        user_id = self.request.get('userId')
+        kind = self.request.get('kind') or 'Conference'
+        cursor = self.request.get('cursor')
+        p_key = ndb.Key(Profile, user_id)
+        prof = p_key.get()
+        if not prof:
+            self.response.set_status(204)
+            return
+
+        model, field, next_kind = ORGANIZER_NAME_KINDS[kind]
+        keys, next_cursor, more = model.query(ancestor=p_key).fetch_page(
+            ORGANIZER_NAME_BATCH_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        updated = _setOrganizerDisplayName(keys, field, prof.displayName)
+        logging.info('Organizer %s: %d of %d %s entities renamed',
+                     user_id, updated, len(keys), kind)
+        if updated:
+            search_index.enqueueIndex(keys)
+            summaries.invalidate(keys)
+            for wsck in set((k if kind == 'Conference' else k.parent()).urlsafe()
+                            for k in keys):
+                versions.bump(versions.CONFERENCE, wsck)
+            if kind == 'Conference':
+                query_cache.invalidate()
+
+        if more and next_cursor:
+            tasks.add(params={'userId': user_id, 'kind': kind,
+                              'cursor': next_cursor.urlsafe()},
+                url='/tasks/update_organizer_display_name')
+        elif next_kind:
+            tasks.add(params={'userId': user_id, 'kind': next_kind},
+                url='/tasks/update_organizer_display_name')
+        self.response.set_status(204)
+
+
+class NormalizeSessionsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start (or, given a logged cursor, resume) the backfill of the
+        normalized speaker & type fields on existing Sessions."""
+        tasks.add('/tasks/normalize_sessions',
+            params={'cursor': self.request.get('cursor')})
+        self.response.set_status(202)
+
+    @tasks.batching
+    def post(self):
+        """Rewrite one batch of Sessions so their ComputedProperties are
+        stored, then chain the next batch with its cursor."""
+        cursor = self.request.get('cursor')
+        sessions, next_cursor, more = Session.query().fetch_page(
+            NORMALIZE_SESSIONS_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        ndb.put_multi(sessions)
+
+        if more and next_cursor:
+            logging.info('Normalized %d sessions; next cursor %s',
+                         len(sessions), next_cursor.urlsafe())
+            tasks.add('/tasks/normalize_sessions',
+                params={'cursor': next_cursor.urlsafe()})
+        else:
+            logging.info('Normalized %d sessions; backfill done', len(sessions))
+        self.response.set_status(204)
+
+
+class IndexDocumentsHandler(webapp2.RequestHandler):
+    def post(self):
+        """(Re)index a batch of Conferences or Sessions for search."""
+        keys = [ndb.Key(urlsafe=k)
+                for k in self.request.get('websafeKeys').split(',') if k]
+        search_index.indexEntities(self.request.get('kind'), keys)
+        self.response.set_status(204)
+
+
+class ReindexSearchHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start (or, given a logged cursor, resume) reindexing every
+        Conference or Session; kind defaults to both."""
+        kinds = [self.request.get('kind')] if self.request.get('kind') \
+            else sorted(search_index.INDEXES)
+        for kind in kinds:
+            tasks.add('/tasks/reindex_search',
+                params={'kind': kind, 'cursor': self.request.get('cursor')})
+        self.response.set_status(202)
+
+    @tasks.batching
+    def post(self):
+        """Index one batch of a kind, then chain the next with its cursor."""
+        kind = self.request.get('kind')
+        cursor = self.request.get('cursor')
+        model = {'Conference': Conference, 'Session': Session}[kind]
+        keys, next_cursor, more = model.query().fetch_page(
+            REINDEX_BATCH_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        search_index.indexEntities(kind, keys)
+
+        if more and next_cursor:
+            logging.info('Reindexed %d %s entities; next cursor %s',
+                         len(keys), kind, next_cursor.urlsafe())
+            tasks.add('/tasks/reindex_search',
+                params={'kind': kind, 'cursor': next_cursor.urlsafe()})
+        else:
+            logging.info('Reindexed %d %s entities; reindex done', len(keys), kind)
+        self.response.set_status(204)
+
+
+class ProfileMigrationHandler(webapp2.RequestHandler):
+    """Moves a legacy repeated property off every Profile in chained
+    batches; subclasses name the task url, the property and the module
+    whose migrateAsync moves it."""
+    url = None
+    field = None
+    migration = None
+
+    def get(self):
+        """Start (or, given a logged cursor, resume) the migration."""
+        tasks.add(self.url, params={'cursor': self.request.get('cursor')})
+        self.response.set_status(202)
+
+    @tasks.batching
+    def post(self):
+        """Migrate one batch of Profiles, then chain the next with its
+        cursor; profiles already migrated (lazily, on use) are skipped."""
+        cursor = self.request.get('cursor')
+        profiles, next_cursor, more = Profile.query().fetch_page(
+            MIGRATE_PROFILES_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=cursor) if cursor else None)
+        pending = [p.key for p in profiles if getattr(p, self.field)]
+        futures = [self.migration.migrateAsync(k) for k in pending]
+        for future in futures:
+            future.get_result()
+
+        if more and next_cursor:
+            logging.info('Migrated %s of %d of %d profiles; next cursor %s',
+                         self.field, len(pending), len(profiles),
+                         next_cursor.urlsafe())
+            tasks.add(self.url, params={'cursor': next_cursor.urlsafe()})
+        else:
+            logging.info('Migrated %s of %d of %d profiles; migration done',
+                         self.field, len(pending), len(profiles))
+        self.response.set_status(204)
+
+
+class MigrateWishlistsHandler(ProfileMigrationHandler):
+    url = '/tasks/migrate_wishlists'
+    field = 'wishlist_session_keys'
+    migration = wishlist
+
+
+class MigrateRegistrationsHandler(ProfileMigrationHandler):
+    url = '/tasks/migrate_registrations'
+    field = 'conferenceKeysToAttend'
+    migration = registrations
+
+
+class ExportScheduleHandler(webapp2.RequestHandler):
+    def get(self, websafeConferenceKey, fmt):
+        """Send a conference's session schedule as .ics or .csv.
+
+        The export is rendered a batch of Sessions at a time and cached
+        under the conference's 'sessions' and 'conference' versions, which
+        every session write and every write to the Conference itself
+        (whose name and city are in the export) bump; the versions are
+        also the ETag and Last-Modified, so a conditional GET is answered
+        from memcache alone.
+        """
+        try:
+            conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+        except Exception:
+            self.abort(404)
+        if conf_key.kind() != 'Conference':
+            self.abort(404)
+        sessions_version = versions.get(versions.SESSIONS, websafeConferenceKey)
+        conference_version = versions.get(versions.CONFERENCE, websafeConferenceKey)
+        last_modified = versions.lastModified(max(sessions_version, conference_version))
+        content_type, extension = exports.FORMATS[fmt]
+        self.response.etag = '%s-%d-%d' % (fmt, sessions_version, conference_version)
+        self.response.last_modified = last_modified
+        self.response.cache_control = 'no-cache'
+
+        if self.request.if_none_match:
+            not_modified = self.response.etag in self.request.if_none_match
+        else:
+            since = self.request.if_modified_since
+            not_modified = since is not None and \
+                since.replace(tzinfo=None) >= last_modified
+        if not_modified:
+            self.response.set_status(304)
+            return
+
+        self.response.content_type = content_type
+        self.response.headers['Content-Disposition'] = \
+            'attachment; filename="schedule.%s"' % extension
+        cache_key = exports.cacheKey(fmt, conf_key, sessions_version, conference_version)
+        cached = memcache.get(cache_key)
+        if cached is not None:
+            self.response.write(cached)
+            return
+
+        conf = conf_key.get()
+        if not conf:
+            self.abort(404)
+        size = 0
+        for chunk in exports.RENDERERS[fmt](
+                conf, exports.sessionsInOrder(conf_key), last_modified):
+            self.response.write(chunk)
+            size += len(chunk)
+        if size <= exports.EXPORT_CACHE_MAX_BYTES:
+            memcache.set(cache_key, self.response.body)
+
+
+class ImportUploadHandler(webapp2.RequestHandler):
+    @tasks.batching
+    def post(self):
+        """Start importing an uploaded program file (admin only).
+
+        Takes a multipart 'file' (.json or .csv, or say which in 'format')
+        and either 'organizerUserId', for a file that brings its own
+        conference, or the 'websafeConferenceKey' to add sessions to.
+        Answers 202 with the job's status; poll /admin/import/<jobKey>.
+        """
+        upload = self.request.POST.get('file')
+        if upload is None or not hasattr(upload, 'file'):
+            self.abort(400, detail="A 'file' upload is required")
+        fmt = self.request.get('format') or \
+            upload.filename.rsplit('.', 1)[-1].lower()
+        try:
+            job = importer.startJob(upload.file.read(), fmt,
+                filename=upload.filename,
+                websafeConferenceKey=self.request.get('websafeConferenceKey'),
+                organizer_user_id=self.request.get('organizerUserId'))
+        except importer.InvalidImport as e:
+            self.abort(400, detail=unicode(e))
+        self.response.set_status(202)
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(importer.jobStatus(job)))
+
+
+class ImportStatusHandler(webapp2.RequestHandler):
+    def get(self, jobKey):
+        """Report an import's progress and row errors (admin only)."""
+        try:
+            job_key = ndb.Key(urlsafe=jobKey)
+        except Exception:
+            self.abort(404)
+        if job_key.kind() != 'ImportJob':
+            self.abort(404)
+        job = job_key.get()
+        if not job:
+            self.abort(404)
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(importer.jobStatus(job)))
+
+
+class ImportChunkHandler(webapp2.RequestHandler):
+    @tasks.batching
+    def post(self):
+        """Import one chunk of a job, then chain the next chunk (or the
+        finishing task); a retried chunk is not written twice."""
+        job_key = ndb.Key(urlsafe=self.request.get('jobKey'))
+        next_chunk = importer.processChunk(job_key, int(self.request.get('chunk')))
+        importer.enqueueChunk(job_key, next_chunk)
+        self.response.set_status(204)
+
+
+class ImportFinishHandler(webapp2.RequestHandler):
+    @tasks.batching
+    def post(self):
+        """Run the one post-import recompute of an import job."""
+        importer.finishJob(ndb.Key(urlsafe=self.request.get('jobKey')))
+        self.response.set_status(204)
 
 
 app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/tasks/reconcile_announcement', ReconcileAnnouncementHandler),
     ('/crons/refresh_featured_speaker_cache', RefreshFeaturedSpeakerCacheHandler),
+    ('/tasks/refresh_featured_speakers_page', RefreshFeaturedSpeakerPageHandler),
+    ('/tasks/refresh_featured_speakers_batch', RefreshFeaturedSpeakerBatchHandler),
     ('/tasks/send_conference_confirmation_email', SendConferenceConfirmationEmailHandler),
     ('/tasks/send_session_confirmation_email', SendSessionConfirmationEmailHandler),
-    ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler)
+    ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
+    ('/tasks/sync_seats_available', SyncSeatsAvailableHandler),
+    ('/tasks/update_organizer_display_name', UpdateOrganizerDisplayNameHandler),
+    ('/tasks/normalize_sessions', NormalizeSessionsHandler),
+    ('/tasks/index_documents', IndexDocumentsHandler),
+    ('/tasks/reindex_search', ReindexSearchHandler),
+    ('/tasks/migrate_wishlists', MigrateWishlistsHandler),
+    ('/tasks/migrate_registrations', MigrateRegistrationsHandler),
+    (r'/export/conference/([^/]+)/schedule\.(ics|csv)', ExportScheduleHandler),
+    ('/admin/import', ImportUploadHandler),
+    ('/admin/import/([^/]+)', ImportStatusHandler),
+    ('/tasks/import_chunk', ImportChunkHandler),
+    ('/tasks/import_finish', ImportFinishHandler)
 ], debug=True)
+app = instrumentation.InstrumentationMiddleware(app)
@@ -26,9 +26,29 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
+    # legacy; moved to Registration children on first use (see registrations.py)
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
+    # legacy; moved to WishlistEntry children on first use (see wishlist.py)
     wishlist_session_keys = ndb.StringProperty(repeated=True)
 
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- one Session on a user's wishlist
+
+    A child of the user's Profile, with the Session's websafe key as its id,
+    so adding or removing a session writes just this entity.
+    """
+    session = ndb.KeyProperty(kind='Session')
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+class Registration(ndb.Model):
+    """Registration -- a user's registration for one Conference
+
+    A child of the user's Profile, with the Conference's websafe key as its
+    id; attendees of a conference are found through the conference property.
+    """
+    conference = ndb.KeyProperty(kind='Conference')
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName = messages.StringField(1)
@@ -42,6 +62,11 @@ class ProfileForm(messages.Message):
     conferenceKeysToAttend = messages.StringField(4, repeated=True)
     wishlist_session_keys = messages.StringField(5, repeated=True)
 
+class ProfileForms(messages.Message):
+    """ProfileForms -- multiple Profile outbound form message"""
+    items = messages.MessageField(ProfileForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
 class ProfileWishListForm(messages.Message):
     """ProfileWishlistForm -- add session to wishlist form message"""
     websafeSessionKey = messages.StringField(1)
@@ -49,17 +74,24 @@ class ProfileWishListForm(messages.Message):
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     data = messages.StringField(1, required=True)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
 
 class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
 
+class IntegerMessage(messages.Message):
+    """IntegerMessage-- outbound (single) integer message"""
+    data = messages.IntegerField(1)
+
 
 class Conference(ndb.Model):
     """Conference -- Conference object"""
     name            = ndb.StringProperty(required=True)
     description     = ndb.StringProperty()
     organizerUserId = ndb.StringProperty()
+    organizerDisplayName = ndb.StringProperty(indexed=False)
     topics          = ndb.StringProperty(repeated=True)
     city            = ndb.StringProperty()
     startDate       = ndb.DateProperty()
@@ -70,6 +102,20 @@ class Conference(ndb.Model):
     featured_speakers = ndb.StringProperty(repeated=True)
 
 
+class SeatShard(ndb.Model):
+    """SeatShard -- one shard of a Conference's available seats"""
+    conference      = ndb.KeyProperty(kind=Conference)
+    seatsAvailable  = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class NearlySoldOut(ndb.Model):
+    """NearlySoldOut -- a Conference with only a few seats left
+
+    Members of the nearly sold out announcement, keyed by the Conference's
+    websafe key, all under one parent so the set reads consistently.
+    """
+
+
 class ConferenceForm(messages.Message):
     """ConferenceForm -- Conference outbound form message"""
     name            = messages.StringField(1)
@@ -85,16 +131,49 @@ class ConferenceForm(messages.Message):
     featured_speakers = messages.StringField(11, repeated=True)
     websafeKey      = messages.StringField(12)
     organizerDisplayName = messages.StringField(13)
+    etag            = messages.StringField(14)
+    notModified     = messages.BooleanField(15)
 
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class ConferenceSummaryForm(messages.Message):
+    """ConferenceSummaryForm -- Conference list outbound form message"""
+    websafeKey      = messages.StringField(1)
+    name            = messages.StringField(2)
+    city            = messages.StringField(3)
+    startDate       = messages.StringField(4) # DateTimeField()
+    endDate         = messages.StringField(5) # DateTimeField()
+    topics          = messages.StringField(6, repeated=True)
+    maxAttendees    = messages.IntegerField(7)
+    seatsAvailable  = messages.IntegerField(8)
+    organizerDisplayName = messages.StringField(9)
+
+
+class ConferenceSummaryForms(messages.Message):
+    """ConferenceSummaryForms -- multiple ConferenceSummaryForm outbound form message"""
+    items = messages.MessageField(ConferenceSummaryForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
 
 
 class ConferenceFeaturedSpeakerForm(messages.Message):
     """ConferenceFeaturedSpeakerForm - return featured_speakers"""
     featured_speaker_str = messages.StringField(1)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
+
+
+def normalize(value):
+    """Lowercase value and collapse its whitespace, for case-insensitive
+    lookups."""
+    if not value:
+        return value
+    return u' '.join(value.split()).lower()
+
 
 class Session(ndb.Model):
     """Session - Session object"""
@@ -107,6 +186,48 @@ class Session(ndb.Model):
     start_time = ndb.TimeProperty()
     websafeConferenceKey = ndb.StringProperty()
     organizer_user_id = ndb.StringProperty()
+    organizer_display_name = ndb.StringProperty(indexed=False)
+    normalized_speakers = ndb.ComputedProperty(
+        lambda self: [normalize(s) for s in self.speakers], repeated=True)
+    normalized_type = ndb.ComputedProperty(
+        lambda self: normalize(self.typeOfSession))
+
+
+class SpeakerTally(ndb.Model):
+    """SpeakerTally -- per-conference map of speaker to their sessions
+
+    sessions is {speaker: {session id: session name}}; the entity is a
+    child of its Conference so it can be written in the same transaction
+    as the conference's Sessions.
+    """
+    sessions = ndb.JsonProperty()
+
+
+class ImportJob(ndb.Model):
+    """ImportJob -- a bulk import of a conference program and its progress
+
+    errors holds the first row errors as [{'row': n, 'error': message}];
+    errorCount counts them all.
+    """
+    status = ndb.StringProperty(default='pending')
+    filename = ndb.StringProperty(indexed=False)
+    conference = ndb.KeyProperty(kind='Conference')
+    chunkCount = ndb.IntegerProperty(default=0, indexed=False)
+    chunksDone = ndb.IntegerProperty(default=0, indexed=False)
+    rowsTotal = ndb.IntegerProperty(default=0, indexed=False)
+    rowsImported = ndb.IntegerProperty(default=0, indexed=False)
+    errorCount = ndb.IntegerProperty(default=0, indexed=False)
+    errors = ndb.JsonProperty()
+    created = ndb.DateTimeProperty(auto_now_add=True)
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+class ImportChunk(ndb.Model):
+    """ImportChunk -- one chunk of an ImportJob's rows, a child of the job;
+    rows are dropped once the chunk is written"""
+    firstRow = ndb.IntegerProperty(indexed=False)
+    rows = ndb.JsonProperty(compressed=True)
+    done = ndb.BooleanProperty(default=False, indexed=False)
 
 
 class SessionForm(messages.Message):
@@ -126,6 +247,26 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """Session Forms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
+
+
+class SessionSummaryForm(messages.Message):
+    """SessionSummaryForm - Session list outbound form message"""
+    websafeKey = messages.StringField(1)
+    name = messages.StringField(2)
+    speakers = messages.StringField(3, repeated=True)
+    typeOfSession = messages.StringField(4)
+    date = messages.StringField(5)  # DateField()
+    start_time = messages.StringField(6)  # TimeField()
+    duration = messages.IntegerField(7)
+
+
+class SessionSummaryForms(messages.Message):
+    """SessionSummaryForms -- multiple SessionSummaryForm outbound form message"""
+    items = messages.MessageField(SessionSummaryForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
 
 
 class TeeShirtSize(messages.Enum):
@@ -155,6 +296,8 @@ class ConferenceQueryForm(messages.Message):
 class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
 
 
 class SessionQueryForm(messages.Message):
@@ -166,4 +309,14 @@ class SessionQueryForm(messages.Message):
 class SessionQueryForms(messages.Message):
     """SessionQueryForms -- multiple SessionQueryForm inbound form message"""
     filters = messages.MessageField(SessionQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
+
+
+class SearchForm(messages.Message):
+    """SearchForm -- full-text search inbound form message"""
+    query = messages.StringField(1, required=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
+    returnedFields = messages.StringField(4, repeated=True)
 
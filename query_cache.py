@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""query_cache.py
+
+Udacity conference server-side Python App Engine query result cache;
+    keeps queryConferences result pages in memcache, keyed by the
+    canonical filter set and page and tagged with a global conference
+    generation, so one bump drops every cached page
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import hashlib
+import json
+
+from google.appengine.api import memcache
+from protorpc import protojson
+
+from auth import CacheStats
+import versions
+
+MEMCACHE_QUERY_PREFIX = 'QUERY_CONFERENCES_'
+QUERY_CACHE_TIME = 3600
+# the largest page kept in memcache (values are limited to 1MB)
+QUERY_CACHE_MAX_BYTES = 900000
+
+stats = CacheStats('hits', 'misses')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def generation():
+    """Return the current conference generation."""
+    return versions.get(versions.CONFERENCES, versions.CONFERENCES_KEY)
+
+
+def invalidate():
+    """Start a new conference generation, dropping every cached page.
+
+    Called wherever a Conference is written (created, updated, renamed,
+    its featured speakers or seat snapshot recomputed) and on every
+    registration, as those change what queryConferences returns.
+    """
+    return versions.bump(versions.CONFERENCES, versions.CONFERENCES_KEY)
+
+
+def cacheKey(filters, page_size, page_token, version):
+    """Return the memcache key of a page of results under a conference
+    generation (version).
+
+    filters are formatted filters (see ConferenceApi._formatFilters); they
+    are ANDed, so their order and any repeats do not matter.
+    """
+    canonical = json.dumps([
+        sorted(set((f['field'], f['operator'], f['value']) for f in filters)),
+        page_size, page_token])
+    return '%s%d_%s' % (MEMCACHE_QUERY_PREFIX, version,
+                        hashlib.md5(canonical).hexdigest())
+
+
+def getPage(cache_key, message_type):
+    """Return the cached page under cache_key as a message_type, or None."""
+    encoded = memcache.get(cache_key)
+    if encoded is None:
+        stats.incr('misses')
+        return None
+    stats.incr('hits')
+    return protojson.decode_message(message_type, encoded)
+
+
+def statsSnapshot():
+    """Return this process's hit and miss counts and hit ratio."""
+    counts = stats.snapshot()
+    lookups = counts['hits'] + counts['misses']
+    counts['hit_ratio'] = (round(counts['hits'] / float(lookups), 3)
+                           if lookups else None)
+    return counts
+
+
+def putPage(cache_key, message):
+    """Cache a page of results under cache_key, unless it is too large."""
+    encoded = protojson.encode_message(message)
+    if len(encoded) <= QUERY_CACHE_MAX_BYTES:
+        memcache.set(cache_key, encoded, time=QUERY_CACHE_TIME)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+"""query_planner.py
+
+Udacity conference server-side Python App Engine query planner; runs
+filter sets with inequalities on more than one property by splitting them
+into datastore-legal queries
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import collections
+import operator
+import uuid
+
+from google.appengine.api import datastore_errors
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+OPERATOR_FUNCS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# Most keys counted per inequality when estimating how selective it is
+SAMPLE_LIMIT = 1000
+# Cost of reading one key (keys-only query) relative to one entity
+KEYS_ONLY_COST = 0.1
+# Share of the most selective inequality's results assumed to survive
+# the intersection with the other inequalities
+INTERSECT_SURVIVAL_ESTIMATE = 0.5
+
+# page token prefix per multi-inequality strategy
+TOKEN_PREFIXES = {'filter': 'f', 'intersect': 'o'}
+TOKEN_STRATEGIES = dict((v, k) for k, v in TOKEN_PREFIXES.items())
+# INTERSECT pages are read from a memcached snapshot of the sorted keys
+MEMCACHE_SNAPSHOT_PREFIX = 'QUERY_SNAPSHOT_'
+SNAPSHOT_CACHE_TIME = 600
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class InvalidPageToken(Exception):
+    """InvalidPageToken -- page token is neither a cursor nor an offset"""
+
+
+def _parseCursor(page_token):
+    """Return the ndb.Cursor for page_token (None for the first page)."""
+    if not page_token:
+        return None
+    try:
+        return ndb.Cursor(urlsafe=page_token)
+    except (TypeError, ValueError, datastore_errors.BadValueError):
+        raise InvalidPageToken(page_token)
+
+
+def fetchPage(query, page_size, page_token=None, keys_only=False):
+    """Fetch one page of an ndb query; return (results, nextPageToken)."""
+    results, next_cursor, more = query.fetch_page(
+        page_size, start_cursor=_parseCursor(page_token), keys_only=keys_only)
+    if more and next_cursor:
+        return results, next_cursor.urlsafe()
+    return results, None
+
+
+def _filterNode(model, filtr):
+    """Build an ndb filter node from a field/operator/value dict."""
+    prop = getattr(model, filtr['field'])
+    return OPERATOR_FUNCS[filtr['operator']](prop, filtr['value'])
+
+
+def _matches(entity, filters):
+    """Return True if entity satisfies every filter (evaluated in memory).
+
+    Repeated properties match if any of their values does, as they do in
+    the datastore.
+    """
+    for filtr in filters:
+        value = getattr(entity, filtr['field'])
+        values = value if isinstance(value, list) else [value]
+        op = OPERATOR_FUNCS[filtr['operator']]
+        if not any(op(v, filtr['value']) for v in values if v is not None):
+            return False
+    return True
+
+
+class QueryPlan(object):
+    """QueryPlan -- strategy chosen to run a filter set
+
+    SINGLE:    the filters form one datastore-legal query.
+    FILTER:    the most selective inequality runs in the datastore, the
+               other inequalities are applied in memory.
+    INTERSECT: inequalities run keys-only as their own async queries; the
+               key sets are intersected and only the survivors are fetched
+               (see _survivors). Only chosen when some inequality matches
+               fewer than SAMPLE_LIMIT keys, which bounds the survivors.
+    """
+    SINGLE = 'single'
+    FILTER = 'filter'
+    INTERSECT = 'intersect'
+
+    def __init__(self, strategy, model, equalities, inequalities, order,
+                 primary=None, estimates=None):
+        self.strategy = strategy
+        self.model = model
+        self.equalities = equalities
+        self.inequalities = inequalities
+        self.order = order
+        self.primary = primary
+        self.estimates = estimates or {}
+
+    def describe(self):
+        """Return a one-line description of the plan, for debug logging."""
+        desc = '%s %s' % (self.strategy, self.model._get_kind())
+        if self.primary:
+            desc += ' primary=%s' % self.primary
+        if self.estimates:
+            desc += ' estimates=%s' % ', '.join(
+                '%s:%d' % item for item in sorted(self.estimates.items()))
+        return desc
+
+    def _baseQuery(self):
+        return self.model.query(
+            *[_filterNode(self.model, f) for f in self.equalities])
+
+    def _subQuery(self, field):
+        """Return the equality query narrowed by field's inequalities."""
+        return self._baseQuery().filter(
+            *[_filterNode(self.model, f) for f in self.inequalities[field]])
+
+    def _orderedQuery(self, field=None):
+        """Return the query ordered by field (if any), then by order and
+        finally by key.
+
+        The key order keeps the order total, and ndb needs it to page a
+        '!=' filter (run as a _MultiQuery of '<' and '>') with cursors.
+        """
+        query = self._subQuery(field) if field else self._baseQuery()
+        if field:
+            query = query.order(getattr(self.model, field))
+        return query.order(self.order, self.model.key)
+
+    def _sortKey(self, entity):
+        return (getattr(entity, self.primary), getattr(entity, self.order._code_name))
+
+    def fetchPage(self, page_size, page_token=None, keys_only=False):
+        """Fetch one page of results; return (entities, nextPageToken).
+
+        With keys_only only keys are returned. A SINGLE plan then runs a
+        keys-only query; the other strategies need the entities to filter
+        or sort them in memory, and only drop them afterwards.
+
+        FILTER and INTERSECT tokens carry the strategy and primary field
+        they were issued under (see planQuery), so a query keeps its plan
+        from page to page.
+        """
+        if self.strategy == self.SINGLE:
+            return fetchPage(self._orderedQuery(self.primary), page_size,
+                             page_token, keys_only=keys_only)
+        args = []
+        if page_token:
+            if _tokenPlan(page_token, self.inequalities) != \
+                    (self.strategy, self.primary):
+                raise InvalidPageToken(page_token)
+            args = page_token.split(':')[2:]
+            if len(args) != (1 if self.strategy == self.FILTER else 2):
+                raise InvalidPageToken(page_token)
+        if self.strategy == self.FILTER:
+            results, next_token = self._fetchFilteredPage(page_size, *args)
+        else:
+            results, next_token = self._fetchIntersectedPage(page_size, *args)
+        if keys_only:
+            results = [entity.key for entity in results]
+        return results, next_token
+
+    def _token(self, *parts):
+        return ':'.join((TOKEN_PREFIXES[self.strategy], self.primary) +
+                        tuple(str(part) for part in parts))
+
+    def _fetchFilteredPage(self, page_size, cursor=None):
+        """Scan the primary inequality's query from cursor, keeping the
+        entities that match the other inequalities; tokens are
+        'f:<primary>:<cursor>'."""
+        rest = [f for field, filters in self.inequalities.items()
+                if field != self.primary for f in filters]
+        results = []
+        it = self._orderedQuery(self.primary).iter(
+            start_cursor=_parseCursor(cursor), produce_cursors=True)
+        for entity in it:
+            if _matches(entity, rest):
+                results.append(entity)
+                if len(results) == page_size:
+                    break
+        if len(results) == page_size and it.has_next():
+            return results, self._token(it.cursor_after().urlsafe())
+        return results, None
+
+    def _survivors(self):
+        """Return the entities matching every inequality, in result order.
+
+        Keys-only queries, of at most SAMPLE_LIMIT keys each, run in
+        parallel for the primary inequality and for any other one whose
+        count came in under SAMPLE_LIMIT (so its key set is complete); the
+        key sets are intersected and the survivors fetched once. The
+        inequalities whose counts hit the limit are checked in memory.
+        """
+        exact = [self.primary] + [
+            field for field in self.inequalities if field != self.primary and
+            self.estimates.get(field, SAMPLE_LIMIT) < SAMPLE_LIMIT]
+        futures = [self._subQuery(field).fetch_async(SAMPLE_LIMIT, keys_only=True)
+                   for field in exact]
+        survivors = set(futures[0].get_result())
+        for future in futures[1:]:
+            survivors.intersection_update(future.get_result())
+
+        rest = [f for field, filters in self.inequalities.items()
+                if field not in exact for f in filters]
+        entities = [e for e in ndb.get_multi(list(survivors))
+                    if e is not None and _matches(e, rest)]
+        entities.sort(key=self._sortKey)
+        return entities
+
+    def _fetchIntersectedPage(self, page_size, snapshot_id=None, offset=0):
+        """Page through a snapshot of the sorted survivor keys.
+
+        The first page finds the survivors and caches their keys under a
+        new snapshot id; tokens are 'o:<primary>:<snapshot id>:<offset>',
+        so later pages read only their own entities and do not shift when
+        entities are written in between. A snapshot dropped from memcache
+        is rebuilt.
+        """
+        try:
+            offset = int(offset)
+        except ValueError:
+            raise InvalidPageToken(offset)
+        if offset < 0:
+            raise InvalidPageToken(offset)
+
+        keys = None
+        if snapshot_id:
+            keys = memcache.get(MEMCACHE_SNAPSHOT_PREFIX + snapshot_id)
+        if keys is None:
+            entities = self._survivors()
+            keys = [entity.key for entity in entities]
+            snapshot_id = snapshot_id or uuid.uuid4().hex
+            if offset + page_size < len(keys):
+                memcache.set(MEMCACHE_SNAPSHOT_PREFIX + snapshot_id, keys,
+                             time=SNAPSHOT_CACHE_TIME)
+            page = entities[offset:offset + page_size]
+        else:
+            page = [e for e in ndb.get_multi(keys[offset:offset + page_size])
+                    if e is not None]
+        if offset + page_size < len(keys):
+            return page, self._token(snapshot_id, offset + page_size)
+        return page, None
+
+
+def _tokenPlan(page_token, inequalities):
+    """Return the (strategy, primary field) a FILTER or INTERSECT page
+    token was issued under, or None if it is not such a token."""
+    parts = (page_token or '').split(':')
+    strategy = TOKEN_STRATEGIES.get(parts[0])
+    if strategy and len(parts) > 2 and parts[1] in inequalities:
+        return strategy, parts[1]
+    return None
+
+
+def planQuery(model, filters, order, page_token=None):
+    """Choose a QueryPlan for filters, a list of field/operator/value dicts.
+
+    With inequalities on at most one property the filters run as a single
+    query, ordered by that property and then by order. Otherwise each
+    inequality is counted keys-only (in parallel, up to SAMPLE_LIMIT) and
+    the cheaper of the FILTER and INTERSECT strategies is picked;
+    INTERSECT only when the most selective count is below SAMPLE_LIMIT,
+    so the survivors it sorts in memory are bounded. A page token from
+    an earlier page fixes the strategy and primary field instead, so the
+    plan cannot change under a client paging through the results.
+    """
+    equalities = [f for f in filters if f['operator'] == '=']
+    inequalities = collections.OrderedDict()
+    for filtr in filters:
+        if filtr['operator'] != '=':
+            inequalities.setdefault(filtr['field'], []).append(filtr)
+
+    if len(inequalities) <= 1:
+        primary = next(iter(inequalities), None)
+        return QueryPlan(QueryPlan.SINGLE, model, equalities, inequalities,
+                         order, primary=primary)
+
+    resumed = _tokenPlan(page_token, inequalities)
+    if resumed:
+        strategy, primary = resumed
+        return QueryPlan(strategy, model, equalities, inequalities, order,
+                         primary=primary)
+
+    plan = QueryPlan(None, model, equalities, inequalities, order)
+    futures = dict((field, plan._subQuery(field).count_async(limit=SAMPLE_LIMIT))
+                   for field in inequalities)
+    estimates = dict((field, future.get_result())
+                     for field, future in futures.items())
+
+    primary = min(estimates, key=estimates.get)
+    filter_cost = estimates[primary]
+    intersect_cost = (KEYS_ONLY_COST * sum(estimates.values()) +
+                      INTERSECT_SURVIVAL_ESTIMATE * estimates[primary])
+    if filter_cost <= intersect_cost or estimates[primary] >= SAMPLE_LIMIT:
+        plan.strategy = QueryPlan.FILTER
+    else:
+        plan.strategy = QueryPlan.INTERSECT
+    plan.primary = primary
+    plan.estimates = estimates
+    return plan
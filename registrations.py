@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""registrations.py
+
+Udacity conference server-side Python App Engine conference registrations;
+    one Registration child of the Profile per conference attended,
+    replacing the Profile's repeated conferenceKeysToAttend property
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import Registration
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def registrationKey(profile_key, conf_key):
+    return ndb.Key(Registration, conf_key.urlsafe(), parent=profile_key)
+
+
+def conferenceKey(reg_key):
+    """Return the Conference key a registration key stands for; no read
+    needed."""
+    return ndb.Key(urlsafe=reg_key.id())
+
+
+def query(profile_key):
+    """Return the query over a user's registrations, most recent first."""
+    return Registration.query(ancestor=profile_key).order(-Registration.created)
+
+
+def conferenceKeys(profile_key):
+    """Return the keys of every Conference a user is registered for
+    (keys-only)."""
+    return [conferenceKey(k) for k in query(profile_key).fetch(keys_only=True)]
+
+
+def attendeesQuery(conf_key):
+    """Return the query over a conference's registrations; the parent of
+    each registration key is the attendee's Profile key."""
+    return Registration.query(Registration.conference == conf_key)
+
+
+def isRegistered(profile_key, conf_key):
+    return registrationKey(profile_key, conf_key).get() is not None
+
+
+def add(profile_key, conf_key):
+    """Register the user; return False if they already were.
+
+    Reads and writes only the user's entity group, so it can run in the
+    seat shard's transaction (see seats.reserveSeat).
+    """
+    key = registrationKey(profile_key, conf_key)
+    if key.get():
+        return False
+    Registration(key=key, conference=conf_key).put()
+    return True
+
+
+def remove(profile_key, conf_key):
+    """Unregister the user; return False if they were not registered."""
+    key = registrationKey(profile_key, conf_key)
+    if not key.get():
+        return False
+    key.delete()
+    return True
+
+
+@ndb.transactional_tasklet
+def migrateAsync(profile_key):
+    """Move a Profile's legacy conferenceKeysToAttend into Registration
+    children in one transaction. Returns (a future for) the Profile as
+    written."""
+    prof = yield profile_key.get_async()
+    if prof and prof.conferenceKeysToAttend:
+        regs = [Registration(key=ndb.Key(Registration, wsck, parent=profile_key),
+                             conference=ndb.Key(urlsafe=wsck))
+                for wsck in set(prof.conferenceKeysToAttend)]
+        prof.conferenceKeysToAttend = []
+        yield ndb.put_multi_async(regs + [prof])
+    raise ndb.Return(prof)
+
+
+def migrate(profile_key):
+    return migrateAsync(profile_key).get_result()
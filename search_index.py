@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""search_index.py
+
+Udacity conference server-side Python App Engine full-text search;
+    keeps Search API documents for Conferences and Sessions and runs
+    paged searches over them
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.api import search
+from google.appengine.ext import ndb
+
+import tasks
+
+CONFERENCE_INDEX = 'conferences'
+SESSION_INDEX = 'sessions'
+
+# document fields per kind: (name, Search API field class, repeated)
+CONFERENCE_FIELDS = [
+    ('name', search.TextField, False),
+    ('description', search.TextField, False),
+    ('city', search.TextField, False),
+    ('topics', search.AtomField, True),
+    ('startDate', search.DateField, False),
+    ('endDate', search.DateField, False),
+    ('maxAttendees', search.NumberField, False),
+    ('organizerDisplayName', search.TextField, False),
+]
+
+SESSION_FIELDS = [
+    ('name', search.TextField, False),
+    ('highlights', search.TextField, False),
+    ('speakers', search.TextField, True),
+    ('typeOfSession', search.AtomField, False),
+    ('date', search.DateField, False),
+    ('start_time', search.AtomField, False),
+    ('duration', search.NumberField, False),
+    ('websafeConferenceKey', search.AtomField, False),
+    ('organizer_display_name', search.TextField, False),
+]
+
+INDEXES = {
+    'Conference': (CONFERENCE_INDEX, CONFERENCE_FIELDS),
+    'Session': (SESSION_INDEX, SESSION_FIELDS),
+}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class InvalidSearch(Exception):
+    """InvalidSearch -- malformed query string, page token or field list"""
+
+
+def _document(entity, fields):
+    """Build the Search API document for entity; its id is the entity's
+    websafe key."""
+    doc_fields = []
+    for name, field_class, repeated in fields:
+        value = getattr(entity, name)
+        for v in (value if repeated else [value]):
+            if v is None or v == []:
+                continue
+            if field_class is search.AtomField:
+                v = unicode(v)
+            doc_fields.append(field_class(name=name, value=v))
+    return search.Document(doc_id=entity.key.urlsafe(), fields=doc_fields)
+
+
+def indexEntities(kind, keys):
+    """(Re)index the entities of kind at keys; documents of entities that
+    no longer exist are removed."""
+    index_name, fields = INDEXES[kind]
+    index = search.Index(name=index_name)
+    entities = ndb.get_multi(keys)
+    size = search.MAXIMUM_DOCUMENTS_PER_PUT_REQUEST
+    docs = [_document(e, fields) for e in entities if e is not None]
+    for i in range(0, len(docs), size):
+        index.put(docs[i:i + size])
+    gone = [key.urlsafe() for key, e in zip(keys, entities) if e is None]
+    if gone:
+        index.delete(gone)
+
+
+def enqueueIndex(keys):
+    """Schedule (re)indexing of keys, all of one kind, in a task."""
+    if keys:
+        tasks.add('/tasks/index_documents',
+            params={'kind': keys[0].kind(),
+                    'websafeKeys': ','.join(key.urlsafe() for key in keys)})
+
+
+def searchDocuments(kind, query_string, page_size, page_token=None, returned_fields=None):
+    """Run query_string against kind's index, one page at a time.
+
+    returned_fields limits the document fields sent back (all by default).
+    Returns ([(websafe key, {field: value or [values]})], nextPageToken).
+    """
+    index_name, fields = INDEXES[kind]
+    names = [name for name, _, _ in fields]
+    repeated = set(name for name, _, r in fields if r)
+    if returned_fields:
+        unknown = set(returned_fields) - set(names)
+        if unknown:
+            raise InvalidSearch('Unknown fields: %s' % ', '.join(sorted(unknown)))
+    else:
+        returned_fields = names
+
+    try:
+        cursor = search.Cursor(web_safe_string=page_token or None)
+        results = search.Index(name=index_name).search(search.Query(
+            query_string=query_string,
+            options=search.QueryOptions(limit=page_size, cursor=cursor,
+                                        returned_fields=returned_fields)))
+    except (search.QueryError, ValueError) as e:
+        raise InvalidSearch(str(e))
+
+    hits = []
+    for doc in results:
+        values = {}
+        for field in doc.fields:
+            value = field.value
+            if isinstance(field, search.DateField):
+                value = value.strftime('%Y-%m-%d')
+            elif isinstance(field, search.NumberField):
+                value = int(value)
+            if field.name in repeated:
+                values.setdefault(field.name, []).append(value)
+            else:
+                values[field.name] = value
+        hits.append((doc.doc_id, values))
+
+    next_token = results.cursor.web_safe_string if results.cursor else None
+    return hits, next_token
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+"""seats.py
+
+Udacity conference server-side Python App Engine sharded seat counters;
+    spreads a Conference's available seats over SeatShard entities so
+    registrations do not all contend on one entity group
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import SeatShard
+import query_cache
+import tasks
+
+NUM_SEAT_SHARDS = 20
+MEMCACHE_SEATS_PREFIX = 'SEATS_'
+SEATS_CACHE_TIME = 600
+SEATS_SYNC_INTERVAL = 10
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class NoSeatsAvailable(Exception):
+    """NoSeatsAvailable -- every shard of the conference is empty"""
+
+
+class _ShardEmpty(Exception):
+    """_ShardEmpty -- the chosen shard ran out of seats; try another"""
+
+
+def _cacheKey(conf_key):
+    return MEMCACHE_SEATS_PREFIX + conf_key.urlsafe()
+
+
+def _shardKeys(conf_key):
+    """Return the keys of conf_key's shards.
+
+    Shards are root entities (not children of the Conference) so that each
+    shard is its own entity group; the Conference itself lives in the
+    organizer's Profile group.
+    """
+    return [ndb.Key(SeatShard, '%s:%d' % (conf_key.urlsafe(), i))
+            for i in range(NUM_SEAT_SHARDS)]
+
+
+def _split(total):
+    """Split total seats as evenly as possible over NUM_SEAT_SHARDS."""
+    share, extra = divmod(max(total or 0, 0), NUM_SEAT_SHARDS)
+    return [share + (1 if i < extra else 0) for i in range(NUM_SEAT_SHARDS)]
+
+
+def setSeatsAvailable(conf_key, total):
+    """Write a new conference's shards so they hold total seats between
+    them; use changeSeatsAvailable once registrations may be running."""
+    ndb.put_multi([
+        SeatShard(key=key, conference=conf_key, seatsAvailable=seats)
+        for key, seats in zip(_shardKeys(conf_key), _split(total))])
+    memcache.set(_cacheKey(conf_key), total, time=SEATS_CACHE_TIME)
+
+
+def _getShards(conf):
+    """Return conf's shards, creating them for a Conference written before
+    seats were sharded.
+
+    get_or_insert keeps concurrent first registrations from creating the
+    seats twice.
+    """
+    keys = _shardKeys(conf.key)
+    shards = ndb.get_multi(keys)
+    if all(shard is None for shard in shards):
+        shards = [SeatShard.get_or_insert(key.id(), conference=conf.key,
+                                          seatsAvailable=seats)
+                  for key, seats in zip(keys, _split(conf.seatsAvailable))]
+    return shards
+
+
+@ndb.transactional()
+def _adjustShard(shard_key, conf_key, delta):
+    """Move one shard's seats by delta, never below zero; return the change
+    actually made."""
+    shard = shard_key.get() or SeatShard(key=shard_key, conference=conf_key)
+    delta = max(delta, -shard.seatsAvailable)
+    if delta:
+        shard.seatsAvailable += delta
+        shard.put()
+    return delta
+
+
+def changeSeatsAvailable(conf, total):
+    """Bring conf's seats to total and return the seats now available.
+
+    The difference from the current shard total is added to (or taken
+    from) the shards one shard transaction at a time, so registrations
+    running meanwhile keep their seats. Seats already taken are never
+    taken back, so the result can be above total.
+    """
+    keys = _shardKeys(conf.key)
+    shards = _getShards(conf)
+    delta = total - sum(shard.seatsAvailable for shard in shards if shard)
+    if delta > 0:
+        for key, seats in zip(keys, _split(delta)):
+            if seats:
+                _adjustShard(key, conf.key, seats)
+    elif delta < 0:
+        # take from the fullest shards first
+        for key, shard in sorted(zip(keys, shards),
+                                 key=lambda ks: -(ks[1].seatsAvailable if ks[1] else 0)):
+            if not delta:
+                break
+            delta -= _adjustShard(key, conf.key, delta)
+    memcache.delete(_cacheKey(conf.key))
+    _enqueueSync(conf.key)
+    return getSeatsAvailable(conf)
+
+
+@ndb.tasklet
+def _sumShardsAsync(snapshots):
+    """Return {conf key: seats} summed from the shards of the conferences
+    in snapshots, a {conf key: Conference.seatsAvailable} dict.
+
+    Conferences with no shards yet report their snapshot.
+    """
+    conf_keys = list(snapshots)
+    keys = [key for conf_key in conf_keys for key in _shardKeys(conf_key)]
+    shards = yield ndb.get_multi_async(keys)
+    totals = {}
+    for i, conf_key in enumerate(conf_keys):
+        conf_shards = shards[i * NUM_SEAT_SHARDS:(i + 1) * NUM_SEAT_SHARDS]
+        if any(shard is not None for shard in conf_shards):
+            totals[conf_key] = sum(s.seatsAvailable for s in conf_shards if s)
+        else:
+            totals[conf_key] = snapshots[conf_key] or 0
+    raise ndb.Return(totals)
+
+
+@ndb.tasklet
+def getSeatsAvailableByKeyAsync(snapshots):
+    """Return {conf key: seats available} for the conferences in snapshots,
+    a {conf key: Conference.seatsAvailable} dict, cached in memcache.
+
+    Memcache calls go through the ndb context so they are batched with
+    other concurrent lookups.
+    """
+    ctx = ndb.get_context()
+    conf_keys = list(snapshots)
+    cached = yield [ctx.memcache_get(_cacheKey(key)) for key in conf_keys]
+    totals = {}
+    misses = {}
+    for conf_key, seats in zip(conf_keys, cached):
+        if seats is None:
+            misses[conf_key] = snapshots[conf_key]
+        else:
+            totals[conf_key] = seats
+    if misses:
+        summed = yield _sumShardsAsync(misses)
+        yield [ctx.memcache_add(_cacheKey(key), seats, time=SEATS_CACHE_TIME)
+               for key, seats in summed.items()]
+        totals.update(summed)
+    raise ndb.Return(totals)
+
+
+def getSeatsAvailableMultiAsync(confs):
+    """Return a future for {conf key: seats available} for confs."""
+    return getSeatsAvailableByKeyAsync(
+        dict((conf.key, conf.seatsAvailable) for conf in confs))
+
+
+def getSeatsAvailableMulti(confs):
+    """Return {conf key: seats available} for confs, cached in memcache."""
+    return getSeatsAvailableMultiAsync(confs).get_result()
+
+
+def getSeatsAvailable(conf):
+    """Return the seats available for conf, cached in memcache."""
+    return getSeatsAvailableMulti([conf])[conf.key]
+
+
+@ndb.transactional(xg=True)
+def _takeSeat(shard_key, callback):
+    shard = shard_key.get()
+    if shard is None or shard.seatsAvailable <= 0:
+        raise _ShardEmpty()
+    result = callback()
+    shard.seatsAvailable -= 1
+    shard.put()
+    return result
+
+
+@ndb.transactional(xg=True)
+def _returnSeat(shard_key, conf_key, callback):
+    result = callback()
+    if result:
+        shard = shard_key.get() or SeatShard(key=shard_key, conference=conf_key)
+        shard.seatsAvailable += 1
+        shard.put()
+    return result
+
+
+def reserveSeat(conf, callback, on_change=None):
+    """Take one of conf's seats and run callback() in the same transaction.
+
+    Only shards that had seats left are tried, in random order, so that
+    concurrent registrations spread over the shards. Returns callback's
+    result; raises NoSeatsAvailable when every shard is empty.
+
+    on_change(conf, seats left, -1) is called after the seat is taken;
+    seats left comes from the cached count, None if it is not cached.
+    """
+    shards = [s for s in _getShards(conf) if s and s.seatsAvailable > 0]
+    random.shuffle(shards)
+    for shard in shards:
+        try:
+            result = _takeSeat(shard.key, callback)
+        except _ShardEmpty:
+            continue
+        seats_left = memcache.decr(_cacheKey(conf.key))
+        _enqueueSync(conf.key)
+        if on_change:
+            on_change(conf, seats_left, -1)
+        return result
+    raise NoSeatsAvailable()
+
+
+def releaseSeat(conf, callback, on_change=None):
+    """Run callback() and, if it returns a true value, give a seat back to a
+    random shard of conf in the same transaction. Returns callback's result.
+
+    on_change is called as for reserveSeat, with a delta of 1.
+    """
+    shard = random.choice(_getShards(conf))
+    result = _returnSeat(shard.key, conf.key, callback)
+    if result:
+        seats_left = memcache.incr(_cacheKey(conf.key))
+        _enqueueSync(conf.key)
+        if on_change:
+            on_change(conf, seats_left, 1)
+    return result
+
+# - - - Conference.seatsAvailable snapshot - - - - - - - - - -
+
+def _enqueueSync(conf_key):
+    """Schedule one snapshot sync per conference per SEATS_SYNC_INTERVAL."""
+    bucket = int(time.time()) // SEATS_SYNC_INTERVAL
+    tasks.add('/tasks/sync_seats_available',
+        params={'websafeConferenceKey': conf_key.urlsafe()},
+        name='sync-seats-%s-%d' % (conf_key.urlsafe(), bucket),
+        countdown=SEATS_SYNC_INTERVAL)
+
+
+def syncSeatsAvailable(websafeConferenceKey):
+    """Copy the shard total back onto Conference.seatsAvailable.
+
+    The property is only a snapshot used to index conferences (e.g. for the
+    nearly sold out announcement); the shards hold the real count.
+    """
+    conf = ndb.Key(urlsafe=websafeConferenceKey).get()
+    if not conf:
+        return
+    total = _sumShardsAsync({conf.key: conf.seatsAvailable}).get_result()[conf.key]
+    memcache.set(_cacheKey(conf.key), total, time=SEATS_CACHE_TIME)
+    if _writeSnapshot(conf.key, total):
+        query_cache.invalidate()
+
+
+@ndb.transactional()
+def _writeSnapshot(conf_key, total):
+    """Write total onto the Conference; return True if it changed.
+
+    The conference may have been deleted since the sync read it.
+    """
+    conf = conf_key.get()
+    if conf is None or conf.seatsAvailable == total:
+        return False
+    conf.seatsAvailable = total
+    conf.put()
+    return True
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""serializers.py
+
+Udacity conference server-side Python App Engine model to ProtoRPC form
+    copying; the fields to copy, and how to convert each, are worked out
+    once per (model, form) pair instead of per entity
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.ext import ndb
+from protorpc import messages
+
+from models import Conference, ConferenceForm
+from models import Profile, ProfileForm
+from models import Session, SessionForm
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _converter(prop, field):
+    """Return the function turning prop's values into field's, or None if
+    they can be copied as they are."""
+    if isinstance(prop, (ndb.DateProperty, ndb.TimeProperty)) and \
+            isinstance(field, messages.StringField):
+        return str
+    if isinstance(field, messages.EnumField):
+        return field.type
+    return None
+
+
+class CopyPlan(object):
+    """CopyPlan -- precomputed field copies from one model to one form
+
+    Form fields named after a model property are copied (dates & times as
+    strings, strings to enums); a websafeKey field gets the entity's key.
+    """
+
+    def __init__(self, model, form_class):
+        self.model = model
+        self.form_class = form_class
+        self.fields = []
+        for field in form_class.all_fields():
+            prop = model._properties.get(field.name)
+            if prop is not None:
+                self.fields.append((field.name, _converter(prop, field)))
+        self.websafe_key = 'websafeKey' in [f.name for f in form_class.all_fields()]
+        self.required = any(f.required for f in form_class.all_fields())
+
+    def copy(self, entity, **overrides):
+        """Return a form for entity; overrides set fields the model does
+        not hold (e.g. seatsAvailable from the seat shards)."""
+        values = {}
+        for name, convert in self.fields:
+            value = getattr(entity, name)
+            if value is not None and convert is not None:
+                value = convert(value)
+            values[name] = value
+        if self.websafe_key:
+            values['websafeKey'] = entity.key.urlsafe()
+        values.update(overrides)
+        form = self.form_class(**values)
+        if self.required:
+            form.check_initialized()
+        return form
+
+
+_plans = {}
+
+
+def copyPlan(model, form_class):
+    """Return the (cached) CopyPlan from model to form_class."""
+    plan = _plans.get((model, form_class))
+    if plan is None:
+        plan = _plans[(model, form_class)] = CopyPlan(model, form_class)
+    return plan
+
+
+def toForm(entity, form_class, **overrides):
+    """Copy entity to a new form_class message."""
+    return copyPlan(type(entity), form_class).copy(entity, **overrides)
+
+
+def toForms(entities, form_class):
+    """Copy a list of entities of one model to form_class messages."""
+    if not entities:
+        return []
+    copy = copyPlan(type(entities[0]), form_class).copy
+    return [copy(entity) for entity in entities]
+
+
+# build the plans the API uses at import time
+for _model, _form_class in ((Conference, ConferenceForm),
+                            (Session, SessionForm),
+                            (Profile, ProfileForm)):
+    copyPlan(_model, _form_class)
@@ -16,3 +16,13 @@ WEB_CLIENT_ID = 'replace with Web client ID'
 ANDROID_CLIENT_ID = 'replace with Android client ID'
 IOS_CLIENT_ID = 'replace with iOS client ID'
 ANDROID_AUDIENCE = WEB_CLIENT_ID
+
+# Verify id_tokens locally against Google's signing certs instead of calling
+# the tokeninfo endpoint; access tokens always go to tokeninfo.
+LOCAL_TOKEN_VERIFICATION = True
+
+# Share of requests whose API calls are counted, timed and logged (one
+# 'rpc_stats' line each); 0 turns instrumentation off.
+INSTRUMENTATION_SAMPLE_RATE = 0.05
+# Also send the sampled counts back in an X-Conference-RPC-Stats header.
+INSTRUMENTATION_HEADER = False
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""speaker_tally.py
+
+Udacity conference server-side Python App Engine featured speaker tally;
+    keeps a per-conference count of sessions per speaker up to date as
+    sessions are written, so the featured speaker is an O(1) read
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import Session, SpeakerTally
+
+TALLY_ID = 'speakers'
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def tallyKey(conf_key):
+    return ndb.Key(SpeakerTally, TALLY_ID, parent=conf_key)
+
+
+def _applySession(tally, session, delta):
+    """Add (delta > 0) or remove (delta < 0) session under each speaker."""
+    session_id = str(session.key.id())
+    for speaker in set(session.speakers):
+        if delta > 0:
+            tally.sessions.setdefault(speaker, {})[session_id] = session.name
+        elif speaker in tally.sessions:
+            tally.sessions[speaker].pop(session_id, None)
+            if not tally.sessions[speaker]:
+                del tally.sessions[speaker]
+
+
+def updateTally(conf_key, added=(), removed=()):
+    """Count added sessions and uncount removed ones for every speaker.
+
+    Call inside a transaction on the conference's entity group. To record
+    an update, pass the old version in removed and the new one in added.
+    """
+    tally = (tallyKey(conf_key).get() or
+             SpeakerTally(key=tallyKey(conf_key), sessions={}))
+    for session in removed:
+        _applySession(tally, session, -1)
+    for session in added:
+        _applySession(tally, session, 1)
+    tally.put()
+    return tally
+
+
+@ndb.transactional()
+def putSessions(conf_key, sessions):
+    """Write sessions of one conference together with its speaker tally."""
+    ndb.put_multi(sessions)
+    return updateTally(conf_key, added=sessions)
+
+
+@ndb.transactional()
+def rebuildTally(conf_key):
+    """Recount every session of the conference; repair path only."""
+    tally = SpeakerTally(key=tallyKey(conf_key), sessions={})
+    for session in Session.query(ancestor=conf_key):
+        _applySession(tally, session, 1)
+    tally.put()
+    return tally
+
+
+def featuredSpeakers(tally):
+    """Return (speakers with the most sessions, names of their sessions)."""
+    if not tally or not tally.sessions:
+        return [], []
+    most = max(len(sessions) for sessions in tally.sessions.values())
+    speakers = sorted(speaker for speaker, sessions in tally.sessions.items()
+                      if len(sessions) == most)
+    session_names = sorted(set(name for speaker in speakers
+                               for name in tally.sessions[speaker].values()))
+    return speakers, session_names
@@ -130,3 +130,49 @@ app.factory('oauth2Provider', function ($modal) {
 
     return oauth2Provider;
 });
+
+
+/**
+ * @ngdoc service
+ * @name conditionalGet
+ *
+ * @description
+ * Service that calls a conference API GET method with the etag of the result fetched before,
+ * if any, and answers from that result when the server says it has not been modified.
+ *
+ */
+app.factory('conditionalGet', function () {
+    // method + params -> {etag: ..., result: ...}
+    var cache = {};
+
+    /**
+     * Calls gapi.client.conference[method](params) and calls callback with its response,
+     * with the cached result in place of a notModified one.
+     *
+     * @param {String} method
+     * @param {Object} params
+     * @param {Function} callback
+     */
+    var conditionalGet = function (method, params, callback) {
+        var cacheKey = method + JSON.stringify(params);
+        var cached = cache[cacheKey];
+        var request = angular.extend({}, params);
+        if (cached) {
+            request.ifNoneMatch = cached.etag;
+        }
+        gapi.client.conference[method](request).execute(function (resp) {
+            if (resp.error) {
+                callback(resp);
+            } else if (cached && resp.result.notModified) {
+                callback({result: cached.result});
+            } else {
+                if (resp.result.etag) {
+                    cache[cacheKey] = {etag: resp.result.etag, result: resp.result};
+                }
+                callback(resp);
+            }
+        });
+    };
+
+    return conditionalGet;
+});
@@ -346,13 +346,36 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     $scope.pagination = $scope.pagination || {};
     $scope.pagination.currentPage = 0;
     $scope.pagination.pageSize = 20;
+
+    /**
+     * The token of the next page not yet fetched from the server, if any.
+     * @type {string|null}
+     */
+    $scope.pagination.nextPageToken = null;
+
     /**
-     * Returns the number of the pages in the pagination.
+     * Returns the number of the pages in the pagination, counting one not yet fetched page
+     * when the server has more results.
      *
      * @returns {number}
      */
     $scope.pagination.numberOfPages = function () {
-        return Math.ceil($scope.conferences.length / $scope.pagination.pageSize);
+        var loadedPages = Math.ceil($scope.conferences.length / $scope.pagination.pageSize);
+        return $scope.pagination.nextPageToken ? loadedPages + 1 : loadedPages;
+    };
+
+    /**
+     * Moves to the page, fetching it from the server first if it has not been loaded yet.
+     *
+     * @param page the zero-based page number
+     */
+    $scope.pagination.goTo = function (page) {
+        if (page * $scope.pagination.pageSize >= $scope.conferences.length
+            && $scope.pagination.nextPageToken) {
+            $scope.queryConferencesAll($scope.pagination.nextPageToken, page);
+        } else {
+            $scope.pagination.currentPage = page;
+        }
     };
 
     /**
@@ -424,11 +447,18 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     };
 
     /**
-     * Invokes the conference.queryConferences API.
+     * Invokes the conference.queryConferencesSummary API.
+     *
+     * @param pageToken (optional) the token of the page to fetch; starts a new query when omitted
+     * @param page (optional) the page number to show once the page has been fetched
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (pageToken, page) {
         var sendFilters = {
-            filters: []
+            filters: [],
+            pageSize: $scope.pagination.pageSize
+        }
+        if (pageToken) {
+            sendFilters.pageToken = pageToken;
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -441,7 +471,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
             }
         }
         $scope.loading = true;
-        gapi.client.conference.queryConferences(sendFilters).
+        gapi.client.conference.queryConferencesSummary(sendFilters).
             execute(function (resp) {
                 $scope.$apply(function () {
                     $scope.loading = false;
@@ -458,10 +488,17 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!pageToken) {
+                            $scope.conferences = [];
+                            $scope.pagination.currentPage = 0;
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.pagination.nextPageToken = resp.nextPageToken || null;
+                        if (page !== undefined) {
+                            $scope.pagination.currentPage = Math.min(page, $scope.pagination.numberOfPages() - 1);
+                        }
                     }
                     $scope.submitted = true;
                 });
@@ -469,11 +506,11 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     }
 
     /**
-     * Invokes the conference.getConferencesCreated method.
+     * Invokes the conference.getConferencesCreatedSummary method.
      */
     $scope.getConferencesCreated = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
+        gapi.client.conference.getConferencesCreatedSummary().
             execute(function (resp) {
                 $scope.$apply(function () {
                     $scope.loading = false;
@@ -496,6 +533,8 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $log.info($scope.messages);
 
                         $scope.conferences = [];
+                        $scope.pagination.currentPage = 0;
+                        $scope.pagination.nextPageToken = null;
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
@@ -506,12 +545,11 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     };
 
     /**
-     * Retrieves the conferences to attend by calling the conference.getProfile method and
-     * invokes the conference.getConference method n times where n == the number of the conferences to attend.
+     * Retrieves summaries of the conferences to attend with the conference.getConferencesToAttendSummary method.
      */
     $scope.getConferencesAttend = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesToAttend().
+        gapi.client.conference.getConferencesToAttendSummary().
             execute(function (resp) {
                 $scope.$apply(function () {
                     if (resp.error) {
@@ -527,7 +565,9 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         }
                     } else {
                         // The request has succeeded.
-                        $scope.conferences = resp.result.items;
+                        $scope.conferences = resp.result.items || [];
+                        $scope.pagination.currentPage = 0;
+                        $scope.pagination.nextPageToken = null;
                         $scope.loading = false;
                         $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
                         $scope.alertStatus = 'success';
@@ -547,21 +587,22 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
-conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS, conditionalGet) {
     $scope.conference = {};
 
     $scope.isUserAttending = false;
 
     /**
      * Initializes the conference detail page.
-     * Invokes the conference.getConference method and sets the returned conference in the $scope.
+     * Invokes the conference.getConference method and sets the returned conference in the $scope;
+     * a conference seen before is revalidated with its ETag instead of fetched again.
      *
      */
     $scope.init = function () {
         $scope.loading = true;
-        gapi.client.conference.getConference({
+        conditionalGet('getConference', {
             websafeConferenceKey: $routeParams.websafeConferenceKey
-        }).execute(function (resp) {
+        }, function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
                 if (resp.error) {
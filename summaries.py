@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""summaries.py
+
+Udacity conference server-side Python App Engine list summaries; keeps
+    a small memcached record per Conference or Session holding just the
+    fields list pages show, so lists are keys-only queries plus memcache
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+MEMCACHE_SUMMARY_PREFIX = 'SUMMARY_'
+SUMMARY_CACHE_TIME = 3600
+
+# fields kept per kind; seatsAvailable is only the Conference's snapshot,
+# the live count comes from its seat shards
+SUMMARY_FIELDS = {
+    'Conference': ('name', 'city', 'startDate', 'endDate', 'topics',
+                   'maxAttendees', 'seatsAvailable', 'organizerDisplayName'),
+    'Session': ('name', 'speakers', 'typeOfSession', 'date', 'start_time',
+                'duration'),
+}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _cacheKey(key):
+    return MEMCACHE_SUMMARY_PREFIX + key.urlsafe()
+
+
+def _summarize(entity):
+    """Return entity's summary record: its summary fields as a dict, with
+    dates and times as strings."""
+    summary = {}
+    for name in SUMMARY_FIELDS[entity.key.kind()]:
+        value = getattr(entity, name)
+        if hasattr(value, 'isoformat'):
+            value = str(value)
+        summary[name] = value
+    return summary
+
+
+@ndb.tasklet
+def getSummariesAsync(keys):
+    """Return [(key, summary record)] for keys, in order.
+
+    Records come from memcache; misses are read from the datastore and
+    cached. Keys of deleted entities are left out.
+    """
+    ctx = ndb.get_context()
+    cached = yield [ctx.memcache_get(_cacheKey(key)) for key in keys]
+    missing = [key for key, summary in zip(keys, cached) if summary is None]
+    fresh = {}
+    if missing:
+        entities = yield ndb.get_multi_async(missing)
+        for entity in entities:
+            if entity is not None:
+                fresh[entity.key] = _summarize(entity)
+        yield [ctx.memcache_set(_cacheKey(key), summary, time=SUMMARY_CACHE_TIME)
+               for key, summary in fresh.items()]
+
+    results = []
+    for key, summary in zip(keys, cached):
+        summary = summary if summary is not None else fresh.get(key)
+        if summary is not None:
+            results.append((key, summary))
+    raise ndb.Return(results)
+
+
+def invalidate(keys):
+    """Drop the cached summaries of keys after their entities changed."""
+    if keys:
+        memcache.delete_multi([_cacheKey(key) for key in keys])
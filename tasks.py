@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""tasks.py
+
+Udacity conference server-side Python App Engine task dispatch; tasks
+    added while a request runs are collected and enqueued together,
+    asynchronously and in batches, when it finishes
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import functools
+import logging
+import threading
+import time
+
+from google.appengine.api import taskqueue
+
+# Featured speaker recomputes for one conference are coalesced into one
+# task per window
+FEATURED_SPEAKER_WINDOW = 10
+
+_local = threading.local()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def add(url, params=None, name=None, countdown=None):
+    """Add a task to the current request's batch.
+
+    Outside of a batching() call the task is enqueued at once. A named task
+    already in the batch is not added twice; one that already exists in
+    the queue (or ran recently) is skipped when the batch is flushed.
+    """
+    task = taskqueue.Task(url=url, params=params, name=name, countdown=countdown)
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        flush([task])
+    elif not (name and any(t.name == name for t in pending)):
+        pending.append(task)
+
+
+def addFeaturedSpeakerTask(websafeConferenceKey):
+    """Schedule one featured speaker recompute per conference per window.
+
+    The task is named after the conference and the window it was added
+    in, and only runs once that window has passed, so every session
+    written during the window is seen by the one task.
+    """
+    bucket = int(time.time()) // FEATURED_SPEAKER_WINDOW
+    add('/tasks/set_featured_speaker',
+        params={'websafeConferenceKey': websafeConferenceKey},
+        name='featured-speaker-%s-%d' % (websafeConferenceKey, bucket),
+        countdown=FEATURED_SPEAKER_WINDOW)
+
+
+def flush(tasks):
+    """Enqueue tasks with one add_async call per MAX_TASKS_PER_ADD tasks."""
+    queue = taskqueue.Queue()
+    size = taskqueue.MAX_TASKS_PER_ADD
+    rpcs = [queue.add_async(tasks[i:i + size])
+            for i in range(0, len(tasks), size)]
+    for rpc in rpcs:
+        try:
+            rpc.get_result()
+        except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError) as e:
+            # the other tasks of the batch are still added
+            logging.info('Skipped tasks already enqueued: %s', e)
+
+
+def batching(func):
+    """Decorator collecting the tasks added while func runs and flushing
+    them once it returns (or raises, so that side effects of writes that
+    did happen are not lost). Nested calls share the outermost batch.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'pending', None) is not None:
+            return func(*args, **kwargs)
+        _local.pending = []
+        try:
+            return func(*args, **kwargs)
+        finally:
+            pending, _local.pending = _local.pending, None
+            if pending:
+                flush(pending)
+    return wrapper
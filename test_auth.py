@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""test_auth.py
+
+Tests for auth.py: tokeninfo caching and local id_token verification,
+against a locally generated keypair and a stubbed cert fetch
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import base64
+import binascii
+import json
+import os
+import time
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from google.appengine.api import memcache
+from google.appengine.api import urlfetch_service_pb
+from google.appengine.runtime import apiproxy_errors
+
+import auth
+
+# one key for the whole run; generating one per test is slow
+KEY = RSA.generate(1024)
+OTHER_KEY = RSA.generate(1024)
+AUDIENCE = auth.ID_TOKEN_AUDIENCES[0]
+
+
+class AuthTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        auth._token_cache.clear()
+        auth._certs.update(keys={}, expires_at=0, fetched_at=0)
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        self.tb.deactivate()
+
+    def signIn(self, token):
+        os.environ['HTTP_AUTHORIZATION'] = 'Bearer %s' % token
+
+# - - - tokeninfo cache - - - - - - - - - - - - - - - - - - - -
+
+class TokenInfoCacheTest(AuthTestCase):
+
+    def setUp(self):
+        super(TokenInfoCacheTest, self).setUp()
+        self.fetched = harness.useFakeTokenInfo()
+
+    def testNoAuthorizationHeader(self):
+        os.environ.pop('HTTP_AUTHORIZATION', None)
+        self.assertEqual(auth.getUserId(), '')
+        self.assertEqual(self.fetched, [])
+
+    def testLookupIsCachedInProcess(self):
+        self.signIn('token-alice')
+        self.assertEqual(auth.getUserId(), 'alice')
+        self.assertEqual(auth.getUserId(), 'alice')
+        self.assertEqual(len(self.fetched), 1)
+
+    def testLookupIsCachedInMemcache(self):
+        self.signIn('token-alice')
+        auth.getUserId()
+        # a new instance: empty process cache, shared memcache
+        auth._token_cache.clear()
+        self.assertEqual(auth.getUserId(), 'alice')
+        self.assertEqual(len(self.fetched), 1)
+
+    def testTokensAreCachedSeparately(self):
+        self.signIn('token-alice')
+        self.assertEqual(auth.getUserId(), 'alice')
+        self.signIn('token-bob')
+        self.assertEqual(auth.getUserId(), 'bob')
+        self.assertEqual(len(self.fetched), 2)
+
+    def testMemcacheKeyIsAHashOfTheToken(self):
+        self.signIn('token-alice')
+        auth.getUserId()
+        for key in [auth.MEMCACHE_TOKEN_PREFIX + 'token-alice', 'token-alice']:
+            self.assertIsNone(memcache.get(key))
+
+    def testFailedLookupIsNotCached(self):
+        fetched = harness.useUrlFetch(lambda url: (400, 'invalid_token'))
+        self.signIn('token-alice')
+        self.assertEqual(auth.getUserId(), '')
+        self.fetched = harness.useFakeTokenInfo()
+        self.assertEqual(auth.getUserId(), 'alice')
+        self.assertTrue(fetched)
+
+
+# - - - local id_token verification - - - - - - - - - - - - - -
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _jwk(kid, key):
+    def part(number):
+        hexed = '%x' % number
+        return _b64encode(binascii.unhexlify('0' * (len(hexed) % 2) + hexed))
+    return {'kid': kid, 'kty': 'RSA', 'alg': 'RS256',
+            'n': part(key.n), 'e': part(key.e)}
+
+
+def makeToken(key=KEY, kid='k1', header=None, **claims):
+    """Return an RS256 id_token signed with key; claims override valid
+    defaults (a claim set to None is left out)."""
+    now = int(time.time())
+    payload = {'iss': 'accounts.google.com', 'aud': AUDIENCE, 'sub': 'alice',
+               'iat': now, 'exp': now + 3600}
+    payload.update(claims)
+    payload = dict((k, v) for k, v in payload.items() if v is not None)
+    if header is None:
+        header = {'alg': 'RS256', 'kid': kid, 'typ': 'JWT'}
+    signing_input = '%s.%s' % (_b64encode(json.dumps(header)),
+                               _b64encode(json.dumps(payload)))
+    signature = PKCS1_v1_5.new(key).sign(SHA256.new(signing_input))
+    return '%s.%s' % (signing_input, _b64encode(signature))
+
+
+class IdTokenTest(AuthTestCase):
+
+    def setUp(self):
+        super(IdTokenTest, self).setUp()
+        self.certs = {'keys': [_jwk('k1', KEY.publickey())]}
+        self.certs_response = None
+        self.fetched = harness.useUrlFetch(self.respond)
+
+    def respond(self, url):
+        if url == auth.GOOGLE_CERTS_URL:
+            if self.certs_response is not None:
+                return self.certs_response()
+            return 200, json.dumps(self.certs), {'Cache-Control': 'max-age=600'}
+        # tokeninfo knows every token as bob's, to tell the paths apart
+        return 200, json.dumps({'user_id': 'bob', 'expires_in': 3600})
+
+    def certFetches(self):
+        return self.fetched.count(auth.GOOGLE_CERTS_URL)
+
+    def tokenInfoFetches(self):
+        return len(self.fetched) - self.certFetches()
+
+    def assertInvalid(self, token):
+        self.assertRaises(auth.InvalidTokenError, auth.verifyIdToken, token)
+
+    def testValidToken(self):
+        self.assertEqual(auth.verifyIdToken(makeToken())['sub'], 'alice')
+
+    def testValidTokenSkipsTokenInfo(self):
+        self.signIn(makeToken())
+        self.assertEqual(auth.getUserId(), 'alice')
+        self.assertEqual(self.tokenInfoFetches(), 0)
+
+    def testCertsAreCached(self):
+        auth.verifyIdToken(makeToken())
+        auth.verifyIdToken(makeToken(sub='carol'))
+        # a new instance reads them from memcache
+        auth._certs.update(keys={}, expires_at=0, fetched_at=0)
+        auth.verifyIdToken(makeToken())
+        self.assertEqual(self.certFetches(), 1)
+
+    def testWrongSignature(self):
+        self.assertInvalid(makeToken(key=OTHER_KEY))
+
+    def testTamperedPayload(self):
+        header, payload, signature = makeToken().split('.')
+        forged = makeToken(sub='mallory').split('.')[1]
+        self.assertInvalid('.'.join([header, forged, signature]))
+
+    def testWrongAudience(self):
+        self.assertInvalid(makeToken(aud='someone-else'))
+
+    def testWrongIssuer(self):
+        self.assertInvalid(makeToken(iss='evil.example.com'))
+
+    def testHttpsIssuer(self):
+        auth.verifyIdToken(makeToken(iss='https://accounts.google.com'))
+
+    def testExpired(self):
+        self.assertInvalid(makeToken(exp=int(time.time()) - auth.CLOCK_SKEW_SECS - 10))
+
+    def testExpiryWithinClockSkew(self):
+        auth.verifyIdToken(makeToken(exp=int(time.time()) - 10))
+
+    def testIssuedInTheFuture(self):
+        self.assertInvalid(makeToken(iat=int(time.time()) + auth.CLOCK_SKEW_SECS + 60))
+
+    def testNoSubject(self):
+        self.assertInvalid(makeToken(sub=None))
+
+    def testMalformedClaims(self):
+        self.assertInvalid(makeToken(exp='soon'))
+
+    def testOtherAlgorithm(self):
+        self.assertInvalid(makeToken(header={'alg': 'none', 'kid': 'k1'}))
+
+    def testHeaderNotAnObject(self):
+        self.assertInvalid(makeToken(header=['RS256']))
+
+    def testNotAJwt(self):
+        self.assertInvalid('not-a-jwt')
+        self.assertInvalid('a.b.c')
+
+    def testUnknownKidRefetchesOnce(self):
+        auth.verifyIdToken(makeToken())
+        auth._certs['fetched_at'] = 0
+        self.assertInvalid(makeToken(kid='k2'))
+        self.assertEqual(self.certFetches(), 2)
+        # refetches are rate limited
+        self.assertInvalid(makeToken(kid='k2'))
+        self.assertEqual(self.certFetches(), 2)
+
+    def testRotatedKeyIsPickedUp(self):
+        auth.verifyIdToken(makeToken())
+        auth._certs['fetched_at'] = 0
+        self.certs['keys'].append(_jwk('k2', OTHER_KEY.publickey()))
+        auth.verifyIdToken(makeToken(key=OTHER_KEY, kid='k2'))
+
+    def testInvalidTokenFallsBackToTokenInfo(self):
+        self.signIn(makeToken(aud='someone-else'))
+        self.assertEqual(auth.getUserId(), 'bob')
+        self.assertEqual(self.tokenInfoFetches(), 1)
+
+    def testHeaderNotAnObjectFallsBackToTokenInfo(self):
+        self.signIn(makeToken(header='RS256'))
+        self.assertEqual(auth.getUserId(), 'bob')
+
+    def assertCertFailureFallsBack(self, respond):
+        self.certs_response = respond
+        self.signIn(makeToken())
+        self.assertEqual(auth.getUserId(), 'bob')
+        self.assertEqual(self.tokenInfoFetches(), 1)
+
+    def testCertFetchErrorStatusFallsBack(self):
+        self.assertCertFailureFallsBack(lambda: (500, 'oops'))
+
+    def testCertFetchDownloadErrorFallsBack(self):
+        def fail():
+            raise apiproxy_errors.ApplicationError(
+                urlfetch_service_pb.URLFetchServiceError.FETCH_ERROR)
+        self.assertCertFailureFallsBack(fail)
+
+    def testCertFetchDeadlineFallsBack(self):
+        def fail():
+            raise apiproxy_errors.ApplicationError(
+                urlfetch_service_pb.URLFetchServiceError.DEADLINE_EXCEEDED)
+        self.assertCertFailureFallsBack(fail)
+
+    def testMalformedCertsFallBack(self):
+        self.assertCertFailureFallsBack(lambda: (200, 'not json'))
+        auth._certs.update(keys={}, expires_at=0, fetched_at=0)
+        self.assertCertFailureFallsBack(lambda: (200, '["keys"]'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+
+"""test_conference.py
+
+Tests for conference.py: the endpoints methods, called directly on a
+ConferenceApi as a signed in user
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import os
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import endpoints
+from google.appengine.ext import ndb
+from protorpc import message_types
+
+import auth
+from conference import ConferenceApi
+from conference import CONF_ETAG_GET_REQUEST, CONF_GET_REQUEST, CONF_POST_REQUEST
+from conference import PAGE_GET_REQUEST
+from conference import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from conference import ETAG_GET_REQUEST, FEATURED_SPEAKER_GET_REQUEST
+from conference import SESSION_ETAG_GET_REQUEST
+from conference import SESSION_SPEAKER_GET_REQUEST, SESSION_TYPE_GET_REQUEST
+from conference import SESSION_POST_REQUEST, SESSIONS_POST_REQUEST
+from models import Conference, ConferenceForm, Profile, ProfileMiniForm
+from models import ConferenceQueryForm, ConferenceQueryForms
+from models import Session, SessionForm, SessionQueryForm, SessionQueryForms
+import versions
+
+ORGANIZER = 'organizer'
+
+
+class ConferenceApiTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.environ = dict(os.environ)
+        auth._token_cache.clear()
+        harness.useFakeTokenInfo()
+        self.requests = 0
+        self.api = ConferenceApi()
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(
+            name='Conference', city='London', maxAttendees=10,
+            startDate='2016-05-01', endDate='2016-05-02'))
+        self.conf_key = Conference.query(
+            ancestor=ndb.Key(Profile, ORGANIZER)).get(keys_only=True)
+        self.wsck = self.conf_key.urlsafe()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        self.tb.deactivate()
+
+    def signIn(self, user_id):
+        """Make the next call a new request by user_id."""
+        self.requests += 1
+        harness.signIn(user_id, 'test-%d' % self.requests)
+
+    def sessionForm(self, **fields):
+        values = dict(name='Session', speakers=['Ada'], date='05/01/2016',
+                      start_time='10:00')
+        values.update(fields)
+        return SessionForm(**values)
+
+    def sessionCount(self):
+        return Session.query(ancestor=self.conf_key).count()
+
+    def createSessions(self, forms):
+        self.signIn(ORGANIZER)
+        return self.api.createSessions(SESSIONS_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck, items=forms))
+
+# - - - request context - - - - - - - - - - - - - - - - - - - -
+
+class RequestContextTest(ConferenceApiTestCase):
+
+    def testUserAndProfileAreResolvedOncePerRequest(self):
+        self.signIn('alice')
+        recorder = harness.RpcRecorder().attach()
+        profile = self.api._getProfileFromUser()
+        self.assertEqual(profile.key.id(), 'alice')
+        self.assertIs(self.api._getProfileFromUser(), profile)
+        self.assertEqual(self.api._getContext().user_id, 'alice')
+        self.assertEqual(recorder.calls.get('datastore_v3.Get'), 1)
+
+    def testEachRequestGetsItsOwnContext(self):
+        self.signIn('alice')
+        context = self.api._getContext()
+        self.signIn('alice')
+        self.assertIsNot(self.api._getContext(), context)
+        self.signIn('bob')
+        self.assertEqual(self.api._getProfileFromUser().key.id(), 'bob')
+
+    def testSignedOut(self):
+        self.signIn('alice')
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = ''
+        self.assertRaises(endpoints.UnauthorizedException,
+                          self.api.getProfile, message_types.VoidMessage())
+
+    def testProfileIsCreatedOnFirstUse(self):
+        self.signIn('alice')
+        form = self.api.getProfile(message_types.VoidMessage())
+        self.assertEqual(form.mainEmail, 'alice@example.com')
+        self.assertIsNotNone(ndb.Key(Profile, 'alice').get())
+
+    def testRenameStartsTheOrganizerNameTask(self):
+        self.signIn(ORGANIZER)
+        self.api.saveProfile(ProfileMiniForm(displayName='New name'))
+        self.assertEqual(ndb.Key(Profile, ORGANIZER).get().displayName, 'New name')
+        self.assertEqual(len(self.tb.get_stub('taskqueue').get_filtered_tasks(
+            url='/tasks/update_organizer_display_name')), 1)
+
+# - - - session validation - - - - - - - - - - - - - - - - - -
+
+class CreateSessionTest(ConferenceApiTestCase):
+
+    def createSession(self, form):
+        self.signIn(ORGANIZER)
+        form.websafeConferenceKey = self.wsck
+        return self.api.createSession(SESSION_POST_REQUEST.combined_message_class(
+            **dict((f.name, getattr(form, f.name)) for f in form.all_fields())))
+
+    def testCreateSession(self):
+        form = self.createSession(self.sessionForm())
+        self.assertEqual(form.date, '2016-05-01')
+        self.assertEqual(self.sessionCount(), 1)
+
+    def testMissingDateIsABadRequest(self):
+        self.assertRaises(endpoints.BadRequestException,
+                          self.createSession, self.sessionForm(date=None))
+        self.assertEqual(self.sessionCount(), 0)
+
+    def testMalformedDateIsABadRequest(self):
+        for fields in [{'date': '2016-05-01'}, {'start_time': 'noon'}]:
+            self.assertRaises(endpoints.BadRequestException,
+                              self.createSession, self.sessionForm(**fields))
+        self.assertEqual(self.sessionCount(), 0)
+
+    def testMissingNameIsABadRequest(self):
+        self.assertRaises(endpoints.BadRequestException,
+                          self.createSession, self.sessionForm(name=None))
+
+    def testCreateSessions(self):
+        forms = self.createSessions([self.sessionForm(name='Session %d' % i)
+                                     for i in range(3)])
+        self.assertEqual(len(forms.items), 3)
+        self.assertEqual(self.sessionCount(), 3)
+
+    def testSessionsAreValidatedBeforeAnyIsWritten(self):
+        forms = [self.sessionForm(), self.sessionForm(date=None)]
+        self.assertRaises(endpoints.BadRequestException,
+                          self.createSessions, forms)
+        self.assertEqual(self.sessionCount(), 0)
+
+    def testOnlyTheOrganizerCreatesSessions(self):
+        self.signIn('someone-else')
+        self.assertRaises(endpoints.UnauthorizedException, self.api.createSession,
+                          SESSION_POST_REQUEST.combined_message_class(
+                              websafeConferenceKey=self.wsck, name='Session',
+                              date='05/01/2016', start_time='10:00'))
+
+# - - - speaker & type lookups - - - - - - - - - - - - - - - - -
+
+class SessionLookupTest(ConferenceApiTestCase):
+
+    def setUp(self):
+        super(SessionLookupTest, self).setUp()
+        self.createSessions([
+            self.sessionForm(name='Keynote', speakers=['Ada Lovelace'],
+                             typeOfSession='Keynote'),
+            self.sessionForm(name='Workshop', speakers=['ada  LOVELACE', 'Grace'],
+                             typeOfSession='Hands-on Workshop'),
+            self.sessionForm(name='Talk', speakers=['Grace'], typeOfSession='talk'),
+        ])
+
+    def bySpeaker(self, speaker):
+        return [form.name for form in self.api.getSessionsBySpeaker(
+            SESSION_SPEAKER_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, speaker=speaker)).items]
+
+    def byType(self, typeOfSession):
+        return [form.name for form in self.api.getConferenceSessionsByType(
+            SESSION_TYPE_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, typeOfSession=typeOfSession)).items]
+
+    def testSpeakerIgnoresCaseAndSpacing(self):
+        self.assertEqual(self.bySpeaker('ADA lovelace '), ['Keynote', 'Workshop'])
+        self.assertEqual(self.bySpeaker('grace'), ['Talk', 'Workshop'])
+        self.assertEqual(self.bySpeaker('Ada'), [])
+
+    def testTypeIgnoresCaseAndSpacing(self):
+        self.assertEqual(self.byType('TALK'), ['Talk'])
+        self.assertEqual(self.byType('hands-on   workshop'), ['Workshop'])
+
+    def testSpeakersAreStoredAsGiven(self):
+        session = Session.query(Session.name == 'Workshop').get()
+        self.assertEqual(session.speakers, ['ada  LOVELACE', 'Grace'])
+        self.assertEqual(session.normalized_speakers, ['ada lovelace', 'grace'])
+
+# - - - paging - - - - - - - - - - - - - - - - - - - - - - - -
+
+class PagingTest(ConferenceApiTestCase):
+
+    def setUp(self):
+        super(PagingTest, self).setUp()
+        self.createSessions([self.sessionForm(name='Session %02d' % i,
+                                              duration=i * 10)
+                             for i in range(7)])
+        self.signIn(ORGANIZER)
+        for i in range(6):
+            self.api.createConference(ConferenceForm(
+                name='More %d' % i, city='London', maxAttendees=i))
+
+    def pages(self, call, request_class, page_size, **fields):
+        """Page through call; return the names and number of pages."""
+        names, token, pages = [], None, 0
+        while True:
+            forms = call(request_class(pageSize=page_size, pageToken=token, **fields))
+            self.assertLessEqual(len(forms.items), page_size)
+            names.extend(form.name for form in forms.items)
+            pages += 1
+            token = forms.nextPageToken
+            if not token:
+                return names, pages
+
+    def testQueryConferences(self):
+        filters = [ConferenceQueryForm(field='CITY', operator='EQ', value='London')]
+        names, pages = self.pages(self.api.queryConferences, ConferenceQueryForms, 3,
+                                  filters=filters)
+        self.assertEqual(names, ['Conference'] + ['More %d' % i for i in range(6)])
+        self.assertEqual(pages, 3)
+
+    def testQuerySessions(self):
+        filters = [SessionQueryForm(field='DURATION', operator='GT', value='15')]
+        names, _ = self.pages(self.api.querySessions, SessionQueryForms, 2,
+                              filters=filters)
+        self.assertEqual(names, ['Session %02d' % i for i in range(2, 7)])
+
+    def testGetConferenceSessions(self):
+        names, pages = self.pages(self.api.getConferenceSessions,
+                                  SESSION_ETAG_GET_REQUEST.combined_message_class,
+                                  3, websafeConferenceKey=self.wsck)
+        self.assertEqual(sorted(names), ['Session %02d' % i for i in range(7)])
+        self.assertEqual(pages, 3)
+
+    def testPageSizeIsClamped(self):
+        forms = self.api.queryConferences(ConferenceQueryForms(pageSize=0))
+        self.assertEqual(len(forms.items), min(7, DEFAULT_PAGE_SIZE))
+        self.assertLessEqual(len(self.api.queryConferences(
+            ConferenceQueryForms(pageSize=MAX_PAGE_SIZE + 1)).items), MAX_PAGE_SIZE)
+
+    def testInvalidPageToken(self):
+        self.assertRaises(endpoints.BadRequestException, self.api.queryConferences,
+                          ConferenceQueryForms(pageToken='garbage'))
+
+# - - - read pipelines - - - - - - - - - - - - - - - - - - - -
+
+class ReadPipelineTest(ConferenceApiTestCase):
+
+    def setUp(self):
+        super(ReadPipelineTest, self).setUp()
+        self.recorder = harness.RpcRecorder().attach()
+
+    def addConferences(self, count):
+        """Create count conferences by new organizers and register the
+        attendee for them."""
+        for i in range(count):
+            organizer = 'organizer-%d' % self.requests
+            self.signIn(organizer)
+            self.api.saveProfile(ProfileMiniForm(displayName=organizer.title()))
+            self.signIn(organizer)
+            self.api.createConference(ConferenceForm(
+                name='By %s' % organizer, maxAttendees=10))
+            conf_key = Conference.query(
+                ancestor=ndb.Key(Profile, organizer)).get(keys_only=True)
+            self.signIn('attendee')
+            self.api.registerForConference(CONF_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=conf_key.urlsafe()))
+
+    def attending(self):
+        """Return getConferencesToAttend's forms and the RPCs it made."""
+        self.signIn('attendee')
+        self.api._getProfileFromUser()
+        self.recorder.reset()
+        forms = self.api.getConferencesToAttend(PAGE_GET_REQUEST.combined_message_class())
+        return forms, self.recorder.total()
+
+    def testConferencesToAttend(self):
+        self.addConferences(3)
+        forms, _ = self.attending()
+        self.assertEqual(len(forms.items), 3)
+        for form in forms.items:
+            self.assertEqual(form.seatsAvailable, 9)
+            self.assertEqual(form.organizerDisplayName,
+                             form.name[len('By '):].title())
+
+    def testOldConferencesGetTheirOrganizerName(self):
+        self.addConferences(1)
+        forms, _ = self.attending()
+        conf = ndb.Key(urlsafe=forms.items[0].websafeKey).get()
+        conf.organizerDisplayName = None
+        conf.put()
+        forms, _ = self.attending()
+        self.assertEqual(forms.items[0].organizerDisplayName,
+                         conf.organizerUserId.title())
+
+    def testCallsDoNotGrowWithThePage(self):
+        self.addConferences(2)
+        _, calls = self.attending()
+        self.addConferences(4)
+        forms, more_calls = self.attending()
+        self.assertEqual(len(forms.items), 6)
+        self.assertEqual(more_calls, calls)
+
+# - - - in-band revalidation - - - - - - - - - - - - - - - - - -
+
+class NotModifiedTest(ConferenceApiTestCase):
+
+    def getConference(self, etag=None):
+        return self.api.getConference(CONF_ETAG_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck, ifNoneMatch=etag))
+
+    def getSessions(self, etag=None):
+        return self.api.getConferenceSessions(
+            SESSION_ETAG_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, ifNoneMatch=etag))
+
+    def getFeaturedSpeaker(self, etag=None):
+        return self.api.getFeaturedSpeaker(
+            FEATURED_SPEAKER_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, ifNoneMatch=etag))
+
+    def assertRevalidates(self, get):
+        """Check get() is answered in full, then notModified given its
+        etag; return the etag."""
+        form = get()
+        self.assertTrue(form.etag)
+        self.assertFalse(form.notModified)
+        again = get(form.etag)
+        self.assertTrue(again.notModified)
+        self.assertEqual(again.etag, form.etag)
+        return form.etag
+
+    def testGetConference(self):
+        etag = self.assertRevalidates(self.getConference)
+        self.assertEqual(self.getConference(etag).name, None)
+        self.assertEqual(self.getConference('"other"').name, 'Conference')
+
+    def testEtagList(self):
+        etag = self.getConference().etag
+        self.assertTrue(self.getConference('"other", %s' % etag).notModified)
+
+    def testUpdateChangesTheEtag(self):
+        etag = self.assertRevalidates(self.getConference)
+        self.signIn(ORGANIZER)
+        self.api.updateConference(CONF_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck, name='Renamed'))
+        form = self.getConference(etag)
+        self.assertFalse(form.notModified)
+        self.assertEqual(form.name, 'Renamed')
+
+    def testSessionWriteChangesTheEtags(self):
+        conf_etag = self.getConference().etag
+        sessions_etag = self.assertRevalidates(self.getSessions)
+        self.createSessions([self.sessionForm()])
+        self.assertFalse(self.getConference(conf_etag).notModified)
+        self.assertEqual(len(self.getSessions(sessions_etag).items), 1)
+
+    def testGetAnnouncement(self):
+        self.assertRevalidates(lambda etag=None: self.api.getAnnouncement(
+            ETAG_GET_REQUEST.combined_message_class(ifNoneMatch=etag)))
+
+    def testGetFeaturedSpeaker(self):
+        self.createSessions([self.sessionForm(name='Talk %d' % i) for i in range(2)])
+        self.api._cacheConferenceFeaturedSpeaker(self.wsck)
+        etag = self.assertRevalidates(self.getFeaturedSpeaker)
+        self.assertIn('Ada', self.getFeaturedSpeaker().featured_speaker_str)
+        self.assertTrue(self.getFeaturedSpeaker(etag).notModified)
+
+    def testUnchangedFeaturedSpeakerKeepsTheVersion(self):
+        self.createSessions([self.sessionForm(name='Talk %d' % i) for i in range(2)])
+        self.api._cacheConferenceFeaturedSpeaker(self.wsck)
+        version = versions.get(versions.CONFERENCE, self.wsck)
+        self.api._cacheConferenceFeaturedSpeaker(self.wsck)
+        self.api._cacheConferenceFeaturedSpeaker(self.wsck, repair=True)
+        self.assertEqual(versions.get(versions.CONFERENCE, self.wsck), version)
+
+        self.createSessions([self.sessionForm(name='Talk 2')])
+        version = versions.get(versions.CONFERENCE, self.wsck)
+        self.api._cacheConferenceFeaturedSpeaker(self.wsck)
+        self.assertNotEqual(versions.get(versions.CONFERENCE, self.wsck), version)
+
+
+if __name__ == '__main__':
+    unittest.main()
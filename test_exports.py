@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""test_exports.py
+
+Tests for exports.py and the schedule export handler in main.py:
+iCalendar and CSV rendering, caching and conditional GETs
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import csv
+import datetime
+import StringIO
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import webapp2
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import exports
+import main
+from models import Conference, Session
+import versions
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.conf = Conference(name='PyCon', city='Montreal')
+        self.conf.put()
+        self.wsck = self.conf.key.urlsafe()
+        self.sessions = [
+            self.session('Keynote', datetime.date(2016, 5, 2), datetime.time(9, 0),
+                         highlights=u'Caf\xe9, tea; and\nmore', speakers=['Ada', 'Grace']),
+            self.session('Opening', datetime.date(2016, 5, 1), datetime.time(17, 30)),
+            self.session('Breakfast', datetime.date(2016, 5, 2), datetime.time(8, 0)),
+        ]
+        ndb.put_multi(self.sessions)
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def session(self, name, date, start_time, **fields):
+        return Session(parent=self.conf.key, name=name, date=date,
+                       start_time=start_time, duration=45,
+                       typeOfSession='Talk', **fields)
+
+# - - - rendering - - - - - - - - - - - - - - - - - - - - - - -
+
+class RenderTest(ExportTestCase):
+
+    def render(self, fmt):
+        return ''.join(exports.RENDERERS[fmt](
+            self.conf, exports.sessionsInOrder(self.conf.key),
+            datetime.datetime(2016, 4, 1)))
+
+    def testIcsListsEverySessionInOrder(self):
+        ics = self.render('ics')
+        self.assertTrue(ics.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(ics.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(ics.count('BEGIN:VEVENT'), 3)
+        starts = [line for line in ics.split('\r\n') if line.startswith('DTSTART')]
+        self.assertEqual(starts, ['DTSTART:20160501T173000',
+                                  'DTSTART:20160502T080000',
+                                  'DTSTART:20160502T090000'])
+        self.assertIn('X-WR-CALNAME:PyCon', ics)
+        self.assertIn('LOCATION:Montreal', ics)
+
+    def testIcsEscapesAndFolds(self):
+        ics = self.render('ics')
+        unfolded = ics.replace('\r\n ', '')
+        self.assertIn('DESCRIPTION:Caf\xc3\xa9\\, tea\\; and\\nmore\\n\\nSpeakers: Ada\\, Grace',
+                      unfolded)
+        self.assertTrue(all(len(line) <= exports.ICS_LINE_LENGTH
+                            for line in ics.split('\r\n')))
+
+    def testCsv(self):
+        rows = list(csv.reader(StringIO.StringIO(self.render('csv'))))
+        self.assertEqual(tuple(rows[0]), exports.CSV_COLUMNS)
+        self.assertEqual([row[3] for row in rows[1:]],
+                         ['Opening', 'Breakfast', 'Keynote'])
+        self.assertEqual(rows[3][5], 'Ada; Grace')
+
+    def testCsvIsChunkedByBatch(self):
+        saved = exports.EXPORT_BATCH_SIZE
+        exports.EXPORT_BATCH_SIZE = 2
+        self.addCleanup(setattr, exports, 'EXPORT_BATCH_SIZE', saved)
+        chunks = list(exports.renderCsv(
+            self.conf, exports.sessionsInOrder(self.conf.key), None))
+        self.assertEqual(len(chunks), 2)
+
+# - - - ExportScheduleHandler - - - - - - - - - - - - - - - - -
+
+class ExportScheduleHandlerTest(ExportTestCase):
+
+    def get(self, fmt='ics', **headers):
+        return webapp2.Request.blank(
+            '/export/conference/%s/schedule.%s' % (self.wsck, fmt),
+            headers=headers).get_response(main.app)
+
+    def testExport(self):
+        response = self.get()
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.content_type, 'text/calendar')
+        self.assertEqual(response.body.count('BEGIN:VEVENT'), 3)
+        rows = list(csv.reader(StringIO.StringIO(self.get('csv').body)))
+        self.assertEqual(len(rows), 4)
+
+    def testUnknownConference(self):
+        self.wsck = 'not-a-key'
+        self.assertEqual(self.get().status_int, 404)
+        self.wsck = ndb.Key(Session, 1).urlsafe()
+        self.assertEqual(self.get().status_int, 404)
+
+    def testConditionalGet(self):
+        etag = self.get().etag
+        self.assertEqual(self.get(**{'If-None-Match': '"%s"' % etag}).status_int, 304)
+        self.assertEqual(self.get(**{'If-None-Match': '"other"'}).status_int, 200)
+
+    def testExportIsCached(self):
+        body = self.get().body
+        Session(parent=self.conf.key, name='Unseen', date=datetime.date(2016, 5, 3)).put()
+        self.assertEqual(self.get().body, body)
+
+    def testSessionWriteChangesTheExport(self):
+        etag = self.get().etag
+        Session(parent=self.conf.key, name='Closing', date=datetime.date(2016, 5, 3)).put()
+        versions.bump(versions.SESSIONS, self.wsck)
+        response = self.get(**{'If-None-Match': '"%s"' % etag})
+        self.assertEqual(response.status_int, 200)
+        self.assertIn('SUMMARY:Closing', response.body)
+
+    def testConferenceWriteChangesTheExport(self):
+        etag = self.get().etag
+        self.conf.name = 'PyCon 2016'
+        self.conf.put()
+        versions.bump(versions.CONFERENCE, self.wsck)
+        response = self.get(**{'If-None-Match': '"%s"' % etag})
+        self.assertEqual(response.status_int, 200)
+        self.assertNotEqual(response.etag, etag)
+        self.assertIn('X-WR-CALNAME:PyCon 2016', response.body)
+
+    def testExportIsRenderedAgainAfterEviction(self):
+        self.get()
+        memcache.flush_all()
+        self.assertEqual(self.get().body.count('BEGIN:VEVENT'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""test_generator.py
+
+Tests for benchmarks/generator.py: the synthetic data set the endpoint
+benchmarks run against
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from benchmarks import generator
+from models import Conference, Registration, Session, WishlistEntry
+import seats
+import speaker_tally
+
+
+class GeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def generate(self, seed=0):
+        return generator.generate(20, 4, 5, seed=seed,
+                                  registrations_per_profile=2,
+                                  wishlist_per_profile=3)
+
+    def snapshot(self):
+        return ([(c.key, c.city, c.startDate, c.topics) for c in Conference.query()],
+                [(s.key, s.speakers, s.start_time) for s in Session.query()],
+                sorted(r.key for r in Registration.query()),
+                sorted(e.key for e in WishlistEntry.query()))
+
+    def testCounts(self):
+        data = self.generate()
+        self.assertEqual([len(data[name]) for name in
+                          ('profiles', 'organizers', 'conferences', 'sessions')],
+                         [20, 2, 4, 20])
+        self.assertEqual(Registration.query().count(), 20 * 2)
+        self.assertEqual(WishlistEntry.query().count(), 20 * 3)
+
+    def testConferencesAreReady(self):
+        data = self.generate()
+        for conf in Conference.query():
+            self.assertIn(conf.key.parent(), data['organizers'])
+            self.assertEqual(seats.getSeatsAvailable(conf), conf.maxAttendees)
+            self.assertEqual(speaker_tally.tallyKey(conf.key).get().sessions,
+                             speaker_tally.rebuildTally(conf.key).sessions)
+
+    def testSameSeedSameData(self):
+        self.generate(seed=7)
+        first = self.snapshot()
+        self.tb.deactivate()
+        self.tb = harness.setUpTestbed()
+        self.generate(seed=7)
+        self.assertEqual(self.snapshot(), first)
+
+    def testOtherSeedOtherData(self):
+        self.generate(seed=1)
+        first = self.snapshot()
+        self.tb.deactivate()
+        self.tb = harness.setUpTestbed()
+        self.generate(seed=2)
+        self.assertNotEqual(self.snapshot()[:2], first[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""test_importer.py
+
+Tests for importer.py and its handlers in main.py: parsing uploads,
+per-row errors and the chained chunk tasks
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import json
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import webapp2
+from google.appengine.ext import ndb
+
+import importer
+import main
+from models import Conference, ImportJob, Profile, Session
+from test_main import TaskTestCase
+
+CSV_HEADER = ','.join(importer.SESSION_COLUMNS) + '\n'
+
+
+def _row(name, date='05/01/2016', start_time='10:00', **fields):
+    row = {'name': name, 'date': date, 'start_time': start_time,
+           'speakers': ['Ada']}
+    row.update(fields)
+    return row
+
+# - - - parsing - - - - - - - - - - - - - - - - - - - - - - - -
+
+class ParseFileTest(unittest.TestCase):
+
+    def testJson(self):
+        conf, rows = importer.parseFile(json.dumps(
+            {'conference': {'name': 'PyCon'}, 'sessions': [_row('Keynote')]}), 'json')
+        self.assertEqual(conf, {'name': 'PyCon'})
+        self.assertEqual(rows[0]['name'], 'Keynote')
+
+    def testCsv(self):
+        conf, rows = importer.parseFile(
+            CSV_HEADER + 'Caf\xc3\xa9,,Ada; Grace,30,Talk,05/01/2016,10:00\n', 'csv')
+        self.assertIsNone(conf)
+        self.assertEqual(rows[0]['name'], u'Caf\xe9')
+        self.assertEqual(rows[0]['speakers'], [u'Ada', u'Grace'])
+
+    def testInvalidUploads(self):
+        for data, fmt in [('{', 'json'), ('[]', 'json'),
+                          ('{"sessions": {}}', 'json'),
+                          (CSV_HEADER + 'Caf\xe9,,,,,05/01/2016,10:00\n', 'csv'),
+                          ('', 'xml')]:
+            self.assertRaises(importer.InvalidImport, importer.parseFile, data, fmt)
+
+# - - - jobs - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class ImportJobTest(TaskTestCase):
+
+    def setUp(self):
+        super(ImportJobTest, self).setUp()
+        self.saved_chunk_size = importer.IMPORT_CHUNK_SIZE
+        importer.IMPORT_CHUNK_SIZE = 2
+        self.prof = Profile(key=ndb.Key(Profile, 'org'), displayName='Organizer')
+        self.conf = Conference(parent=self.prof.key, name='PyCon',
+                               organizerUserId='org', organizerDisplayName='Organizer')
+        ndb.put_multi([self.prof, self.conf])
+
+    def tearDown(self):
+        importer.IMPORT_CHUNK_SIZE = self.saved_chunk_size
+        super(ImportJobTest, self).tearDown()
+
+    def runImport(self, rows, **kwargs):
+        kwargs.setdefault('websafeConferenceKey', self.conf.key.urlsafe())
+        job = importer.startJob(json.dumps({'sessions': rows}), 'json', **kwargs)
+        self.runTasks('/tasks/import_chunk')
+        self.runTasks('/tasks/import_finish')
+        return job.key.get()
+
+    def sessionNames(self, conf_key=None):
+        return sorted(s.name for s in Session.query(
+            ancestor=conf_key or self.conf.key))
+
+    def testImport(self):
+        job = self.runImport([_row('Session %d' % i) for i in range(5)])
+        self.assertEqual((job.status, job.chunkCount, job.chunksDone), ('done', 3, 3))
+        self.assertEqual(job.rowsImported, 5)
+        self.assertEqual(self.sessionNames(), ['Session %d' % i for i in range(5)])
+        session = Session.query(ancestor=self.conf.key).get()
+        self.assertEqual(session.organizer_display_name, 'Organizer')
+
+    def testImportWithItsOwnConference(self):
+        job = importer.startJob(json.dumps({
+            'conference': {'name': 'New', 'startDate': '2016-05-01',
+                           'maxAttendees': '10'},
+            'sessions': [_row('Keynote')]}), 'json', organizer_user_id='org')
+        self.runTasks('/tasks/import_chunk')
+        conf = job.conference.get()
+        self.assertEqual((conf.name, conf.month, conf.maxAttendees), ('New', 5, 10))
+        self.assertEqual(self.sessionNames(conf.key), ['Keynote'])
+
+    def testBadRowsAreReportedAndTheRestImported(self):
+        job = self.runImport([
+            _row('Good 1'),
+            _row('No date', date=''),
+            _row(u'Bad date \xe9', date=u'1er mai'),
+            _row('x' * 2000),
+            'not an object',
+            _row('Bad duration', duration='long'),
+            _row('Good 2'),
+        ])
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(self.sessionNames(), ['Good 1', 'Good 2'])
+        self.assertEqual(job.rowsImported, 2)
+        self.assertEqual(job.errorCount, 5)
+        self.assertEqual([e['row'] for e in job.errors], [2, 3, 4, 5, 6])
+        self.assertIn(u'\xe9', job.errors[1]['error'])
+
+    def testChunkIsNotWrittenTwice(self):
+        job = importer.startJob(json.dumps({'sessions': [_row('Once')]}), 'json',
+                                websafeConferenceKey=self.conf.key.urlsafe())
+        self.assertIsNone(importer.processChunk(job.key, 1))
+        self.assertIsNone(importer.processChunk(job.key, 1))
+        self.assertEqual(self.sessionNames(), ['Once'])
+
+    def testStatus(self):
+        job = self.runImport([_row('Keynote'), _row('No date', date='')])
+        response = self.request('/admin/import/%s' % job.key.urlsafe())
+        self.assertEqual(response.status_int, 200)
+        status = json.loads(response.body)
+        self.assertEqual((status['status'], status['rowsImported'], status['errorCount']),
+                         ('done', 1, 1))
+
+    def testStatusOfMalformedOrUnknownJob(self):
+        for job_key in ['garbage', self.conf.key.urlsafe(),
+                        ndb.Key(ImportJob, 12345).urlsafe()]:
+            self.assertEqual(
+                self.request('/admin/import/%s' % job_key).status_int, 404)
+
+    def testUpload(self):
+        response = webapp2.Request.blank('/admin/import', POST={
+            'websafeConferenceKey': self.conf.key.urlsafe(),
+            'file': ('program.csv',
+                     CSV_HEADER + 'Keynote,,Ada,30,Talk,05/01/2016,10:00\n'),
+        }).get_response(main.app)
+        self.assertEqual(response.status_int, 202)
+        self.runTasks('/tasks/import_chunk')
+        self.assertEqual(self.sessionNames(), ['Keynote'])
+
+    def testUploadOfBadlyEncodedCsv(self):
+        response = webapp2.Request.blank('/admin/import', POST={
+            'websafeConferenceKey': self.conf.key.urlsafe(),
+            'file': ('program.csv',
+                     CSV_HEADER + 'Caf\xe9,,Ada,30,Talk,05/01/2016,10:00\n'),
+        }).get_response(main.app)
+        self.assertEqual(response.status_int, 400)
+        self.assertIn('not UTF-8', response.body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""test_instrumentation.py
+
+Tests for instrumentation.py: per-request RPC counts, the stats log line
+and header, and sampling
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import json
+import logging
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import webapp2
+from google.appengine.api import memcache
+
+import instrumentation
+
+
+def _app(environ, start_response):
+    memcache.set('a', 1)
+    memcache.get('a')
+    memcache.get('b')
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return ['ok']
+
+
+class _Records(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(record.getMessage())
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.records = _Records()
+        logging.getLogger().addHandler(self.records)
+        self.addCleanup(logging.getLogger().removeHandler, self.records)
+        self.addCleanup(logging.getLogger().setLevel, logging.getLogger().level)
+        logging.getLogger().setLevel(logging.INFO)
+        self.addCleanup(setattr, instrumentation, 'INSTRUMENTATION_HEADER',
+                        instrumentation.INSTRUMENTATION_HEADER)
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def call(self, path, sample_rate=1.0, **headers):
+        app = instrumentation.InstrumentationMiddleware(_app, sample_rate=sample_rate)
+        return webapp2.Request.blank(path, headers=headers).get_response(app)
+
+    def summaries(self):
+        return [json.loads(line[len('rpc_stats '):])
+                for line in self.records.lines if line.startswith('rpc_stats ')]
+
+    def testSummaryIsLogged(self):
+        self.call('/_ah/spi/ConferenceApi.getProfile')
+        summary, = self.summaries()
+        self.assertEqual(summary['request'], 'ConferenceApi.getProfile')
+        self.assertEqual(summary['rpcs']['memcache.Get']['count'], 2)
+        self.assertEqual(summary['rpcs']['memcache.Set']['count'], 1)
+        self.assertEqual(summary['rpc_count'], 3)
+        self.assertIn('hits', summary['query_cache'])
+        self.assertIn('auth_cache', summary)
+        self.assertNotIn('task', summary)
+
+    def testTaskName(self):
+        self.call('/tasks/send_confirmation_email', X_AppEngine_TaskName='task-1')
+        summary, = self.summaries()
+        self.assertEqual((summary['request'], summary['task']),
+                         ('/tasks/send_confirmation_email', 'task-1'))
+
+    def testHeader(self):
+        self.assertNotIn(instrumentation.STATS_HEADER, self.call('/').headers)
+        instrumentation.INSTRUMENTATION_HEADER = True
+        header = self.call('/').headers[instrumentation.STATS_HEADER]
+        self.assertEqual([part.split('=')[0] for part in header.split(';')],
+                         ['memcache.Get', 'memcache.Set'])
+        self.assertTrue(header.startswith('memcache.Get=2/'))
+
+    def testUnsampledRequestsAreNotRecorded(self):
+        self.assertEqual(self.call('/', sample_rate=0).body, 'ok')
+        self.assertEqual(self.summaries(), [])
+
+    def testRpcsOutsideARequestAreNotCounted(self):
+        self.call('/')
+        memcache.get('c')
+        self.assertIsNone(instrumentation._current())
+        self.assertEqual(self.summaries()[0]['rpc_count'], 3)
+
+    def testInstallIsIdempotent(self):
+        instrumentation.install()
+        instrumentation.install()
+        self.call('/')
+        self.assertEqual(self.summaries()[0]['rpcs']['memcache.Set']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
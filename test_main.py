@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+"""test_main.py
+
+Tests for main.py: the task handlers, run through the webapp2 app with
+the tasks they enqueue drained from the taskqueue stub
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import datetime
+import unittest
+import urllib
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import webapp2
+from google.appengine.api import datastore
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import announcements
+import main
+from main import MEMCACHE_FEATURED_SPEAKER_REFRESH_KEY
+from conference import MEMCACHE_FEATURED_SPEAKER_KEY
+from models import Conference, Profile, Registration, Session, WishlistEntry
+import query_cache
+import seats
+import speaker_tally
+import search_index
+import versions
+
+
+class TaskTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.taskqueue = self.tb.get_stub('taskqueue')
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def post(self, url, **params):
+        response = self.request(url, urllib.urlencode(params))
+        self.assertLess(response.status_int, 300, response.body)
+        return response
+
+    def request(self, url, body=None, **kwargs):
+        """Send url through main.app (a POST of body, if given)."""
+        if body is not None:
+            kwargs.update(POST=body, headers={
+                'Content-Type': 'application/x-www-form-urlencoded'})
+        return webapp2.Request.blank(url, **kwargs).get_response(main.app)
+
+    def runTasks(self, url):
+        """Run the queued tasks for url, and those they add, until none
+        are left; return how many ran."""
+        ran = 0
+        while True:
+            queued = self.taskqueue.get_filtered_tasks(url=url)
+            if not queued:
+                return ran
+            for task in queued:
+                self.taskqueue.DeleteTask('default', task.name)
+                response = self.request(url, task.payload)
+                self.assertLess(response.status_int, 300, response.body)
+                ran += 1
+
+# - - - organizer display name - - - - - - - - - - - - - - - -
+
+class OrganizerDisplayNameTest(TaskTestCase):
+
+    def setUp(self):
+        super(OrganizerDisplayNameTest, self).setUp()
+        self.saved_batch_size = main.ORGANIZER_NAME_BATCH_SIZE
+        main.ORGANIZER_NAME_BATCH_SIZE = 2
+        self.prof = Profile(key=ndb.Key(Profile, 'org'), displayName='Old')
+        self.confs = [Conference(parent=self.prof.key, name='Conference %d' % i,
+                                 organizerUserId='org',
+                                 organizerDisplayName='Old')
+                      for i in range(3)]
+        ndb.put_multi([self.prof] + self.confs)
+        self.sessions = [Session(parent=conf.key, name='Session',
+                                 date=datetime.date(2016, 5, 1),
+                                 organizer_user_id='org',
+                                 organizer_display_name='Old')
+                         for conf in self.confs]
+        ndb.put_multi(self.sessions)
+
+    def tearDown(self):
+        main.ORGANIZER_NAME_BATCH_SIZE = self.saved_batch_size
+        super(OrganizerDisplayNameTest, self).tearDown()
+
+    def rename(self, name):
+        self.prof.displayName = name
+        self.prof.put()
+        self.post('/tasks/update_organizer_display_name', userId='org')
+        return 1 + self.runTasks('/tasks/update_organizer_display_name')
+
+    def testRenameReachesEveryConferenceAndSession(self):
+        # two batches of Conferences, then two of Sessions
+        self.assertEqual(self.rename('New'), 4)
+        self.assertEqual(set(c.organizerDisplayName
+                             for c in ndb.get_multi([c.key for c in self.confs])),
+                         set(['New']))
+        self.assertEqual(set(s.organizer_display_name
+                             for s in ndb.get_multi([s.key for s in self.sessions])),
+                         set(['New']))
+
+    def testRenameInvalidatesCachedConferences(self):
+        generation = query_cache.generation()
+        wsck = self.confs[0].key.urlsafe()
+        version = versions.get(versions.CONFERENCE, wsck)
+        self.rename('New')
+        self.assertNotEqual(query_cache.generation(), generation)
+        self.assertNotEqual(versions.get(versions.CONFERENCE, wsck), version)
+
+    def testUnchangedNameWritesNothing(self):
+        generation = query_cache.generation()
+        self.rename('Old')
+        self.assertEqual(query_cache.generation(), generation)
+
+    def testUnknownOrganizer(self):
+        self.assertEqual(self.post('/tasks/update_organizer_display_name',
+                                   userId='nobody').status_int, 204)
+
+# - - - featured speaker refresh - - - - - - - - - - - - - - -
+
+class FeaturedSpeakerRefreshTest(TaskTestCase):
+
+    def setUp(self):
+        super(FeaturedSpeakerRefreshTest, self).setUp()
+        self.saved_sizes = (main.FEATURED_SPEAKER_REFRESH_PAGE_SIZE,
+                            main.FEATURED_SPEAKER_REFRESH_BATCH_SIZE)
+        main.FEATURED_SPEAKER_REFRESH_PAGE_SIZE = 4
+        main.FEATURED_SPEAKER_REFRESH_BATCH_SIZE = 3
+        self.conf_keys = ndb.put_multi(
+            [Conference(name='Conference %d' % i) for i in range(9)])
+        for i, conf_key in enumerate(self.conf_keys):
+            speaker_tally.putSessions(conf_key, [Session(
+                parent=conf_key, id=1, name='Talk', speakers=['Speaker %d' % i],
+                date=datetime.date(2016, 5, 1))])
+
+    def tearDown(self):
+        (main.FEATURED_SPEAKER_REFRESH_PAGE_SIZE,
+         main.FEATURED_SPEAKER_REFRESH_BATCH_SIZE) = self.saved_sizes
+        super(FeaturedSpeakerRefreshTest, self).tearDown()
+
+    def featured(self, conf_key):
+        return memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY % conf_key.urlsafe())
+
+    def refresh(self):
+        self.assertEqual(self.request('/crons/refresh_featured_speaker_cache').status_int, 204)
+        pages = self.runTasks('/tasks/refresh_featured_speakers_page')
+        batches = self.runTasks('/tasks/refresh_featured_speakers_batch')
+        return pages, batches
+
+    def testEveryConferenceIsRefreshed(self):
+        memcache.set('unrelated', 'kept')
+        # 9 conferences: pages of 4, 4 and 1, in batches of up to 3
+        self.assertEqual(self.refresh(), (3, 5))
+        for i, conf_key in enumerate(self.conf_keys):
+            self.assertIn('Speaker %d' % i, self.featured(conf_key))
+        self.assertEqual(memcache.get('unrelated'), 'kept')
+
+    def testRefreshRepairsAMissingTally(self):
+        speaker_tally.tallyKey(self.conf_keys[0]).delete()
+        self.refresh()
+        self.assertIn('Speaker 0', self.featured(self.conf_keys[0]))
+
+    def testRetriedPageDoesNotEnqueueBatchesTwice(self):
+        params = {'run': 'r1', 'page': 0}
+        self.post('/tasks/refresh_featured_speakers_page', **params)
+        self.post('/tasks/refresh_featured_speakers_page', **params)
+        self.assertEqual(len(self.taskqueue.get_filtered_tasks(
+            url='/tasks/refresh_featured_speakers_batch')), 2)
+        self.runTasks('/tasks/refresh_featured_speakers_batch')
+        self.assertEqual(memcache.get(MEMCACHE_FEATURED_SPEAKER_REFRESH_KEY % 'r1'), 4)
+
+# - - - normalized session fields - - - - - - - - - - - - - - -
+
+class NormalizeSessionsTest(TaskTestCase):
+
+    def testBackfill(self):
+        saved = main.NORMALIZE_SESSIONS_BATCH_SIZE
+        main.NORMALIZE_SESSIONS_BATCH_SIZE = 2
+        self.addCleanup(setattr, main, 'NORMALIZE_SESSIONS_BATCH_SIZE', saved)
+        # Sessions as written before their normalized fields existed
+        legacy = []
+        for i in range(5):
+            entity = datastore.Entity('Session')
+            entity.update({'name': 'Talk %d' % i, 'speakers': ['Ada LOVELACE'],
+                           'typeOfSession': 'Talk',
+                           'date': datetime.datetime(2016, 5, 1)})
+            legacy.append(entity)
+        datastore.Put(legacy)
+        query = Session.query(Session.normalized_speakers == 'ada lovelace')
+        self.assertEqual(query.count(), 0)
+
+        self.assertEqual(self.request('/tasks/normalize_sessions').status_int, 202)
+        self.assertEqual(self.runTasks('/tasks/normalize_sessions'), 3)
+        self.assertEqual(query.count(), 5)
+        self.assertEqual(Session.query(Session.normalized_type == 'talk').count(), 5)
+
+# - - - search index - - - - - - - - - - - - - - - - - - - - -
+
+class IndexDocumentsTest(TaskTestCase):
+
+    def search(self, query):
+        hits, _ = search_index.searchDocuments('Conference', query, 10)
+        return [websafe_key for websafe_key, _ in hits]
+
+    def testIndexAndRemove(self):
+        conf = Conference(name='PyCon', city='Montreal', topics=['Python'],
+                          maxAttendees=100)
+        conf.put()
+        search_index.enqueueIndex([conf.key])
+        self.assertEqual(self.runTasks('/tasks/index_documents'), 1)
+        self.assertEqual(self.search('montreal'), [conf.key.urlsafe()])
+        self.assertEqual(self.search('topics:Python'), [conf.key.urlsafe()])
+
+        conf.key.delete()
+        search_index.enqueueIndex([conf.key])
+        self.runTasks('/tasks/index_documents')
+        self.assertEqual(self.search('montreal'), [])
+
+# - - - nearly sold out announcement - - - - - - - - - - - - -
+
+class ReconcileAnnouncementTest(TaskTestCase):
+
+    def setUp(self):
+        super(ReconcileAnnouncementTest, self).setUp()
+        self.saved_page_size = announcements.RECONCILE_PAGE_SIZE
+        announcements.RECONCILE_PAGE_SIZE = 2
+
+    def tearDown(self):
+        announcements.RECONCILE_PAGE_SIZE = self.saved_page_size
+        super(ReconcileAnnouncementTest, self).tearDown()
+
+    def conference(self, name, seats_left):
+        conf = Conference(name=name, maxAttendees=100, seatsAvailable=seats_left)
+        conf.put()
+        seats.setSeatsAvailable(conf.key, seats_left)
+        return conf
+
+    def reconcile(self):
+        self.post('/tasks/reconcile_announcement')
+        self.runTasks('/tasks/reconcile_announcement')
+        return memcache.get(announcements.MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    def testNearlySoldOutConferencesAreAnnounced(self):
+        for i in range(3):
+            self.conference('Nearly %d' % i, 3)
+        self.conference('Roomy', 50)
+        self.conference('Sold out', 0)
+        announcement = self.reconcile()
+        self.assertIn('Nearly 0, Nearly 1, Nearly 2', announcement)
+        self.assertNotIn('Roomy', announcement)
+        self.assertNotIn('Sold out', announcement)
+
+    def testStaleMembersArePruned(self):
+        conf = self.conference('Nearly', 3)
+        self.assertIn('Nearly', self.reconcile())
+        seats.changeSeatsAvailable(conf, 50)
+        self.assertIsNone(self.reconcile())
+
+    def testRegistrationsCrossingTheThreshold(self):
+        conf = self.conference('Nearly', announcements.NEARLY_SOLD_OUT_SEATS + 1)
+        version = versions.get(versions.ANNOUNCEMENT, versions.ANNOUNCEMENT_KEY)
+        seats.reserveSeat(conf, lambda: None, announcements.seatsChanged)
+        self.assertIn('Nearly', memcache.get(announcements.MEMCACHE_ANNOUNCEMENTS_KEY))
+        self.assertNotEqual(
+            versions.get(versions.ANNOUNCEMENT, versions.ANNOUNCEMENT_KEY), version)
+        seats.releaseSeat(conf, lambda: True, announcements.seatsChanged)
+        self.assertIsNone(memcache.get(announcements.MEMCACHE_ANNOUNCEMENTS_KEY))
+
+# - - - profile migrations - - - - - - - - - - - - - - - - - -
+
+class MigrateProfilesTest(TaskTestCase):
+
+    def setUp(self):
+        super(MigrateProfilesTest, self).setUp()
+        self.saved_batch_size = main.MIGRATE_PROFILES_BATCH_SIZE
+        main.MIGRATE_PROFILES_BATCH_SIZE = 2
+        conf_keys = ndb.put_multi([Conference(name='Conference %d' % i)
+                                   for i in range(2)])
+        self.wscks = [k.urlsafe() for k in conf_keys]
+        self.wssks = [ndb.Key(Session, i + 1, parent=conf_keys[0]).urlsafe()
+                      for i in range(2)]
+
+    def tearDown(self):
+        main.MIGRATE_PROFILES_BATCH_SIZE = self.saved_batch_size
+        super(MigrateProfilesTest, self).tearDown()
+
+    def testMigrateWishlistsInBatches(self):
+        ndb.put_multi([Profile(key=ndb.Key(Profile, 'user-%d' % i),
+                               wishlist_session_keys=self.wssks[:i % 3])
+                       for i in range(5)])
+        self.assertEqual(self.request('/tasks/migrate_wishlists').status_int, 202)
+        self.assertEqual(self.runTasks('/tasks/migrate_wishlists'), 3)
+        self.assertEqual(Profile.query(Profile.wishlist_session_keys > '').count(), 0)
+        self.assertEqual(WishlistEntry.query().count(), 1 + 2 + 1)
+        self.assertEqual(
+            sorted(e.session.urlsafe() for e in WishlistEntry.query(
+                ancestor=ndb.Key(Profile, 'user-2'))),
+            sorted(self.wssks))
+
+    def testMigrateRegistrations(self):
+        ndb.put_multi([Profile(key=ndb.Key(Profile, 'user-%d' % i),
+                               conferenceKeysToAttend=self.wscks[:i % 3])
+                       for i in range(5)])
+        self.assertEqual(self.request('/tasks/migrate_registrations').status_int, 202)
+        self.assertEqual(self.runTasks('/tasks/migrate_registrations'), 3)
+        self.assertEqual(Profile.query(Profile.conferenceKeysToAttend > '').count(), 0)
+        self.assertEqual(Registration.query().count(), 1 + 2 + 1)
+        self.assertEqual(Registration.query(
+            Registration.conference == ndb.Key(urlsafe=self.wscks[0])).count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
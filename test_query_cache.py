@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""test_query_cache.py
+
+Tests for query_cache.py: canonical cache keys, cached pages and their
+invalidation as conferences are written
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from conference import CONF_GET_REQUEST, CONF_POST_REQUEST
+from models import ConferenceForm, ConferenceForms
+from models import ConferenceQueryForm, ConferenceQueryForms
+import query_cache
+from test_conference import ConferenceApiTestCase, ORGANIZER
+
+
+def _filter(field, op, value):
+    return {'field': field, 'operator': op, 'value': value}
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def testFilterOrderAndRepeatsDoNotMatter(self):
+        city = _filter('city', '=', 'London')
+        month = _filter('month', '>', 6)
+        self.assertEqual(query_cache.cacheKey([city, month], 10, None, 1),
+                         query_cache.cacheKey([month, city, month], 10, None, 1))
+
+    def testKeyCoversFiltersPageAndVersion(self):
+        city = _filter('city', '=', 'London')
+        keys = set([
+            query_cache.cacheKey([city], 10, None, 1),
+            query_cache.cacheKey([_filter('city', '=', 'Paris')], 10, None, 1),
+            query_cache.cacheKey([_filter('city', '!=', 'London')], 10, None, 1),
+            query_cache.cacheKey([city], 20, None, 1),
+            query_cache.cacheKey([city], 10, 'token', 1),
+            query_cache.cacheKey([city], 10, None, 2),
+        ])
+        self.assertEqual(len(keys), 6)
+
+    def testPutAndGetPage(self):
+        key = query_cache.cacheKey([], 10, None, query_cache.generation())
+        before = query_cache.statsSnapshot()
+        self.assertIsNone(query_cache.getPage(key, ConferenceForms))
+        query_cache.putPage(key, ConferenceForms(
+            items=[ConferenceForm(name=u'Caf\xe9')], nextPageToken='next'))
+        page = query_cache.getPage(key, ConferenceForms)
+        self.assertEqual(page.items[0].name, u'Caf\xe9')
+        self.assertEqual(page.nextPageToken, 'next')
+        after = query_cache.statsSnapshot()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def testLargePagesAreNotCached(self):
+        key = query_cache.cacheKey([], 10, None, 1)
+        query_cache.putPage(key, ConferenceForms(items=[ConferenceForm(
+            description='x' * query_cache.QUERY_CACHE_MAX_BYTES)]))
+        self.assertIsNone(query_cache.getPage(key, ConferenceForms))
+
+    def testInvalidateStartsANewGeneration(self):
+        generation = query_cache.generation()
+        self.assertGreater(query_cache.invalidate(), generation)
+        self.assertGreater(query_cache.generation(), generation)
+
+# - - - queryConferences - - - - - - - - - - - - - - - - - - - -
+
+class QueryConferencesTest(ConferenceApiTestCase):
+
+    def query(self, city='London'):
+        return self.api.queryConferences(ConferenceQueryForms(filters=[
+            ConferenceQueryForm(field='CITY', operator='EQ', value=city)]))
+
+    def names(self, forms):
+        return [form.name for form in forms.items]
+
+    def misses(self):
+        return query_cache.statsSnapshot()['misses']
+
+    def testRepeatedQueryIsCached(self):
+        self.assertEqual(self.names(self.query()), ['Conference'])
+        misses = self.misses()
+        self.assertEqual(self.names(self.query()), ['Conference'])
+        self.assertEqual(self.misses(), misses)
+
+    def testCreateInvalidates(self):
+        self.query()
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(name='Another', city='London'))
+        self.assertEqual(sorted(self.names(self.query())), ['Another', 'Conference'])
+
+    def testUpdateInvalidates(self):
+        self.query()
+        self.signIn(ORGANIZER)
+        self.api.updateConference(CONF_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck, city='Paris'))
+        self.assertEqual(self.names(self.query()), [])
+        self.assertEqual(self.names(self.query('Paris')), ['Conference'])
+
+    def testRegistrationInvalidates(self):
+        self.assertEqual(self.query().items[0].seatsAvailable, 10)
+        self.signIn('attendee')
+        self.assertTrue(self.api.registerForConference(
+            CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=self.wsck)).data)
+        self.assertEqual(self.query().items[0].seatsAvailable, 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
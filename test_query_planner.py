@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""test_query_planner.py
+
+Tests for query_planner.py: plan choice and paging for each strategy
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+import query_planner
+from query_planner import QueryPlan
+
+CITIES = ['London', 'Paris', 'Tokyo']
+
+
+def _filter(field, op, value):
+    return {'field': field, 'operator': op, 'value': value}
+
+
+class QueryPlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.confs = [Conference(name='Conference %02d' % i, month=i % 12 + 1,
+                                 maxAttendees=(i * 37) % 500,
+                                 city=CITIES[i % len(CITIES)])
+                      for i in range(60)]
+        ndb.put_multi(self.confs)
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def expected(self, filters, primary=None):
+        """Return the conferences matching filters, in plan order."""
+        confs = [c for c in self.confs if query_planner._matches(c, filters)]
+        return sorted(confs, key=lambda c: (
+            getattr(c, primary) if primary else None, c.name))
+
+    def pages(self, filters, page_size, force=None, between_pages=None):
+        """Page through filters' results; return (entities, tokens).
+
+        force=(strategy, primary) overrides the first page's plan;
+        between_pages() runs after each page.
+        """
+        token, results, tokens = None, [], []
+        while True:
+            plan = query_planner.planQuery(Conference, filters, Conference.name, token)
+            if force and not token:
+                plan.strategy, plan.primary = force
+            page, token = plan.fetchPage(page_size, token)
+            self.assertLessEqual(len(page), page_size)
+            results.extend(page)
+            if not token:
+                return results, tokens
+            tokens.append(token)
+            if between_pages:
+                between_pages()
+
+    def assertNames(self, entities, expected):
+        self.assertEqual([e.name for e in entities], [e.name for e in expected])
+
+    # - - - SINGLE - - - - - - - - - - - - - - - - - - - - - - -
+
+    def testEqualitiesOnly(self):
+        filters = [_filter('city', '=', 'Paris')]
+        self.assertEqual(query_planner.planQuery(
+            Conference, filters, Conference.name).strategy, QueryPlan.SINGLE)
+        results, _ = self.pages(filters, 7)
+        self.assertNames(results, self.expected(filters))
+
+    def testOneInequality(self):
+        filters = [_filter('month', '>', 6), _filter('month', '<=', 10)]
+        results, _ = self.pages(filters, 7)
+        self.assertNames(results, self.expected(filters, 'month'))
+
+    def testNotEqualPagesWithCursors(self):
+        filters = [_filter('city', '!=', 'Paris')]
+        results, tokens = self.pages(filters, 7)
+        self.assertTrue(tokens)
+        self.assertEqual(sorted(e.name for e in results),
+                         sorted(e.name for e in self.expected(filters)))
+        self.assertEqual(len(set(e.key for e in results)), len(results))
+
+    # - - - FILTER and INTERSECT - - - - - - - - - - - - - - - -
+
+    MULTI = [_filter('month', '>', 3), _filter('maxAttendees', '<', 300)]
+
+    def testMultipleInequalitiesArePlanned(self):
+        plan = query_planner.planQuery(Conference, self.MULTI, Conference.name)
+        self.assertIn(plan.strategy, (QueryPlan.FILTER, QueryPlan.INTERSECT))
+        self.assertEqual(sorted(plan.estimates), ['maxAttendees', 'month'])
+
+    def testFilterPages(self):
+        results, tokens = self.pages(
+            self.MULTI, 5, force=(QueryPlan.FILTER, 'month'))
+        self.assertNames(results, self.expected(self.MULTI, 'month'))
+        self.assertTrue(all(t.startswith('f:month:') for t in tokens))
+
+    def testFilterPagesWithNotEqual(self):
+        filters = [_filter('city', '!=', 'Paris'), _filter('month', '<', 9)]
+        results, _ = self.pages(filters, 5, force=(QueryPlan.FILTER, 'city'))
+        self.assertEqual(sorted(e.name for e in results),
+                         sorted(e.name for e in self.expected(filters)))
+
+    def testIntersectPages(self):
+        results, tokens = self.pages(
+            self.MULTI, 5, force=(QueryPlan.INTERSECT, 'maxAttendees'))
+        self.assertNames(results, self.expected(self.MULTI, 'maxAttendees'))
+        self.assertTrue(all(t.startswith('o:maxAttendees:') for t in tokens))
+
+    def testIntersectPagesAreStableUnderWrites(self):
+        expected = self.expected(self.MULTI, 'month')
+
+        def write():
+            Conference(name='Conference 00 new', month=12, maxAttendees=1).put()
+
+        results, _ = self.pages(self.MULTI, 5, force=(QueryPlan.INTERSECT, 'month'),
+                                between_pages=write)
+        self.assertNames(results, expected)
+
+    def testIntersectSnapshotIsRebuilt(self):
+        results, _ = self.pages(self.MULTI, 5, force=(QueryPlan.INTERSECT, 'month'),
+                                between_pages=memcache.flush_all)
+        self.assertNames(results, self.expected(self.MULTI, 'month'))
+
+    def testIntersectChecksCappedInequalitiesInMemory(self):
+        self.patchSampleLimit(10)
+        plan = query_planner.planQuery(Conference, self.MULTI, Conference.name)
+        plan.strategy, plan.primary = QueryPlan.INTERSECT, 'month'
+        plan.estimates = {'month': 9, 'maxAttendees': 10}
+        survivors = plan._survivors()
+        self.assertTrue(survivors)
+        self.assertTrue(all(query_planner._matches(e, self.MULTI) for e in survivors))
+
+    def testIntersectNeedsABoundedInequality(self):
+        self.patchSampleLimit(5)
+        plan = query_planner.planQuery(Conference, self.MULTI, Conference.name)
+        self.assertEqual(plan.strategy, QueryPlan.FILTER)
+
+    def patchSampleLimit(self, limit):
+        saved = query_planner.SAMPLE_LIMIT
+        query_planner.SAMPLE_LIMIT = limit
+        self.addCleanup(setattr, query_planner, 'SAMPLE_LIMIT', saved)
+
+    def testTokenKeepsThePlan(self):
+        _, tokens = self.pages(self.MULTI, 5, force=(QueryPlan.INTERSECT, 'maxAttendees'))
+        plan = query_planner.planQuery(Conference, self.MULTI, Conference.name, tokens[0])
+        self.assertEqual((plan.strategy, plan.primary),
+                         (QueryPlan.INTERSECT, 'maxAttendees'))
+        self.assertEqual(plan.estimates, {})
+
+        _, tokens = self.pages(self.MULTI, 5, force=(QueryPlan.FILTER, 'month'))
+        plan = query_planner.planQuery(Conference, self.MULTI, Conference.name, tokens[0])
+        self.assertEqual((plan.strategy, plan.primary), (QueryPlan.FILTER, 'month'))
+
+    def testInvalidTokens(self):
+        plan = query_planner.planQuery(Conference, self.MULTI, Conference.name)
+        plan.strategy, plan.primary = QueryPlan.FILTER, 'month'
+        for token in ['garbage', 'o:month:abc:5', 'f:city:abc', 'f:month:a:b']:
+            self.assertRaises(query_planner.InvalidPageToken,
+                              plan.fetchPage, 5, token)
+        plan.strategy = QueryPlan.INTERSECT
+        for token in ['o:month:abc:x', 'o:month:abc:-5', 'o:month:abc']:
+            self.assertRaises(query_planner.InvalidPageToken,
+                              plan.fetchPage, 5, token)
+
+
+if __name__ == '__main__':
+    unittest.main()
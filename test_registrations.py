@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""test_registrations.py
+
+Tests for registrations.py and the registration endpoints: Registration
+children, seats, attendee lists and moving legacy registrations over
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import endpoints
+from google.appengine.ext import ndb
+from protorpc import message_types
+
+from conference import CONF_GET_REQUEST, CONF_PAGE_GET_REQUEST, PAGE_GET_REQUEST
+from models import Conference, ConferenceForm, ConflictException
+from models import Profile, Registration
+import registrations
+import seats
+from test_conference import ConferenceApiTestCase, ORGANIZER
+
+
+class RegistrationTest(ConferenceApiTestCase):
+
+    def call(self, method, user_id, wsck=None):
+        self.signIn(user_id)
+        return method(CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck or self.wsck))
+
+    def register(self, user_id, wsck=None):
+        return self.call(self.api.registerForConference, user_id, wsck).data
+
+    def unregister(self, user_id, wsck=None):
+        return self.call(self.api.unregisterFromConference, user_id, wsck).data
+
+    def seats(self):
+        return seats.getSeatsAvailable(self.conf_key.get())
+
+    def attending(self, user_id):
+        self.signIn(user_id)
+        return [form.name for form in self.api.getConferencesToAttend(
+            PAGE_GET_REQUEST.combined_message_class()).items]
+
+    def attendees(self, user_id=ORGANIZER, page_size=None, page_token=None):
+        self.signIn(user_id)
+        return self.api.getConferenceAttendees(
+            CONF_PAGE_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, pageSize=page_size,
+                pageToken=page_token))
+
+    def testRegisterAndUnregister(self):
+        self.assertTrue(self.register('ada'))
+        self.assertEqual(self.seats(), 9)
+        self.assertEqual(self.attending('ada'), ['Conference'])
+        self.signIn('ada')
+        self.assertEqual(self.api.getProfile(message_types.VoidMessage())
+                         .conferenceKeysToAttend, [self.wsck])
+        self.assertTrue(self.unregister('ada'))
+        self.assertEqual(self.seats(), 10)
+        self.assertEqual(self.attending('ada'), [])
+
+    def testRegisteringTwiceConflicts(self):
+        self.register('ada')
+        self.assertRaises(ConflictException, self.register, 'ada')
+        self.assertEqual(self.seats(), 9)
+        self.assertEqual(Registration.query().count(), 1)
+
+    def testUnregisteringWhenNotRegistered(self):
+        self.assertFalse(self.unregister('ada'))
+        self.assertEqual(self.seats(), 10)
+
+    def testNoSeatsLeft(self):
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(name='Small', maxAttendees=1))
+        wsck = Conference.query(Conference.name == 'Small').get(keys_only=True).urlsafe()
+        self.assertTrue(self.register('ada', wsck))
+        self.assertRaises(ConflictException, self.register, 'grace', wsck)
+        self.assertFalse(registrations.isRegistered(ndb.Key(Profile, 'grace'),
+                                                    ndb.Key(urlsafe=wsck)))
+
+    def testUnknownConference(self):
+        missing = ndb.Key(Conference, 12345).urlsafe()
+        self.assertRaises(endpoints.NotFoundException, self.register, 'ada', missing)
+
+    def testOnlyTheOrganizerListsAttendees(self):
+        for user_id in ['ada', 'grace', 'alan']:
+            self.register(user_id)
+        first = self.attendees(page_size=2)
+        second = self.attendees(page_size=2, page_token=first.nextPageToken)
+        self.assertEqual((len(first.items), len(second.items)), (2, 1))
+        self.assertEqual(sorted(f.displayName for f in first.items + second.items),
+                         ['ada', 'alan', 'grace'])
+        self.assertEqual(second.items[0].conferenceKeysToAttend, [])
+        self.assertRaises(endpoints.UnauthorizedException, self.attendees, 'ada')
+
+    def testLegacyRegistrationsAreMovedOnFirstUse(self):
+        Profile(key=ndb.Key(Profile, 'ada'), displayName='Ada',
+                conferenceKeysToAttend=[self.wsck, self.wsck]).put()
+        self.assertEqual(self.attending('ada'), ['Conference'])
+        self.assertEqual(ndb.Key(Profile, 'ada').get().conferenceKeysToAttend, [])
+        self.assertEqual(registrations.conferenceKeys(ndb.Key(Profile, 'ada')),
+                         [self.conf_key])
+        self.assertRaises(ConflictException, self.register, 'ada')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""test_search_index.py
+
+Tests for search_index.py and the search endpoints: documents built from
+Conferences and Sessions, paged searches and returned fields
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import endpoints
+
+from models import SearchForm, Session
+import search_index
+from test_conference import ConferenceApiTestCase
+
+
+class SearchTest(ConferenceApiTestCase):
+
+    def setUp(self):
+        super(SearchTest, self).setUp()
+        self.createSessions([
+            self.sessionForm(name='Intro to Python', speakers=['Ada Lovelace'],
+                             typeOfSession='Talk', duration=30),
+            self.sessionForm(name='Advanced Python', speakers=['Grace Hopper'],
+                             typeOfSession='Workshop', duration=90),
+            self.sessionForm(name='Closing keynote', speakers=['Ada Lovelace'],
+                             typeOfSession='Keynote'),
+        ])
+        search_index.indexEntities('Conference', [self.conf_key])
+        search_index.indexEntities('Session', Session.query().fetch(keys_only=True))
+
+    def searchSessions(self, query, **fields):
+        return self.api.searchSessions(SearchForm(query=query, **fields))
+
+    def names(self, forms):
+        return sorted(form.name for form in forms.items)
+
+    def testSearchSessions(self):
+        self.assertEqual(self.names(self.searchSessions('python')),
+                         ['Advanced Python', 'Intro to Python'])
+        self.assertEqual(self.names(self.searchSessions('speakers:Lovelace')),
+                         ['Closing keynote', 'Intro to Python'])
+        self.assertEqual(self.names(self.searchSessions('typeOfSession:Workshop')),
+                         ['Advanced Python'])
+
+    def testFormsAreBuiltFromTheDocuments(self):
+        form, = self.searchSessions('"Intro to Python"').items
+        session = Session.query(Session.name == 'Intro to Python').get()
+        self.assertEqual(form.websafeKey, session.key.urlsafe())
+        self.assertEqual((form.date, form.start_time, form.duration),
+                         ('2016-05-01', '10:00:00', 30))
+        self.assertEqual(form.speakers, ['Ada Lovelace'])
+        conf, = self.api.searchConferences(SearchForm(query='london')).items
+        self.assertEqual((conf.name, conf.startDate, conf.maxAttendees),
+                         ('Conference', '2016-05-01', 10))
+
+    def testReturnedFields(self):
+        form, = self.searchSessions('keynote', returnedFields=['name']).items
+        self.assertEqual(form.name, 'Closing keynote')
+        self.assertIsNone(form.date)
+        self.assertEqual(form.speakers, [])
+        self.assertRaises(endpoints.BadRequestException, self.searchSessions,
+                          'keynote', returnedFields=['name', 'secret'])
+
+    def testPaging(self):
+        first = self.searchSessions('speakers:Lovelace OR python', pageSize=2)
+        second = self.searchSessions('speakers:Lovelace OR python', pageSize=2,
+                                     pageToken=first.nextPageToken)
+        self.assertEqual((len(first.items), len(second.items)), (2, 1))
+        self.assertEqual(len(set(f.name for f in first.items + second.items)), 3)
+        self.assertIsNone(second.nextPageToken)
+
+    def testInvalidSearch(self):
+        self.assertRaises(endpoints.BadRequestException, self.searchSessions, 'name:(')
+        self.assertRaises(endpoints.BadRequestException, self.searchSessions,
+                          'python', pageToken='not a cursor')
+
+    def testDeletedEntitiesAreRemoved(self):
+        self.conf_key.delete()
+        search_index.indexEntities('Conference', [self.conf_key])
+        self.assertEqual(
+            self.api.searchConferences(SearchForm(query='london')).items, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
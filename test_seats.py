@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""test_seats.py
+
+Tests for seats.py: sharded seat counters and the
+Conference.seatsAvailable snapshot
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+from models import Conference
+import query_cache
+import seats
+
+
+class SeatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.conf = Conference(name='Conference', maxAttendees=50,
+                               seatsAvailable=50)
+        self.conf.put()
+        seats.setSeatsAvailable(self.conf.key, 50)
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def shardTotal(self):
+        return sum(s.seatsAvailable for s in ndb.get_multi(
+            seats._shardKeys(self.conf.key)))
+
+    def testSeatsAreSpreadOverTheShards(self):
+        shards = ndb.get_multi(seats._shardKeys(self.conf.key))
+        self.assertEqual(len(shards), seats.NUM_SEAT_SHARDS)
+        self.assertLessEqual(max(s.seatsAvailable for s in shards)
+                             - min(s.seatsAvailable for s in shards), 1)
+        self.assertEqual(self.shardTotal(), 50)
+
+    def testReserveAndRelease(self):
+        changes = []
+
+        def onChange(conf, seats_left, delta):
+            changes.append((seats_left, delta))
+
+        self.assertEqual(seats.reserveSeat(self.conf, lambda: 'ok', onChange), 'ok')
+        self.assertEqual(seats.getSeatsAvailable(self.conf), 49)
+        self.assertTrue(seats.releaseSeat(self.conf, lambda: True, onChange))
+        self.assertEqual(self.shardTotal(), 50)
+        self.assertEqual(changes, [(49, -1), (50, 1)])
+
+    def testReleaseIsSkippedWhenCallbackDeclines(self):
+        self.assertFalse(seats.releaseSeat(self.conf, lambda: False))
+        self.assertEqual(self.shardTotal(), 50)
+
+    def testFailedCallbackKeepsTheSeat(self):
+        def fail():
+            raise ValueError()
+        self.assertRaises(ValueError, seats.reserveSeat, self.conf, fail)
+        self.assertEqual(self.shardTotal(), 50)
+
+    def testNoSeatsAvailable(self):
+        seats.setSeatsAvailable(self.conf.key, 1)
+        seats.reserveSeat(self.conf, lambda: None)
+        self.assertRaises(seats.NoSeatsAvailable,
+                          seats.reserveSeat, self.conf, lambda: None)
+
+    def testUnshardedConferenceIsSharded(self):
+        conf = Conference(name='Old', maxAttendees=10, seatsAvailable=10)
+        conf.put()
+        self.assertEqual(seats.getSeatsAvailable(conf), 10)
+        seats.reserveSeat(conf, lambda: None)
+        self.assertEqual(sum(s.seatsAvailable for s in ndb.get_multi(
+            seats._shardKeys(conf.key))), 9)
+
+    def testChangeSeatsAvailableKeepsTakenSeats(self):
+        for _ in range(5):
+            seats.reserveSeat(self.conf, lambda: None)
+        # 45 left; raising the total by 10 adds 10 seats
+        self.assertEqual(seats.changeSeatsAvailable(self.conf, 55), 55)
+        self.assertEqual(seats.changeSeatsAvailable(self.conf, 20), 20)
+        self.assertEqual(self.shardTotal(), 20)
+
+    def testChangeSeatsAvailableNeverGoesBelowZero(self):
+        self.assertEqual(seats.changeSeatsAvailable(self.conf, -5), 0)
+
+    # - - - snapshot - - - - - - - - - - - - - - - - - - - - - -
+
+    def testSyncWritesTheSnapshot(self):
+        seats.reserveSeat(self.conf, lambda: None)
+        generation = query_cache.generation()
+        seats.syncSeatsAvailable(self.conf.key.urlsafe())
+        self.assertEqual(self.conf.key.get().seatsAvailable, 49)
+        self.assertNotEqual(query_cache.generation(), generation)
+
+    def testUnchangedSnapshotIsNotWritten(self):
+        generation = query_cache.generation()
+        seats.syncSeatsAvailable(self.conf.key.urlsafe())
+        self.assertEqual(query_cache.generation(), generation)
+
+    def testSyncOfDeletedConference(self):
+        key = self.conf.key
+        key.delete()
+        seats.syncSeatsAvailable(key.urlsafe())
+        self.assertFalse(seats._writeSnapshot(key, 10))
+        self.assertIsNone(key.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
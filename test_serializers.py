@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""test_serializers.py
+
+Tests for serializers.py: precompiled copy plans against the per-field
+reflection they replace
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+from protorpc import messages
+
+from benchmarks import serialization
+from models import Conference, ConferenceForm, Profile, ProfileForm
+from models import Session, SessionForm, TeeShirtSize
+import serializers
+
+
+class SerializersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def testFormsMatchReflection(self):
+        for kind, entities, reflect, planned in serialization._entities(3):
+            for entity in entities:
+                self.assertEqual(planned(entity), reflect(entity), kind)
+
+    def testConversions(self):
+        _, sessions, _, _ = serialization._entities(1)[1]
+        form = serializers.toForm(sessions[0], SessionForm)
+        self.assertEqual((form.date, form.start_time), ('2016-05-01', '10:00:00'))
+        self.assertEqual(form.websafeKey, sessions[0].key.urlsafe())
+        prof = Profile(key=ndb.Key(Profile, 'user'), displayName='User',
+                       mainEmail='user@example.com', teeShirtSize='L_M')
+        self.assertEqual(serializers.toForm(prof, ProfileForm).teeShirtSize,
+                         TeeShirtSize.L_M)
+
+    def testMissingValuesStayUnset(self):
+        conf = Conference(key=ndb.Key(Conference, 1), name='Conference')
+        form = serializers.toForm(conf, ConferenceForm, seatsAvailable=0)
+        self.assertIsNone(form.startDate)
+        self.assertEqual(form.topics, [])
+        self.assertEqual(form.seatsAvailable, 0)
+
+    def testOverridesWin(self):
+        conf = Conference(key=ndb.Key(Conference, 1), name='Conference',
+                          seatsAvailable=42)
+        self.assertEqual(serializers.toForm(
+            conf, ConferenceForm, seatsAvailable=7).seatsAvailable, 7)
+
+    def testPlansAreCached(self):
+        self.assertIs(serializers.copyPlan(Session, SessionForm),
+                      serializers.copyPlan(Session, SessionForm))
+
+    def testToForms(self):
+        self.assertEqual(serializers.toForms([], SessionForm), [])
+        _, sessions, reflect, _ = serialization._entities(2)[1]
+        self.assertEqual(serializers.toForms(sessions, SessionForm),
+                         [reflect(s) for s in sessions])
+
+    def testRequiredFieldsAreChecked(self):
+        class RequiredForm(messages.Message):
+            name = messages.StringField(1, required=True)
+
+        self.assertRaises(messages.ValidationError, serializers.toForm,
+                          Conference(key=ndb.Key(Conference, 1)), RequiredForm)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""test_speaker_tally.py
+
+Tests for speaker_tally.py: the incrementally kept featured speaker tally
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import datetime
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+from models import Conference, Session
+import speaker_tally
+
+
+class SpeakerTallyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.conf_key = Conference(name='Conference').put()
+        self.next_id = 0
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def session(self, name, *speakers):
+        self.next_id += 1
+        return Session(key=ndb.Key(Session, self.next_id, parent=self.conf_key),
+                       name=name, speakers=list(speakers),
+                       date=datetime.date(2016, 5, 1))
+
+    def featured(self):
+        return speaker_tally.featuredSpeakers(
+            speaker_tally.tallyKey(self.conf_key).get())
+
+    def testPutSessionsKeepsTheTally(self):
+        speaker_tally.putSessions(self.conf_key, [
+            self.session('Intro', 'Ada'), self.session('Deep dive', 'Ada', 'Grace')])
+        speaker_tally.putSessions(self.conf_key, [self.session('Panel', 'Grace', 'Alan')])
+        self.assertEqual(Session.query(ancestor=self.conf_key).count(), 3)
+        self.assertEqual(self.featured(),
+                         (['Ada', 'Grace'], ['Deep dive', 'Intro', 'Panel']))
+
+    def testSpeakerListedTwiceCountsOnce(self):
+        speaker_tally.putSessions(self.conf_key, [
+            self.session('Intro', 'Ada', 'Ada'), self.session('Talk', 'Grace')])
+        self.assertEqual(self.featured()[0], ['Ada', 'Grace'])
+
+    def testUpdateAndRemove(self):
+        intro = self.session('Intro', 'Ada')
+        talk = self.session('Talk', 'Ada')
+        speaker_tally.putSessions(self.conf_key, [intro, talk])
+        renamed = self.session('Talk', 'Grace')
+        renamed.key = talk.key
+        ndb.transaction(lambda: speaker_tally.updateTally(
+            self.conf_key, added=[renamed], removed=[talk]))
+        self.assertEqual(self.featured(), (['Ada', 'Grace'], ['Intro', 'Talk']))
+        ndb.transaction(lambda: speaker_tally.updateTally(
+            self.conf_key, removed=[intro]))
+        self.assertEqual(self.featured(), (['Grace'], ['Talk']))
+
+    def testRebuildMatchesTheIncrementalTally(self):
+        speaker_tally.putSessions(self.conf_key, [
+            self.session('Intro', 'Ada'), self.session('Talk', 'Ada', 'Grace')])
+        incremental = speaker_tally.tallyKey(self.conf_key).get().sessions
+        self.assertEqual(speaker_tally.rebuildTally(self.conf_key).sessions,
+                         incremental)
+
+    def testNoSessions(self):
+        self.assertEqual(self.featured(), ([], []))
+        self.assertEqual(speaker_tally.featuredSpeakers(
+            speaker_tally.rebuildTally(self.conf_key)), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
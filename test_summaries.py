@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""test_summaries.py
+
+Tests for summaries.py and the summary list endpoints: cached summary
+records and keys-only list pages
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import datetime
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.ext import ndb
+
+from conference import CONF_GET_REQUEST, CONF_POST_REQUEST, SESSION_GET_REQUEST
+from models import Conference, ConferenceQueryForms, Session
+import summaries
+from test_conference import ConferenceApiTestCase
+
+
+class SummariesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.conf = Conference(name='PyCon', city='Montreal', topics=['Python'],
+                               startDate=datetime.date(2016, 5, 1), maxAttendees=10)
+        self.session = Session(parent=self.conf.put(), name='Talk',
+                               speakers=['Ada'], date=datetime.date(2016, 5, 1),
+                               start_time=datetime.time(9, 30))
+        self.session.put()
+        self.recorder = harness.RpcRecorder().attach()
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def get(self, keys):
+        return summaries.getSummariesAsync(keys).get_result()
+
+    def testSummaryFields(self):
+        (_, conf), (_, session) = self.get([self.conf.key, self.session.key])
+        self.assertEqual(sorted(conf), sorted(summaries.SUMMARY_FIELDS['Conference']))
+        self.assertEqual((conf['name'], conf['startDate'], conf['topics']),
+                         ('PyCon', '2016-05-01', ['Python']))
+        self.assertEqual((session['date'], session['start_time']),
+                         ('2016-05-01', '09:30:00'))
+
+    def testSummariesAreCached(self):
+        self.get([self.conf.key, self.session.key])
+        self.recorder.reset()
+        self.get([self.conf.key, self.session.key])
+        self.assertEqual(self.recorder.total('datastore_v3'), 0)
+
+    def testInvalidate(self):
+        self.get([self.conf.key])
+        self.conf.name = 'PyCon 2016'
+        self.conf.put()
+        self.assertEqual(self.get([self.conf.key])[0][1]['name'], 'PyCon')
+        summaries.invalidate([self.conf.key])
+        self.assertEqual(self.get([self.conf.key])[0][1]['name'], 'PyCon 2016')
+
+    def testDeletedEntitiesAreLeftOut(self):
+        missing = ndb.Key(Conference, 'gone')
+        self.assertEqual([key for key, _ in self.get([missing, self.conf.key])],
+                         [self.conf.key])
+
+# - - - summary endpoints - - - - - - - - - - - - - - - - - - -
+
+class SummaryEndpointsTest(ConferenceApiTestCase):
+
+    def querySummaries(self):
+        return self.api.queryConferencesSummary(ConferenceQueryForms()).items
+
+    def testConferenceSummaryHasLiveSeats(self):
+        self.assertEqual(self.querySummaries()[0].seatsAvailable, 10)
+        self.signIn('attendee')
+        self.api.registerForConference(
+            CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=self.wsck))
+        self.assertEqual(self.querySummaries()[0].seatsAvailable, 9)
+
+    def testUpdateRefreshesTheSummary(self):
+        self.querySummaries()
+        self.signIn('organizer')
+        self.api.updateConference(CONF_POST_REQUEST.combined_message_class(
+            websafeConferenceKey=self.wsck, city='Paris'))
+        self.assertEqual(self.querySummaries()[0].city, 'Paris')
+
+    def testSessionSummaries(self):
+        self.createSessions([self.sessionForm(name='Talk %d' % i) for i in range(3)])
+        forms = self.api.getConferenceSessionsSummary(
+            SESSION_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=self.wsck, pageSize=2))
+        self.assertEqual(len(forms.items), 2)
+        self.assertTrue(forms.nextPageToken)
+        self.assertEqual(forms.items[0].speakers, ['Ada'])
+
+
+if __name__ == '__main__':
+    unittest.main()
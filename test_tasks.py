@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""test_tasks.py
+
+Tests for tasks.py: batched and coalesced task enqueueing
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import time
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+from google.appengine.api import taskqueue
+
+import tasks
+
+
+class TasksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tb = harness.setUpTestbed()
+        self.taskqueue = self.tb.get_stub('taskqueue')
+        self.recorder = harness.RpcRecorder().attach()
+
+    def tearDown(self):
+        self.tb.deactivate()
+
+    def queued(self, url=None):
+        return self.taskqueue.get_filtered_tasks(url=url)
+
+    def testAddOutsideABatchEnqueuesAtOnce(self):
+        tasks.add('/tasks/a', params={'x': 1})
+        self.assertEqual(len(self.queued('/tasks/a')), 1)
+
+    def testBatchIsFlushedOnReturn(self):
+        @tasks.batching
+        def handler():
+            for i in range(3):
+                tasks.add('/tasks/a', params={'i': i})
+            self.assertEqual(self.queued(), [])
+
+        handler()
+        self.assertEqual(len(self.queued('/tasks/a')), 3)
+        self.assertEqual(self.recorder.calls.get('taskqueue.BulkAdd'), 1)
+
+    def testLargeBatchesAreSplit(self):
+        @tasks.batching
+        def handler():
+            for i in range(taskqueue.MAX_TASKS_PER_ADD + 1):
+                tasks.add('/tasks/a', params={'i': i})
+
+        handler()
+        self.assertEqual(len(self.queued('/tasks/a')), taskqueue.MAX_TASKS_PER_ADD + 1)
+        self.assertEqual(self.recorder.calls.get('taskqueue.BulkAdd'), 2)
+
+    def testBatchIsFlushedWhenTheHandlerRaises(self):
+        @tasks.batching
+        def handler():
+            tasks.add('/tasks/a')
+            raise ValueError()
+
+        self.assertRaises(ValueError, handler)
+        self.assertEqual(len(self.queued('/tasks/a')), 1)
+
+    def testNestedBatchesShareTheOutermost(self):
+        @tasks.batching
+        def inner():
+            tasks.add('/tasks/a')
+
+        @tasks.batching
+        def outer():
+            inner()
+            self.assertEqual(self.queued(), [])
+            tasks.add('/tasks/b')
+
+        outer()
+        self.assertEqual(self.recorder.calls.get('taskqueue.BulkAdd'), 1)
+
+    def testNamedTasksAreCoalesced(self):
+        @tasks.batching
+        def handler():
+            tasks.add('/tasks/a', name='only-once')
+            tasks.add('/tasks/a', name='only-once')
+            tasks.add('/tasks/a', name='another')
+
+        handler()
+        self.assertEqual(len(self.queued('/tasks/a')), 2)
+        # a task already in the queue is skipped, the rest still added
+        tasks.flush([taskqueue.Task(url='/tasks/a', name='only-once'),
+                     taskqueue.Task(url='/tasks/b')])
+        self.assertEqual(len(self.queued('/tasks/a')), 2)
+        self.assertEqual(len(self.queued('/tasks/b')), 1)
+
+    def testFeaturedSpeakerTasksAreCoalescedPerWindow(self):
+        now = [1000.0]
+        self.addCleanup(setattr, time, 'time', time.time)
+        time.time = lambda: now[0]
+
+        @tasks.batching
+        def handler():
+            for _ in range(3):
+                tasks.addFeaturedSpeakerTask('conf-1')
+            tasks.addFeaturedSpeakerTask('conf-2')
+
+        handler()
+        handler()
+        self.assertEqual(len(self.queued('/tasks/set_featured_speaker')), 2)
+        now[0] += tasks.FEATURED_SPEAKER_WINDOW
+        handler()
+        self.assertEqual(len(self.queued('/tasks/set_featured_speaker')), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
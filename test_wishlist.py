@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""test_wishlist.py
+
+Tests for wishlist.py and the wishlist endpoints: WishlistEntry children,
+interest counts and moving legacy wishlists over
+
+usage: GAE_SDK=<path to google_appengine> python -m unittest discover -p 'test_*.py'
+
+$Id$
+
+"""
+
+import unittest
+
+from benchmarks import harness
+harness.fixSysPath()
+
+import endpoints
+from google.appengine.ext import ndb
+
+from conference import PAGE_GET_REQUEST, WISHLIST_INTEREST_GET_REQUEST
+from conference import WISHLIST_POST_REQUEST
+from models import Profile, Session, WishlistEntry
+from test_conference import ConferenceApiTestCase
+import wishlist
+
+
+class WishlistTest(ConferenceApiTestCase):
+
+    def setUp(self):
+        super(WishlistTest, self).setUp()
+        self.createSessions([self.sessionForm(name='Talk %d' % i) for i in range(3)])
+        self.session_keys = sorted(Session.query(ancestor=self.conf_key).fetch(
+            keys_only=True))
+        self.wssks = [k.urlsafe() for k in self.session_keys]
+
+    def call(self, method, user_id, wssk, container=WISHLIST_POST_REQUEST):
+        self.signIn(user_id)
+        return method(container.combined_message_class(websafeSessionKey=wssk))
+
+    def add(self, user_id, wssk):
+        return self.call(self.api.addSessionToWishList, user_id, wssk)
+
+    def remove(self, user_id, wssk):
+        return self.call(self.api.removeSessionInWishList, user_id, wssk)
+
+    def interest(self, wssk):
+        return self.call(self.api.getSessionInterestCount, 'anyone', wssk,
+                         WISHLIST_INTEREST_GET_REQUEST).data
+
+    def wishlistNames(self, user_id, page_size=None):
+        self.signIn(user_id)
+        return [form.name for form in self.api.getSessionsInWishList(
+            PAGE_GET_REQUEST.combined_message_class(pageSize=page_size)).items]
+
+    def testAddAndRemove(self):
+        self.add('ada', self.wssks[0])
+        form = self.add('ada', self.wssks[1])
+        self.assertEqual(form.wishlist_session_keys, [self.wssks[1], self.wssks[0]])
+        self.assertEqual(self.wishlistNames('ada'), ['Talk 1', 'Talk 0'])
+        form = self.remove('ada', self.wssks[1])
+        self.assertEqual(form.wishlist_session_keys, [self.wssks[0]])
+        self.assertRaises(endpoints.NotFoundException,
+                          self.remove, 'ada', self.wssks[1])
+
+    def testAddingTwiceKeepsOneEntry(self):
+        self.add('ada', self.wssks[0])
+        created = WishlistEntry.query().get().created
+        self.add('ada', self.wssks[0])
+        self.assertEqual(WishlistEntry.query().count(), 1)
+        self.assertEqual(WishlistEntry.query().get().created, created)
+
+    def testUnknownSession(self):
+        missing = ndb.Key(Session, 12345, parent=self.conf_key).urlsafe()
+        self.assertRaises(endpoints.NotFoundException, self.add, 'ada', missing)
+        self.assertRaises(endpoints.NotFoundException, self.interest, missing)
+
+    def testInterestCount(self):
+        for user_id in ['ada', 'grace', 'alan']:
+            self.add(user_id, self.wssks[0])
+        self.add('ada', self.wssks[1])
+        self.remove('alan', self.wssks[0])
+        self.assertEqual([self.interest(wssk) for wssk in self.wssks], [2, 1, 0])
+
+    def testProfileListsTheLatestEntries(self):
+        self.addCleanup(setattr, wishlist, 'PROFILE_WISHLIST_LIMIT',
+                        wishlist.PROFILE_WISHLIST_LIMIT)
+        wishlist.PROFILE_WISHLIST_LIMIT = 2
+        for wssk in self.wssks:
+            form = self.add('ada', wssk)
+        self.assertEqual(form.wishlist_session_keys, self.wssks[:0:-1])
+        self.assertEqual(len(self.wishlistNames('ada')), 3)
+
+    def testWishlistIsPaged(self):
+        for wssk in self.wssks:
+            self.add('ada', wssk)
+        self.signIn('ada')
+        request = PAGE_GET_REQUEST.combined_message_class(pageSize=2)
+        first = self.api.getSessionsInWishList(request)
+        self.signIn('ada')
+        request.pageToken = first.nextPageToken
+        second = self.api.getSessionsInWishList(request)
+        self.assertEqual([f.name for f in first.items + second.items],
+                         ['Talk 2', 'Talk 1', 'Talk 0'])
+        self.assertIsNone(second.nextPageToken)
+
+    def testLegacyWishlistIsMovedOnFirstUse(self):
+        Profile(key=ndb.Key(Profile, 'ada'), displayName='Ada',
+                wishlist_session_keys=self.wssks[:2] + self.wssks[:1]).put()
+        self.assertEqual(sorted(self.wishlistNames('ada')), ['Talk 0', 'Talk 1'])
+        self.assertEqual(ndb.Key(Profile, 'ada').get().wishlist_session_keys, [])
+        self.assertEqual(self.interest(self.wssks[0]), 1)
+
+    def testMigrateWithoutALegacyWishlist(self):
+        self.assertIsNone(wishlist.migrate(ndb.Key(Profile, 'nobody')))
+        prof_key = Profile(key=ndb.Key(Profile, 'ada'), displayName='Ada').put()
+        self.assertEqual(wishlist.migrate(prof_key).displayName, 'Ada')
+        self.assertEqual(wishlist.sessionKeys(prof_key), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""versions.py
+
+Udacity conference server-side Python App Engine cache versions; a
+    memcached version per (namespace, key), bumped on every write to what
+    it covers, so anything cached under an older version is simply never
+    read again
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+import datetime
+import time
+
+from google.appengine.api import memcache
+
+MEMCACHE_VERSION_PREFIX = 'VERSION_'
+BUMP_RETRIES = 5
+
+# namespaces; keys are websafe conference keys unless noted
+# - sessions: a conference's sessions (schedule exports)
+# - conference: anything getConference, getConferenceSessions or
+#   getFeaturedSpeaker return for a conference (ETags)
+# - announcement: the announcement, under the key ANNOUNCEMENT_KEY
+# - conferences: every conference at once (the query cache's
+#   generation), under the key CONFERENCES_KEY
+SESSIONS = 'sessions'
+CONFERENCE = 'conference'
+ANNOUNCEMENT = 'announcement'
+ANNOUNCEMENT_KEY = 'all'
+CONFERENCES = 'conferences'
+CONFERENCES_KEY = 'all'
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _cacheKey(namespace, key):
+    return '%s%s_%s' % (MEMCACHE_VERSION_PREFIX, namespace, key)
+
+
+def _now():
+    return int(time.time() * 1000000)
+
+
+def get(namespace, key):
+    """Return the current version of key in namespace.
+
+    Versions are microsecond timestamps of the last write, so a version
+    lost from memcache comes back newer than anything cached under it.
+    """
+    cache_key = _cacheKey(namespace, key)
+    version = memcache.get(cache_key)
+    if version is None:
+        version = _now()
+        if not memcache.add(cache_key, version):
+            version = memcache.get(cache_key) or version
+    return version
+
+
+def bump(namespace, key):
+    """Move key in namespace to a new version, always greater than the
+    current one, and return it."""
+    cache_key = _cacheKey(namespace, key)
+    client = memcache.Client()
+    for _ in range(BUMP_RETRIES):
+        current = client.gets(cache_key)
+        version = max(_now(), (current or 0) + 1)
+        if current is None:
+            if client.add(cache_key, version):
+                return version
+        elif client.cas(cache_key, version):
+            return version
+    # lost every race: others bumped it since this write, which is as good
+    return get(namespace, key)
+
+
+def lastModified(version):
+    """Return the (UTC, whole second) time a version was written."""
+    return datetime.datetime.utcfromtimestamp(version // 1000000)
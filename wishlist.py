@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""wishlist.py
+
+Udacity conference server-side Python App Engine session wishlists;
+    one WishlistEntry child of the Profile per saved Session, replacing
+    the Profile's repeated wishlist_session_keys property
+
+$Id$
+
+created/forked from conference.py
+
+"""
+
+from google.appengine.ext import ndb
+
+from models import WishlistEntry
+
+# most wishlist entries listed on a ProfileForm; the full wishlist is
+# paged through getSessionsInWishlist
+PROFILE_WISHLIST_LIMIT = 100
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def entryKey(profile_key, session_key):
+    return ndb.Key(WishlistEntry, session_key.urlsafe(), parent=profile_key)
+
+
+def sessionKey(entry_key):
+    """Return the Session key an entry key stands for; no read needed."""
+    return ndb.Key(urlsafe=entry_key.id())
+
+
+def query(profile_key):
+    """Return the query over a user's entries, most recently added first."""
+    return WishlistEntry.query(ancestor=profile_key).order(-WishlistEntry.created)
+
+
+def sessionKeys(profile_key, limit=None):
+    """Return the keys of the Sessions on a user's wishlist, most recently
+    added first, up to limit (keys-only)."""
+    return [sessionKey(k) for k in
+            query(profile_key).fetch(limit, keys_only=True)]
+
+
+def add(profile_key, session_key):
+    """Put session on the wishlist; adding it again changes nothing else."""
+    key = entryKey(profile_key, session_key)
+    WishlistEntry.get_or_insert(key.id(), parent=profile_key,
+                                session=session_key)
+
+
+def remove(profile_key, session_key):
+    """Take session off the wishlist; return False if it was not on it."""
+    key = entryKey(profile_key, session_key)
+    if not key.get():
+        return False
+    key.delete()
+    return True
+
+
+def interestCount(session_key):
+    """Return how many users have session on their wishlist."""
+    return WishlistEntry.query(WishlistEntry.session == session_key).count()
+
+
+@ndb.transactional_tasklet
+def migrateAsync(profile_key):
+    """Move a Profile's legacy wishlist_session_keys into WishlistEntry
+    children; entries and Profile share an entity group, so this is one
+    transaction. Returns (a future for) the Profile as written."""
+    prof = yield profile_key.get_async()
+    if prof and prof.wishlist_session_keys:
+        entries = [WishlistEntry(key=ndb.Key(WishlistEntry, wssk, parent=profile_key),
+                                 session=ndb.Key(urlsafe=wssk))
+                   for wssk in set(prof.wishlist_session_keys)]
+        prof.wishlist_session_keys = []
+        yield ndb.put_multi_async(entries + [prof])
+    raise ndb.Return(prof)
+
+
+def migrate(profile_key):
+    return migrateAsync(profile_key).get_result()